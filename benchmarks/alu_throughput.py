@@ -0,0 +1,81 @@
+"""
+ALU microbenchmark: string-dispatch ALU (before) vs the op-id table in machine/alu.py (after).
+
+Usage: python -m benchmarks.alu_throughput [iterations]
+"""
+
+import sys
+
+from benchmarks.timing import best_of
+from machine.alu import ALU
+
+# Operation mix of the microcode ALU stage while running algorithms/sort.asm
+OP_MIX: list[tuple[str, int, int]] = [
+    ("add", 768, 40),
+    ("addi", 12, -1),
+    ("sub", 23, 128),
+    ("mul", 7, 2),
+    ("branch_offset", 0x140, -24),
+    ("jal_link", 0x150, 4),
+    ("jal_offset", 0x150, -64),
+    ("lui", 0, 0),
+]
+
+
+def legacy_exec(op: str, a: int, b: int) -> int:
+    """The string-dispatch ALU.exec this repository used before the op-id table."""
+    if op in {"add", "addi"}:
+        return a + b
+    if op in {"sub"}:
+        return a - b
+    if op in {"mul"}:
+        return a * b
+    if op in {"div"}:
+        return a // b if b != 0 else 0
+    if op in {"and", "andi"}:
+        return a & b
+    if op in {"or", "ori"}:
+        return a | b
+    if op in {"xor", "xori"}:
+        return a ^ b
+    if op in {"lsl"}:
+        return a << b
+    if op in {"lsr"}:
+        return a >> b
+    if op == "lui":
+        return b << 12
+    if op == "jal_link":  # PC + 4
+        return a + b
+    if op == "jal_offset":  # PC + offset
+        return a + b
+    if op == "branch_offset":
+        return a + b  # a = pc, b = imm
+    return 0
+
+
+def run_legacy(iterations: int) -> None:
+    for _ in range(iterations):
+        for op, a, b in OP_MIX:
+            legacy_exec(op, a, b)
+
+
+def run_table(alu: ALU, iterations: int) -> None:
+    mix: list[tuple[int, int, int]] = [(alu.op_id(op), a, b) for op, a, b in OP_MIX]
+    table = alu.table
+    for _ in range(iterations):
+        for op_id, a, b in mix:
+            table[op_id](a, b)
+
+
+def main(iterations: int, repeat: int = 5) -> None:
+    ops: int = iterations * len(OP_MIX)
+    alu = ALU()
+    legacy, table = best_of(
+        [lambda: run_legacy(iterations), lambda: run_table(alu, iterations)], repeat
+    )
+    print(f"string dispatch: {ops / legacy:>14,.0f} ops/s")
+    print(f"op-id table:     {ops / table:>14,.0f} ops/s  ({legacy / table:.2f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
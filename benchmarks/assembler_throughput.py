@@ -0,0 +1,156 @@
+"""
+Assembler benchmark: the two-pass translator (before) vs the one-pass `Assembler` in
+machine/translator.py (after), on a large generated source.
+
+Usage: python -m benchmarks.assembler_throughput [blocks]
+"""
+
+import codecs
+import sys
+
+from benchmarks.timing import best_of
+from machine.image import Image
+from machine.translator import assemble, encode, expand_macros, get_token
+
+
+def synthetic_source(blocks: int) -> str:
+    """
+    `blocks` copies of a loop body with data, backward and forward branches, calls
+    and high()/low() address loads: 12 text and 3 data lines per block.
+    """
+    data: list[str] = [".data", "out_addr: .word 0x2"]
+    text: list[str] = [".text", ".org 0x100"]
+    for i in range(blocks):
+        data += [f"value_{i}: .word {i}", f"ptr_{i}: .word value_{i}", f"msg_{i}: .byte 'b{i}\\0'"]
+        text += [
+            f"block_{i}:",
+            f"    lui t0, high(value_{i})",
+            f"    addi t0, t0, low(value_{i})",
+            "    lw t1, 0(t0)",
+            "    addi t1, t1, 1",
+            "    sw t1, 0(t0)",
+            f"    beq t1, zero, skip_{i}  # forward",
+            "    mul t2, t1, t1",
+            f"    bgt t2, t1, block_{i}  # backward",
+            f"skip_{i}: sb t1, 0(t0)",
+            f"    jal ra, next_{i}",
+            f"next_{i}: add a0, a0, t1",
+        ]
+    text.append("    halt")
+    return "\n".join(data + text)
+
+
+def legacy_first_pass(lines):
+    """The labels and the lines of both segments, collected like the old `first_pass`."""
+    addr_of_instr = 0
+    label_map = {}
+    section = None
+    org = {".text": 0x0, ".data": 0x0}
+    data_segment = []
+    text_segment = []
+
+    for line in lines:
+        line = line.split("#")[0].strip()
+        if not line:
+            continue
+        if line.startswith(".org"):
+            _, addr = line.split()
+            addr_of_instr = int(addr, 0)
+            if section:
+                org[section] = addr_of_instr
+            continue
+        if line in [".text", ".data"]:
+            section = line
+            addr_of_instr = org[section]
+            continue
+        if ":" in line:
+            label, rest = line.split(":", 1)
+            label_map[label.strip()] = addr_of_instr
+            line = rest.strip()
+            if not line:
+                continue
+
+        if section == ".data":
+            if line.startswith(".word"):
+                _, val_str = line.split(None, 1)
+                data_segment.append((addr_of_instr, line, 0))
+                addr_of_instr += 4
+            elif line.startswith(".byte"):
+                _, val_str = line.split(None, 1)
+                val_str = val_str.strip().strip("'\"")
+                for c in codecs.decode(val_str.encode("utf-8"), "unicode_escape"):
+                    data_segment.append((addr_of_instr, f".byte {ord(c)}", ord(c)))
+                    addr_of_instr += 1
+        elif section == ".text":
+            text_segment.append((addr_of_instr, line))
+            addr_of_instr += 4
+
+    return label_map, data_segment, text_segment
+
+
+def legacy_second_pass(segment_instructions, label_map):
+    """Encodes a segment collected by `legacy_first_pass`, like the old `second_pass`."""
+    code = []
+    debug_info = []
+    for item in segment_instructions:
+        addr_of_instr, line = item[0], item[1]
+        if len(item) == 3:
+            if line.startswith(".word"):
+                value = get_token(line.split()[1].strip(), label_map)
+            else:
+                value = item[2] & 0xFF
+        else:
+            parts = line.strip().split()
+            value = encode((parts[0], parts[1:]), label_map, addr_of_instr)
+        code.append(value)
+        debug_info.append((addr_of_instr, line, value))
+    return code, debug_info
+
+
+def legacy_to_hex(debug_info):
+    """The listing as `to_hex` formatted it, every word anew."""
+    result = []
+    for addr, mnemonic, word in debug_info:
+        hex_word = f"{word:08X}"
+        bin_word = f"{word:032b}"
+        result.append(f"{addr:08X}(int {addr}) - {hex_word} - {bin_word} - {mnemonic}")
+    return "\n".join(result)
+
+
+def legacy_assemble(source: str) -> Image:
+    label_map, data_segment, text_segment = legacy_first_pass(expand_macros(source.splitlines()))
+    data_code, data_debug = legacy_second_pass(data_segment, label_map)
+    text_code, text_debug = legacy_second_pass(text_segment, label_map)
+    data = bytearray()
+    for (_, line, _), value in zip(data_debug, data_code, strict=True):
+        data += value.to_bytes(4, "little") if line.startswith(".word") else bytes([value])
+    return Image(
+        text=b"".join(instr.to_bytes(4, "little") for instr in text_code),
+        data=bytes(data),
+        entry=text_segment[0][0],
+        text_log=legacy_to_hex(text_debug),
+        data_log=legacy_to_hex(data_debug),
+    )
+
+
+def main(blocks: int, repeat: int = 10) -> None:
+    source: str = synthetic_source(blocks)
+    lines: int = source.count("\n") + 1
+    new, old = assemble(source), legacy_assemble(source)
+    # the two-pass translator wrote no symbol table: compare everything else
+    assert (new.text, new.data, new.entry, new.text_log, new.data_log) == (
+        old.text,
+        old.data,
+        old.entry,
+        old.text_log,
+        old.data_log,
+    ), "the assemblers disagree"
+
+    legacy, one_pass = best_of([lambda: legacy_assemble(source), lambda: assemble(source)], repeat)
+    print(f"{lines:,} lines")
+    print(f"two-pass: {lines / legacy:>12,.0f} lines/s")
+    print(f"one-pass: {lines / one_pass:>12,.0f} lines/s  ({legacy / one_pass:.2f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000)
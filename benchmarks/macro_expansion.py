@@ -0,0 +1,92 @@
+"""
+Macro benchmark: the regex-per-line `expand_macros` (before) vs the templates compiled
+at definition in machine/translator.py (after), on a source using a macro many times.
+
+Usage: python -m benchmarks.macro_expansion [uses]
+"""
+
+import re
+import sys
+
+from benchmarks.timing import best_of
+from machine.translator import expand_macros
+
+MACROS: list[str] = [
+    ".macro load_addr reg, label",
+    "    lui \\reg, high(\\label)",
+    "    addi \\reg, \\reg, low(\\label)",
+    "    lw \\reg, 0(\\reg)",
+    ".endmacro",
+    ".macro store_sum dst, a, b, addr",
+    "    add \\dst, \\a, \\b",
+    "    sw \\dst, 0(\\addr)",
+    ".endmacro",
+]
+
+
+def macro_source(uses: int) -> list[str]:
+    """The macros of macro_showcase.asm and friends, each used `uses` times."""
+    lines: list[str] = [".data", "out_addr: .word 0x2", ".text", ".org 0x100", *MACROS]
+    for _ in range(uses):
+        lines += ["    load_addr t2, out_addr", "    store_sum t0, t1, t0, t2"]
+    lines.append("    halt")
+    return lines
+
+
+def legacy_expand_macros(lines: list[str]) -> list[str]:
+    """`expand_macros` as it was: a re.sub with a new closure for every body line."""
+    macros = {}
+    expanded = []
+    in_macro = False
+    macro_name = ""
+    macro_args = []
+    macro_body: list[str] = []
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith(".macro"):
+            parts = stripped.split()
+            macro_name = parts[1]
+            macro_args = [a.strip(",") for a in parts[2:]]
+            in_macro = True
+            macro_body = []
+        elif stripped == ".endmacro":
+            macros[macro_name] = (macro_args, macro_body)
+            in_macro = False
+        elif in_macro:
+            macro_body.append(line)
+        else:
+            tokens = stripped.split()
+            if tokens and tokens[0] in macros:
+                actual_args = [a.strip(",") for a in tokens[1:]]
+                formal_args, body = macros[tokens[0]]
+                arg_map = dict(zip(formal_args, actual_args, strict=False))
+                for body_line in body:
+
+                    def replacer(match, arg_map=arg_map):
+                        return arg_map[match.group(1)]
+
+                    expanded.append(re.sub(r"\\(\w+)", replacer, body_line))
+            else:
+                expanded.append(line)
+
+    return expanded
+
+
+def main(uses: int, repeat: int = 5) -> None:
+    lines: list[str] = macro_source(uses)
+    assert expand_macros(lines) == legacy_expand_macros(lines), "the expansions disagree"
+
+    legacy, templates = best_of(
+        [lambda: legacy_expand_macros(lines), lambda: expand_macros(lines)], repeat
+    )
+    expansions: int = 2 * uses
+    print(f"{expansions:,} expansions")
+    print(f"re.sub per line: {expansions / legacy:>12,.0f} expansions/s")
+    print(
+        f"templates:       {expansions / templates:>12,.0f} expansions/s  ({legacy / templates:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
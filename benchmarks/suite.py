@@ -0,0 +1,266 @@
+"""
+Simulator throughput across engines and programs, with regression checks.
+
+Every program in algorithms/ and non_algos/ is assembled once and run on every engine,
+the microcode engine with the trace off and on (the other engines write no trace).
+Programs that read input get a generated one, scaled with `--scale`: sort.asm sorts
+300 words by default, cat.asm copies 10 000 bytes, and so on. The others run with the
+input file next to them, if any. For every run the suite reports wall time (best of
+`--repeat`), ticks/s, instructions/s and the peak of Python allocations (measured in
+an extra, untimed run), as a table and as JSON (`--output`). With `--baseline`, the
+results are compared with an earlier `--output` file: a throughput more than
+`--threshold` (default 10%) below the baseline's, or a different tick count, is a
+regression and makes the suite exit with status 1.
+
+Usage: python -m benchmarks.suite [--scale=F] [--repeat=N] [--programs=sort,cat]
+       [--engines=microcode,fast,jit] [--output=FILE] [--baseline=FILE] [--threshold=F]
+"""
+
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+
+from benchmarks.timing import timed
+from machine.api import ENGINES, Input, load, run_engine
+from machine.image import Image
+from machine.machine import DATA_MEMORY_SIZE
+from machine.translator import assemble
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROGRAM_DIRS = ("algorithms", "non_algos")
+MAX_TICKS = sys.maxsize  # run every program to its halt
+MIN_SAMPLE_SECONDS = 0.05
+
+
+def words(count: int) -> str:
+    rng = random.Random(count)  # the same input for the same size, run after run
+    return "".join(f"{rng.randint(1, 1_000_000)}\n" for _ in range(count))
+
+
+def text(count: int) -> str:
+    return ("the quick brown fox jumps over the lazy dog\n" * (count // 44 + 1))[:count]
+
+
+# Programs whose input scales: program -> (input for a size, input mode, default size)
+SCALED_INPUTS: dict[str, tuple[Callable[[int], Input], str, int]] = {
+    "sort": (words, "words", 300),  # bubble sort: ticks grow with size squared
+    "euler_problem": (lambda n: f"{n}\n", "words", 10_000),  # at most 46340
+    "cat": (text, "bytes", 10_000),
+    "hello_user_name": (lambda n: "x" * n, "bytes", 1_000),
+}
+
+
+@dataclass(slots=True)
+class Workload:
+    program: str
+    image: Image
+    input: Input | None
+    input_mode: str
+    size: int | None  # of the generated input, None for the program's own input file
+
+
+@dataclass(slots=True)
+class Result:
+    name: str  # program/engine/trace, what baselines are matched on
+    program: str
+    engine: str
+    trace: str
+    size: int | None
+    halted: bool
+    ticks: int
+    instructions: int
+    wall_seconds: float
+    ticks_per_second: float
+    instructions_per_second: float
+    peak_kib: float
+
+
+def workloads(programs: list[str] | None = None, scale: float = 1.0) -> list[Workload]:
+    """The programs to run (all by default), assembled, with their inputs."""
+    found: list[Workload] = []
+    for directory in PROGRAM_DIRS:
+        for file_name in sorted(os.listdir(os.path.join(ROOT, directory))):
+            program, extension = os.path.splitext(file_name)
+            if extension != ".asm" or (programs is not None and program not in programs):
+                continue
+            with open(os.path.join(ROOT, directory, file_name), encoding="utf-8") as f:
+                image: Image = assemble(f.read())
+
+            if program in SCALED_INPUTS:
+                make_input, input_mode, default_size = SCALED_INPUTS[program]
+                size: int = max(1, round(default_size * scale))
+                found.append(Workload(program, image, make_input(size), input_mode, size))
+                continue
+            input_path: str = os.path.join(ROOT, directory, f"{program}_input.txt")
+            data: bytes | None = None
+            if os.path.exists(input_path):
+                with open(input_path, "rb") as f:
+                    data = f.read()
+            found.append(Workload(program, image, data, "bytes", None))
+    return found
+
+
+def run_once(
+    workload: Workload, engine: str, trace: str, log_dir: str
+) -> tuple[float, int, int, bool]:
+    """One run from a fresh CPU: (wall seconds, ticks, instructions, halted)."""
+    size: int = workload.size or 0
+    cpu = load(
+        workload.image,
+        workload.input,
+        workload.input_mode,
+        trace_level=trace,
+        log_dir=log_dir,
+        data_size=max(DATA_MEMORY_SIZE, 0x1000 + 4 * size),  # room for sort's array
+    )
+
+    def run() -> None:
+        run_engine(cpu, engine, MAX_TICKS)
+        cpu.logger.finish()  # writing out the trace is part of tracing
+
+    seconds: float = timed(run)
+    return seconds, cpu.ticks, cpu.perf.instructions, not cpu.running
+
+
+def measure(workload: Workload, engine: str, trace: str, repeat: int) -> Result:
+    with tempfile.TemporaryDirectory() as log_dir:
+        tracemalloc.start()
+        try:
+            run_once(workload, engine, trace, log_dir)  # also warms up caches
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        seconds, ticks, instructions, halted = run_once(workload, engine, trace, log_dir)
+        # short programs are run several times per sample, like timeit's autorange
+        rounds: int = max(1, math.ceil(MIN_SAMPLE_SECONDS / max(seconds, 1e-9)))
+        for _ in range(repeat):
+            sample: float = sum(
+                run_once(workload, engine, trace, log_dir)[0] for _ in range(rounds)
+            )
+            seconds = min(seconds, sample / rounds)
+    return Result(
+        name=f"{workload.program}/{engine}/{trace}",
+        program=workload.program,
+        engine=engine,
+        trace=trace,
+        size=workload.size,
+        halted=halted,
+        ticks=ticks,
+        instructions=instructions,
+        wall_seconds=seconds,
+        ticks_per_second=ticks / seconds,
+        instructions_per_second=instructions / seconds,
+        peak_kib=peak / 1024,
+    )
+
+
+def run_suite(
+    programs: list[str] | None = None,
+    engines: tuple[str, ...] = ENGINES,
+    scale: float = 1.0,
+    repeat: int = 3,
+) -> list[Result]:
+    results: list[Result] = []
+    for workload in workloads(programs, scale):
+        for engine in engines:
+            # only the microcode engine writes traces
+            for trace in ("off", "instruction") if engine == "microcode" else ("off",):
+                results.append(measure(workload, engine, trace, repeat))
+    return results
+
+
+def compare(results: list[Result], baseline: dict, threshold: float = 0.1) -> list[str]:
+    """The regressions of `results` against a baseline report (see `report`)."""
+    previous: dict[str, dict] = {result["name"]: result for result in baseline["results"]}
+    regressions: list[str] = []
+    for result in results:
+        before = previous.get(result.name)
+        if before is None or before["size"] != result.size:
+            continue  # nothing comparable
+        if before["ticks"] != result.ticks:
+            regressions.append(f"{result.name}: {result.ticks} ticks, was {before['ticks']}")
+        ratio: float = result.ticks_per_second / before["ticks_per_second"]
+        if ratio < 1 - threshold:
+            regressions.append(
+                f"{result.name}: {result.ticks_per_second:,.0f} ticks/s, "
+                f"was {before['ticks_per_second']:,.0f} ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def report(results: list[Result]) -> dict:
+    """The results as a JSON-serializable dict, with the environment they come from."""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "results": [asdict(result) for result in results],
+    }
+
+
+def print_table(results: list[Result]) -> None:
+    print(
+        f"{'benchmark':<36} {'ticks':>11} {'wall':>10} {'ticks/s':>12} {'instr/s':>12} {'peak':>10}"
+    )
+    for r in results:
+        print(
+            f"{r.name:<36} {r.ticks:>11} {r.wall_seconds * 1000:>8.2f}ms {r.ticks_per_second:>12,.0f} "
+            f"{r.instructions_per_second:>12,.0f} {r.peak_kib:>7,.0f}KiB"
+            + ("" if r.halted else "  (did not halt)")
+        )
+
+
+def main(argv: list[str]) -> int:
+    options: dict[str, str] = {}
+    for arg in argv:
+        name, _, value = arg.removeprefix("--").partition("=")
+        if not arg.startswith("--") or name not in (
+            "scale",
+            "repeat",
+            "programs",
+            "engines",
+            "output",
+            "baseline",
+            "threshold",
+        ):
+            print(f"Error: unknown option {arg}")
+            return 2
+        options[name] = value
+
+    engines = tuple(options["engines"].split(",")) if "engines" in options else ENGINES
+    if any(engine not in ENGINES for engine in engines):
+        print(f"Error: --engines must be some of {', '.join(ENGINES)}")
+        return 2
+    results: list[Result] = run_suite(
+        options["programs"].split(",") if "programs" in options else None,
+        engines,
+        float(options.get("scale", 1.0)),
+        int(options.get("repeat", 3)),
+    )
+    print_table(results)
+
+    if "output" in options:
+        with open(options["output"], "w", encoding="utf-8") as f:
+            json.dump(report(results), f, indent=2)
+            f.write("\n")
+    if "baseline" in options:
+        with open(options["baseline"], encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, float(options.get("threshold", 0.1)))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,29 @@
+"""Wall-clock timing shared by the benchmarks."""
+
+import gc
+import time
+from collections.abc import Callable
+
+
+def timed(fn: Callable[[], object]) -> float:
+    """Seconds `fn()` takes, with the garbage collector off as in timeit."""
+    gc.collect()
+    gc.disable()  # collections caused by earlier runs stay out of the measurement
+    try:
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def best_of(fns: list[Callable[[], object]], repeat: int) -> list[float]:
+    """
+    The best `timed` seconds of each of `fns` over `repeat` rounds, in which the
+    functions take turns so that changes in machine load hit all of them.
+    """
+    best: list[float] = [float("inf")] * len(fns)
+    for _ in range(repeat):
+        for i, fn in enumerate(fns):
+            best[i] = min(best[i], timed(fn))
+    return best
@@ -0,0 +1,112 @@
+"""Arithmetic logic unit of RISCroll."""
+
+from collections.abc import Callable
+
+Operation = Callable[[int, int], int]
+
+
+def to_signed32(value: int) -> int:
+    """Wraps an integer to the signed 32-bit range, the way a 32-bit register holds it."""
+    return ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+def wrap32(value: int) -> int:
+    # cheap range check first: almost every result already fits
+    return value if -0x80000000 <= value <= 0x7FFFFFFF else to_signed32(value)
+
+
+def op_add(a: int, b: int) -> int:
+    r: int = a + b
+    return r if -0x80000000 <= r <= 0x7FFFFFFF else to_signed32(r)
+
+
+def op_sub(a: int, b: int) -> int:
+    r: int = a - b
+    return r if -0x80000000 <= r <= 0x7FFFFFFF else to_signed32(r)
+
+
+def op_mul(a: int, b: int) -> int:
+    r: int = a * b
+    return r if -0x80000000 <= r <= 0x7FFFFFFF else to_signed32(r)
+
+
+def op_div(a: int, b: int) -> int:
+    return wrap32(a // b) if b != 0 else 0
+
+
+# bitwise ops of two 32-bit values are already 32-bit
+def op_and(a: int, b: int) -> int:
+    return a & b
+
+
+def op_or(a: int, b: int) -> int:
+    return a | b
+
+
+def op_xor(a: int, b: int) -> int:
+    return a ^ b
+
+
+# shift amounts use the low 5 bits of `b`, as in RISC-V
+def op_lsl(a: int, b: int) -> int:
+    return to_signed32(a << (b & 0x1F))
+
+
+def op_lsr(a: int, b: int) -> int:
+    return to_signed32((a & 0xFFFFFFFF) >> (b & 0x1F))  # logical shift
+
+
+def op_lui(a: int, b: int) -> int:
+    return to_signed32(b << 12)
+
+
+# Every result wraps to 32 bits (two's complement), so registers and ALU_OUT always hold
+# values in [-2^31, 2^31).
+OPERATIONS: dict[str, Operation] = {
+    "add": op_add,
+    "addi": op_add,
+    "sub": op_sub,
+    "mul": op_mul,
+    "div": op_div,
+    "and": op_and,
+    "andi": op_and,
+    "or": op_or,
+    "ori": op_or,
+    "xor": op_xor,
+    "xori": op_xor,
+    "lsl": op_lsl,
+    "lsr": op_lsr,
+    "lui": op_lui,
+    "jal_link": op_add,  # PC + 4
+    "jal_offset": op_add,  # PC + offset
+    "branch_offset": op_add,  # a = pc, b = imm
+}
+
+
+def unknown_operation(a: int, b: int) -> int:
+    return 0
+
+
+class ALU:
+    """
+    Table-driven ALU.
+
+    Operations get small integer ids the first time the microcode asks for them (see
+    `MicrocodeROM`), and executing one is a single list index instead of a chain of
+    name comparisons.
+    """
+
+    def __init__(self) -> None:
+        self.op_ids: dict[str, int] = {}
+        self.table: list[Operation] = []
+
+    def op_id(self, op: str) -> int:
+        """Returns the id of operation `op`, assigning the next free one on first use."""
+        op_id: int | None = self.op_ids.get(op)
+        if op_id is None:
+            op_id = self.op_ids[op] = len(self.table)
+            self.table.append(OPERATIONS.get(op, unknown_operation))
+        return op_id
+
+    def exec(self, op_id: int, a: int, b: int) -> int:
+        return self.table[op_id](a, b)
@@ -0,0 +1,343 @@
+"""
+In-process API: assemble and run programs without files or subprocesses.
+
+    from machine.api import execute
+
+    result = execute(source, input="3\n1\n2\n", input_mode="words", engine="jit")
+    print(result.output, result.ticks)
+
+`run_until` runs a loaded CPU under a `Budget` of ticks, instructions and seconds, or
+until it reaches a PC or prints matching output, and says why it stopped:
+
+    status = run_until(cpu, "jit", Budget(ticks=None, seconds=5), output_pattern="Error")
+    if not status.halted:
+        print(status.describe())
+
+Writing binaries, traces and snapshots is left to the callers that want them
+(`Image.write`, `run_machine.py`).
+"""
+
+from __future__ import annotations
+
+import io
+import re
+import sys
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+from machine.assembly_cache import AssemblyCache
+from machine.devices import read_bytes, read_words
+from machine.fast_engine import FastEngine
+from machine.image import Image
+from machine.jit import JitEngine
+from machine.machine import CPU
+from machine.memory import MemoryFault
+from machine.microcode import IllegalInstruction
+from machine.translator import assemble
+
+ENGINES = ("microcode", "fast", "jit")
+DEFAULT_MAX_TICKS = 100_000
+
+# Why a run stopped (ExitStatus.reason)
+HALTED = "halted"
+BUDGET = "budget"  # a limit of the Budget ran out
+STOP_PC = "stop_pc"  # the next instruction is at a PC to stop at
+OUTPUT = "output"  # the output matched the pattern to stop at
+FAULT = "fault"  # a MemoryFault or an IllegalInstruction
+
+MIN_INSTRUCTION_TICKS = 3  # FETCH, DECODE and at least one microinstruction
+TIME_CHECK_TICKS = 10_000  # how often a time budget is checked
+OUTPUT_WINDOW = 256  # characters of output an output pattern is searched in
+
+# Program input: raw bytes or text (fed byte by byte, or parsed one number per line in
+# "words" mode), or the input values themselves
+Input = bytes | str | Iterable[int]
+
+
+@dataclass(slots=True)
+class ExecutionResult:
+    output: str  # rendered like the [Output buffer] section of the snapshot
+    values: list[int | str]  # output values: characters (sb) and numbers (sw)
+    registers: list[int]
+    ticks: int
+    halted: bool  # False if the run stopped before halt (see `status`)
+    cpu: CPU
+    status: ExitStatus
+
+
+@dataclass(slots=True)
+class Budget:
+    """Limits of one run, counted from where it starts; None for no limit."""
+
+    ticks: int | None = DEFAULT_MAX_TICKS  # the run stops once more ticks have been spent
+    instructions: int | None = None  # the run stops after this many instructions
+    seconds: float | None = None  # wall-clock time, checked every TIME_CHECK_TICKS ticks
+
+
+@dataclass(slots=True)
+class ExitStatus:
+    """Why a run stopped, and what it spent."""
+
+    reason: str  # HALTED, BUDGET, STOP_PC, OUTPUT or FAULT
+    ticks: int
+    instructions: int
+    seconds: float
+    # the limit that ran out ("ticks", "instructions", "seconds"), the stop PC in hex,
+    # the matched output, or the fault's message
+    detail: str = ""
+    fault: Exception | None = None
+
+    @property
+    def halted(self) -> bool:
+        return self.reason == HALTED
+
+    def describe(self) -> str:
+        if self.reason == BUDGET:
+            return (
+                f"{self.detail} budget exhausted ({self.ticks} ticks, "
+                f"{self.instructions} instructions, {self.seconds:.2f} s)"
+            )
+        if self.reason == STOP_PC:
+            return f"reached {self.detail}"
+        if self.reason == OUTPUT:
+            return f"output matched {self.detail!r}"
+        if self.reason == FAULT:
+            return f"fault: {self.detail}"
+        return self.reason
+
+
+class OutputMatch:
+    """
+    The `OutputDevice.listener` of `run_until`: stops the CPU (as if halted) as soon as
+    the last OUTPUT_WINDOW characters of output match `pattern`.
+    """
+
+    def __init__(self, cpu: CPU, pattern: str | re.Pattern[str]) -> None:
+        self.cpu = cpu
+        self.pattern: re.Pattern[str] = re.compile(pattern)
+        self.window: str = ""
+        self.match: str | None = None
+
+    def __call__(self, text: str) -> None:
+        self.window = (self.window + text)[-OUTPUT_WINDOW:]
+        found: re.Match[str] | None = self.pattern.search(self.window)
+        if found is not None:
+            self.match = found.group()
+            self.window = ""
+            self.cpu.running = False  # the store is the last microinstruction: at a boundary
+
+
+def input_values(data: Input, input_mode: str = "bytes") -> Iterator[int]:
+    """Turns program input into the values the input device delivers."""
+    if isinstance(data, str):
+        if input_mode == "words":
+            return read_words(io.StringIO(data))
+        data = data.encode("utf-8")
+    if isinstance(data, bytes | bytearray | memoryview):
+        return read_bytes(io.BytesIO(data))
+    return iter(data)
+
+
+def load(
+    image: Image, input: Input | None = None, input_mode: str = "bytes", **options: Any
+) -> CPU:
+    """Creates a CPU with `image` loaded; `options` are passed on to `CPU`."""
+    cpu = CPU(memoryview(image.text), image.data, text_base=image.entry, **options)
+    cpu.pc = image.entry
+    if input is not None:
+        cpu.input_device.source = input_values(input, input_mode)
+    return cpu
+
+
+def run_microcode(cpu: CPU, max_ticks: int, stop_at: frozenset[int] = frozenset()) -> None:
+    """`run_engine` on the microcode engine."""
+    step = cpu.step
+    if stop_at:
+        while cpu.running and not (cpu.mpc == 0 and cpu.pc in stop_at):
+            step()
+            if cpu.ticks > max_ticks:
+                break
+        return
+    while cpu.running:
+        step()
+        if cpu.ticks > max_ticks:
+            break
+
+
+def engine_runner(cpu: CPU, engine: str = "microcode") -> Callable[[int, frozenset[int]], None]:
+    """
+    `run_engine` for `cpu` as a function of (max_ticks, stop_at), which keeps its engine
+    (and so the JIT its compiled blocks) from one call to the next.
+    """
+    if engine == "microcode":
+        return lambda max_ticks, stop_at: run_microcode(cpu, max_ticks, stop_at)
+    if engine == "fast":
+        # whole instructions at a time, same state and tick count but no trace
+        run: Callable[[int, frozenset[int]], None] = FastEngine(cpu).run
+    elif engine == "jit":
+        # compiled basic blocks, same state and tick count as "fast"
+        run = JitEngine(cpu).run
+    else:
+        raise ValueError(f"Unknown engine `{engine}`, expected one of {ENGINES}")
+
+    def run_instructions(max_ticks: int, stop_at: frozenset[int]) -> None:
+        # a CPU stopped inside an instruction (a microcode run out of ticks, restored from
+        # such a checkpoint) finishes it first: the other engines start at FETCH
+        finish_instruction(cpu)
+        run(max_ticks, stop_at)
+
+    return run_instructions
+
+
+def finish_instruction(cpu: CPU) -> None:
+    while cpu.mpc != 0 and cpu.running:
+        cpu.step()
+
+
+def run_engine(
+    cpu: CPU,
+    engine: str = "microcode",
+    max_ticks: int = DEFAULT_MAX_TICKS,
+    stop_at: frozenset[int] = frozenset(),
+) -> None:
+    """
+    Runs `cpu` until halt, until more than `max_ticks` ticks have been spent, or until
+    the next instruction is at a PC in `stop_at` (checked before the first one too).
+    """
+    engine_runner(cpu, engine)(max_ticks, stop_at)
+
+
+def run_until(
+    cpu: CPU,
+    engine: str = "microcode",
+    budget: Budget | None = None,
+    stop_at: Iterable[int] = (),
+    output_pattern: str | re.Pattern[str] | None = None,
+    every: int | None = None,
+    save: Callable[[CPU], None] | None = None,
+) -> ExitStatus:
+    """
+    Runs `cpu` on `engine` until halt, until a limit of `budget` (`Budget()` by default)
+    runs out, until the next instruction is at a PC in `stop_at`, or until the output
+    matches `output_pattern`; calls `save(cpu)` every `every` ticks on the way (see
+    `run_with_checkpoints`). Faults of the program (`MemoryFault`, `IllegalInstruction`)
+    end the run too, and are returned instead of raised.
+
+    The run always stops at an instruction boundary, at the same one on every engine
+    (for a time budget: give or take the TIME_CHECK_TICKS between checks). A run that
+    starts at a PC in `stop_at` executes it before stopping there again.
+    """
+    budget = budget or Budget()
+    stops: frozenset[int] = frozenset(stop_at)
+    run: Callable[[int, frozenset[int]], None] = engine_runner(cpu, engine)
+    start_ticks: int = cpu.ticks
+    start_instructions: int = cpu.perf.instructions
+    started: float = time.perf_counter()
+    max_ticks: int = sys.maxsize if budget.ticks is None else start_ticks + budget.ticks
+    deadline: float | None = None if budget.seconds is None else started + budget.seconds
+    next_save: int = sys.maxsize if every is None else start_ticks + every
+    leaving: bool = cpu.mpc == 0 and cpu.pc in stops
+
+    output = cpu.output_device
+    match: OutputMatch | None = None
+    if output_pattern is not None:
+        match = output.listener = OutputMatch(cpu, output_pattern)
+
+    def status(reason: str, detail: str = "", fault: Exception | None = None) -> ExitStatus:
+        return ExitStatus(
+            reason,
+            ticks=cpu.ticks - start_ticks,
+            instructions=cpu.perf.instructions - start_instructions,
+            seconds=time.perf_counter() - started,
+            detail=detail,
+            fault=fault,
+        )
+
+    try:
+        while True:
+            if not cpu.running:
+                return status(HALTED)
+            remaining: int | None = None
+            if budget.instructions is not None:
+                # a sum over the executed PCs: only with an instruction budget, once a chunk
+                remaining = budget.instructions - (cpu.perf.instructions - start_instructions)
+                if remaining <= 0:
+                    return status(BUDGET, "instructions")
+            if cpu.ticks > max_ticks:
+                return status(BUDGET, "ticks")
+            if deadline is not None and time.perf_counter() >= deadline:
+                return status(BUDGET, "seconds")
+            if save is not None and every is not None and cpu.ticks > next_save:
+                save(cpu)
+                next_save = cpu.ticks + every
+
+            limit: int = min(max_ticks, next_save)
+            if remaining is not None:
+                # every instruction takes at least MIN_INSTRUCTION_TICKS: no engine gets
+                # past the last instruction of the budget
+                limit = min(limit, cpu.ticks + MIN_INSTRUCTION_TICKS * (remaining - 1))
+            if deadline is not None:
+                limit = min(limit, cpu.ticks + TIME_CHECK_TICKS)
+            if leaving:
+                run(cpu.ticks, frozenset())  # one instruction (microcode: its first tick)
+                leaving = False
+            else:
+                run(limit, stops)
+            finish_instruction(cpu)  # the microcode engine stops anywhere
+
+            if match is not None and match.match is not None:
+                cpu.running = True
+                return status(OUTPUT, match.match)
+            if cpu.running and cpu.pc in stops:
+                return status(STOP_PC, f"{cpu.pc:#06x}")
+    except (MemoryFault, IllegalInstruction) as e:
+        return status(FAULT, str(e), e)
+    finally:
+        if match is not None:
+            output.listener = None
+
+
+def execute(
+    program: str | Image,
+    input: Input | None = None,
+    input_mode: str = "bytes",
+    engine: str = "microcode",
+    max_ticks: int = DEFAULT_MAX_TICKS,
+    trace_level: str = "off",
+    cache: AssemblyCache | None = None,
+    budget: Budget | None = None,
+    stop_at: Iterable[int] = (),
+    output_pattern: str | re.Pattern[str] | None = None,
+    **options: Any,
+) -> ExecutionResult:
+    """
+    Assembles `program` (unless it is already an image) and runs it with `run_until`,
+    under `budget` (`Budget(ticks=max_ticks)` if None).
+
+    Nothing is written to disk unless a trace is asked for with `trace_level` or an
+    assembly `cache` is given; `options` are passed on to `CPU`.
+    """
+    if isinstance(program, str):
+        image: Image = assemble(program) if cache is None else cache.assemble(program)
+    else:
+        image = program
+    cpu: CPU = load(image, input, input_mode, trace_level=trace_level, **options)
+    if budget is None:
+        budget = Budget(ticks=max_ticks)
+    try:
+        status: ExitStatus = run_until(cpu, engine, budget, stop_at, output_pattern)
+    finally:
+        cpu.logger.finish()
+        cpu.output_device.flush()
+
+    return ExecutionResult(
+        output=cpu.output_device.render(),
+        values=list(cpu.output_device.tail),
+        registers=list(cpu.registers),
+        ticks=cpu.ticks,
+        halted=not cpu.running,
+        cpu=cpu,
+        status=status,
+    )
@@ -0,0 +1,130 @@
+"""Persistent on-disk cache of assembled program images."""
+
+from __future__ import annotations
+
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from machine import translator
+from machine.image import Image
+from machine.isa import ALIAS_REGISTERS, INSTRUCTION_SET
+
+CACHE_FORMAT = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "riscroll", "assembly")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# temporary files older than this are left over from writers that were killed
+TEMP_FILE_GRACE_SECONDS = 600
+
+
+def toolchain_version() -> str:
+    """
+    Hash of everything besides the source that decides what an image looks like: the
+    ISA tables and the translator itself.
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps([CACHE_FORMAT, INSTRUCTION_SET, ALIAS_REGISTERS], sort_keys=True).encode()
+    )
+    with open(translator.__file__, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+class AssemblyCache:
+    """
+    Images keyed by the SHA-256 of the source text and `toolchain_version()`.
+
+    Every entry is a JSON file in `directory`. Hits refresh the file's mtime, and after
+    each store the least recently used entries are removed until the cache holds at
+    most `max_bytes`. Entries are written atomically, so concurrent batch workers can
+    share a cache directory.
+    """
+
+    def __init__(
+        self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.version: str = toolchain_version()
+
+    def key(self, source: str) -> str:
+        return hashlib.sha256(f"{self.version}\n{source}".encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, source: str) -> Image | None:
+        path: str = self.path(self.key(source))
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # most recently used
+        except (OSError, ValueError):  # missing, evicted meanwhile or corrupt
+            return None
+        return Image(
+            text=base64.b64decode(entry["text"]),
+            data=base64.b64decode(entry["data"]),
+            entry=entry["entry"],
+            text_log=entry["text_log"],
+            data_log=entry["data_log"],
+            symbols={
+                label: (section, address) for label, (section, address) in entry["symbols"].items()
+            },
+        )
+
+    def put(self, source: str, image: Image) -> None:
+        entry = {
+            "text": base64.b64encode(bytes(image.text)).decode("ascii"),
+            "data": base64.b64encode(bytes(image.data)).decode("ascii"),
+            "entry": image.entry,
+            "text_log": image.text_log,
+            "data_log": image.data_log,
+            "symbols": image.symbols,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.path(self.key(source)))
+        self.evict()
+
+    def assemble(self, source: str) -> Image:
+        """`translator.assemble`, answered from the cache when possible."""
+        image: Image | None = self.get(source)
+        if image is None:
+            image = translator.assemble(source)
+            self.put(source, image)
+        return image
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries beyond `max_bytes`, and temporary files
+        older than TEMP_FILE_GRACE_SECONDS.
+        """
+        entries: list[tuple[float, int, str]] = []
+        abandoned: float = time.time() - TEMP_FILE_GRACE_SECONDS
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((".json", ".tmp")):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(".json"):
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            elif stat.st_mtime < abandoned:  # a concurrent writer's file is newer
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
+
+        total: int = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):  # removed by another process
+                os.remove(path)
+            total -= size
@@ -0,0 +1,86 @@
+"""
+Compact binary trace format and its decoder.
+
+A trace file starts with MAGIC, followed by one record per trace line:
+
+    pc: int32 | mpc: uint16 | flags: uint8 (N << 1 | Z) | ir: uint32 | changed: uint32
+
+all little-endian, then one int32 for every bit set in `changed` (the new values of
+those registers, in register order). Decoding a file yields exactly the text of the
+`trace.log` the text logger would have written for the same run.
+
+Usage: python -m machine.binary_trace <trace.bin> [trace.log]
+"""
+
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from collections.abc import Iterator
+
+MAGIC = b"RSCT\x01"
+RECORD_HEADER = struct.Struct("<iHBII")
+
+
+def format_line(pc: int, mpc: int, n: int, z: int, ir: int, changed: list[tuple[int, int]]) -> str:
+    """The text trace line; `changed` holds (register, new value) pairs."""
+    reg_changes: str = " ".join(f"r{i}={new & 0xFFFFFFFF:08X}({new})" for i, new in changed)
+    return f"PC=0x{pc:08X}({pc}) MPC={mpc} NZ={n}{z} IR=0x{ir:08X}({ir}) " + reg_changes
+
+
+def encode_record(
+    pc: int, mpc: int, n: int, z: int, ir: int, changed: list[tuple[int, int]]
+) -> bytes:
+    mask: int = 0
+    for i, _ in changed:
+        mask |= 1 << i
+    values = array("i", [new for _, new in changed])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return RECORD_HEADER.pack(pc, mpc, (n << 1) | z, ir, mask) + values.tobytes()
+
+
+def iter_records(data: bytes) -> Iterator[tuple[int, int, int, int, int, list[tuple[int, int]]]]:
+    """Yields (pc, mpc, n, z, ir, changed) for every record of a binary trace."""
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a binary trace: bad magic")
+
+    offset: int = len(MAGIC)
+    header_size: int = RECORD_HEADER.size
+    while offset < len(data):
+        pc, mpc, flags, ir, mask = RECORD_HEADER.unpack_from(data, offset)
+        offset += header_size
+        count: int = mask.bit_count()
+        values = array("i")
+        values.frombytes(data[offset : offset + 4 * count])
+        if sys.byteorder == "big":
+            values.byteswap()
+        offset += 4 * count
+
+        registers: list[int] = [i for i in range(32) if mask >> i & 1]
+        yield pc, mpc, flags >> 1, flags & 1, ir, list(zip(registers, values, strict=True))
+
+
+def decode(data: bytes) -> str:
+    """Reproduces the text trace from a binary one."""
+    lines: list[str] = [format_line(*record) for record in iter_records(data)]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def main(source_path: str, target_path: str | None = None) -> None:
+    with open(source_path, "rb") as f:
+        text: str = decode(f.read())
+
+    if target_path is None:
+        sys.stdout.write(text)
+    else:
+        with open(target_path, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m machine.binary_trace <trace.bin> [trace.log]")
+        sys.exit(1)
+    main(*sys.argv[1:])
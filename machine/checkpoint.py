@@ -0,0 +1,216 @@
+"""
+Checkpoints: the complete state of a running machine in a compact binary file.
+
+A checkpoint holds everything a program can observe or the machine needs to go on:
+PC, IR, MPC, ALU_OUT, flags, registers, tick count, the data memory pages written since
+the program was loaded (`Memory.dirty`; the others still hold the image), the input
+position (values taken from the input source, plus values pushed back), the output
+device's counts and kept tail, and the performance counters. Instructions
+are not saved: a checkpoint is restored into a CPU loaded with the same program and
+input (checked by a hash of instruction memory), and the input source is advanced to
+where the checkpoint left it.
+
+The file is `MAGIC`, then a zlib-compressed body of little-endian fields:
+
+    header      pc i32, ir u32, mpc u32, alu_out i64, Z u8, N u8, running u8, ticks u64,
+                data memory size u32, SHA-256 of text base and instruction memory
+    registers   32 x i64
+    memory      dirty page count u32, then (page number u32, PAGE_SIZE bytes) per page
+    input       position u64, pushed-back count u32, values i64
+    output      count u64, chars u64, tail length u32, then (kind u8, value i64):
+                kind 0 a character, kind 1 a number
+    perf        executed count u32 + (pc i32, count u64); taken likewise;
+                device loads u64, device stores u64
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+import struct
+import tempfile
+import zlib
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from machine.api import Budget, ExitStatus, run_until
+from machine.decoder import decode
+from machine.memory import PAGE_SIZE
+
+if TYPE_CHECKING:
+    from machine.machine import CPU
+
+MAGIC = b"RISCROLL-CKPT\x02"
+# PCs are signed: a jalr can jump to a negative ALU result
+HEADER = struct.Struct("<iIIqBBBQI32s")
+REGISTERS = struct.Struct("<32q")
+COUNT = struct.Struct("<I")
+PAGE_NUMBER = struct.Struct("<I")
+VALUE = struct.Struct("<q")
+INPUT = struct.Struct("<QI")
+OUTPUT = struct.Struct("<QQI")
+TAIL_ITEM = struct.Struct("<Bq")
+COUNTER = struct.Struct("<iQ")
+DEVICE_ACCESSES = struct.Struct("<QQ")
+
+
+class CheckpointError(Exception):
+    """A checkpoint that cannot be read, or that belongs to another program."""
+
+
+def program_hash(cpu: CPU) -> bytes:
+    digest = hashlib.sha256(cpu.decode_cache.base.to_bytes(4, "little"))
+    digest.update(bytes(cpu.instr_mem))
+    return digest.digest()
+
+
+def capture(cpu: CPU) -> bytes:
+    """The state of `cpu` as checkpoint bytes."""
+    memory = cpu.memory
+    body = bytearray(
+        HEADER.pack(
+            cpu.pc,
+            cpu.ir & 0xFFFFFFFF,
+            cpu.mpc,
+            cpu.alu_out,
+            cpu.flags["Z"],
+            cpu.flags["N"],
+            cpu.running,
+            cpu.ticks,
+            memory.size,
+            program_hash(cpu),
+        )
+    )
+    body += REGISTERS.pack(*cpu.registers)
+
+    pages: list[int] = memory.dirty_pages()
+    body += COUNT.pack(len(pages))
+    for page in pages:
+        body += PAGE_NUMBER.pack(page)
+        body += memory.page(page).ljust(PAGE_SIZE, b"\0")
+
+    input_device = cpu.input_device
+    body += INPUT.pack(input_device.position, len(input_device.pending))
+    for value in input_device.pending:
+        body += VALUE.pack(value)
+
+    output = cpu.output_device
+    body += OUTPUT.pack(output.count, output.chars, len(output.tail))
+    for item in output.tail:
+        body += TAIL_ITEM.pack(*((0, ord(item)) if isinstance(item, str) else (1, item)))
+
+    for counts in (cpu.perf.executed, cpu.perf.taken):
+        body += COUNT.pack(len(counts))
+        for pc, count in sorted(counts.items()):  # the same bytes on every engine
+            body += COUNTER.pack(pc, count)
+    body += DEVICE_ACCESSES.pack(cpu.address_map.device_loads, cpu.address_map.device_stores)
+    return MAGIC + zlib.compress(body)
+
+
+def restore(cpu: CPU, checkpoint: bytes) -> None:
+    """
+    Puts `cpu`, loaded with the same program and input, into the state of `checkpoint`.
+
+    Only pages dirty in the checkpoint or in `cpu` are written: the first get the
+    checkpoint's contents, the others go back to the image. The input is advanced from
+    where it stands, so a CPU that already ran needs a fresh input source.
+
+    Raises:
+        CheckpointError: if `checkpoint` is not one, or was taken of another program or
+            with another data memory size.
+    """
+    if not checkpoint.startswith(MAGIC):
+        raise CheckpointError("Not a RISCroll checkpoint")
+    try:
+        body: bytes = zlib.decompress(checkpoint[len(MAGIC) :])
+    except zlib.error as e:
+        raise CheckpointError(f"Corrupt checkpoint: {e}") from e
+    offset = 0
+
+    def read(layout: struct.Struct) -> tuple:
+        nonlocal offset
+        fields = layout.unpack_from(body, offset)
+        offset += layout.size
+        return fields
+
+    try:
+        pc, ir, mpc, alu_out, z, n, running, ticks, data_size, digest = read(HEADER)
+        if digest != program_hash(cpu):
+            raise CheckpointError("Checkpoint was taken of another program")
+        memory = cpu.memory
+        if data_size != memory.size:
+            raise CheckpointError(
+                f"Checkpoint has {data_size} bytes of data memory, the machine {memory.size}"
+            )
+        cpu.pc, cpu.ir, cpu.mpc, cpu.alu_out = pc, ir, mpc, alu_out
+        cpu.flags["Z"], cpu.flags["N"] = z, n
+        cpu.running, cpu.ticks = bool(running), ticks
+        cpu.decoded = decode(ir, cpu.microcode_rom)  # what the micro-steps left look at
+        cpu.registers[:] = read(REGISTERS)
+
+        stale: set[int] = set(memory.dirty_pages())
+        for _ in range(read(COUNT)[0]):
+            page: int = read(PAGE_NUMBER)[0]
+            contents: bytes = body[offset : offset + PAGE_SIZE]
+            if len(contents) < PAGE_SIZE:
+                raise CheckpointError("Truncated checkpoint: incomplete memory page")
+            memory.write_page(page, contents[: len(memory.page(page))])
+            stale.discard(page)
+            offset += PAGE_SIZE
+        for page in stale:
+            memory.write_page(page, memory.initial_page(page), dirty=False)
+
+        input_device = cpu.input_device
+        position, pending = read(INPUT)
+        input_device.source = itertools.islice(input_device.source, position, None)
+        input_device.position = position
+        input_device.pending.clear()
+        input_device.pending.extend(read(VALUE)[0] for _ in range(pending))
+
+        output = cpu.output_device
+        output.count, output.chars, tail = read(OUTPUT)
+        output.tail.clear()
+        for _ in range(tail):
+            kind, value = read(TAIL_ITEM)
+            output.tail.append(chr(value) if kind == 0 else value)
+
+        for counts in (cpu.perf.executed, cpu.perf.taken):
+            counts.clear()
+            for _ in range(read(COUNT)[0]):
+                pc, count = read(COUNTER)
+                counts[pc] = count
+        cpu.address_map.device_loads, cpu.address_map.device_stores = read(DEVICE_ACCESSES)
+    except struct.error as e:
+        raise CheckpointError(f"Truncated checkpoint: {e}") from e
+
+    cpu.logger.resync()
+
+
+def write_checkpoint(cpu: CPU, path: str) -> None:
+    """Writes a checkpoint of `cpu` to `path`, atomically (a killed run leaves the old one)."""
+    directory: str = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(capture(cpu))
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(cpu: CPU, path: str) -> None:
+    """Restores `cpu` from the checkpoint file at `path` (see `restore`)."""
+    with open(path, "rb") as f:
+        restore(cpu, f.read())
+
+
+def run_with_checkpoints(
+    cpu: CPU, engine: str, max_ticks: int, every: int, save: Callable[[CPU], None]
+) -> ExitStatus:
+    """
+    `run_engine`, calling `save(cpu)` every `every` ticks (for example
+    `lambda cpu: write_checkpoint(cpu, path)`); `run_until` with a tick budget up to
+    `max_ticks`.
+
+    Checkpoints are taken at instruction boundaries, so they resume on any engine.
+    """
+    return run_until(cpu, engine, Budget(ticks=max_ticks - cpu.ticks), every=every, save=save)
@@ -0,0 +1,524 @@
+"""
+Interactive debugger: breakpoints, watchpoints, and stepping forwards and backwards.
+
+Running forward uses the JIT's compiled blocks, and breakpoints cost next to nothing
+until one is set: they are a bitmap with a byte per instruction of text memory,
+looked at once per block (a `bytearray.find` over the block's PCs). Only a block
+with a breakpoint in it, or with a store while a watchpoint is set, is stepped one
+instruction at a time through the interpreter. A watchpoint stops the run right
+after a store writes any byte of the watched word.
+
+Going back works in two ways. An instruction step pushes an undo record with the
+state it overwrote: PC, IR, MPC, ALU_OUT, flags, tick count, the registers it changed
+and the memory bytes a store overwrote. So stepping back right after stepping forward
+is immediate. Anything else that moves forward clears the undo log: continuing,
+micro-steps, and instructions that access a device (input and output cannot be
+taken back). Without an undo record the debugger travels in time instead, like
+`goto_tick`. The session is recorded from its start (`Recorder`), with a checkpoint
+every `checkpoint_every` ticks, so any earlier tick is the nearest checkpoint plus at
+most that many ticks of re-execution with the recorded input.
+"""
+
+from __future__ import annotations
+
+import itertools
+import sys
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import IO, TYPE_CHECKING
+
+from machine.alu import op_add
+from machine.decoder import DecodedInstruction
+from machine.image import Labels, parse_location
+from machine.isa import INSTRUCTION_SET
+from machine.jit import Block, JitEngine
+from machine.replay import DEFAULT_CHECKPOINT_EVERY, Recorder, goto_tick, instruction_start
+
+if TYPE_CHECKING:
+    from machine.machine import CPU
+
+STORE_OPCODE: int = INSTRUCTION_SET["sw"]["opcode"]
+UNDO_LIMIT = 100_000  # instruction steps kept for going back without re-executing
+WATCH_WIDTH = 4  # a watchpoint covers a word
+
+HELP = """\
+break LOC         (b)   stop before the instruction at LOC: a label, label+0x8 or an address
+delete LOC        (d)   remove the breakpoint at LOC
+watch ADDR        (w)   stop after a store to the word at ADDR: a data label or an address
+unwatch ADDR            remove the watchpoint at ADDR
+info              (i)   list the breakpoints and watchpoints
+step [N]          (s)   execute N instructions (1 by default)
+micro [N]         (m)   execute N microinstructions
+continue [TICKS]  (c)   run until a breakpoint, a watchpoint or halt (or for at most TICKS)
+reverse [N]       (rs)  go back N instructions
+reverse-micro [N] (rm)  go back N microinstructions
+goto TICK               go back to TICK
+regs              (r)   show the registers
+x ADDR [N]              show N words of data memory from ADDR (1 by default)
+where                   show where the machine is
+quit              (q)   leave the debugger"""
+
+COUNTED = ("step", "micro", "continue", "reverse", "reverse-micro")
+ALIASES = {
+    "b": "break",
+    "d": "delete",
+    "w": "watch",
+    "i": "info",
+    "s": "step",
+    "m": "micro",
+    "c": "continue",
+    "rs": "reverse",
+    "rm": "reverse-micro",
+    "r": "regs",
+    "q": "quit",
+}
+
+
+@dataclass(slots=True)
+class Stop:
+    reason: str  # "breakpoint", "watchpoint", "halted", "budget", "start" or "done"
+    detail: str = ""
+
+
+@dataclass(slots=True)
+class Undo:
+    """What one instruction step overwrote."""
+
+    pc: int
+    ir: int
+    mpc: int
+    alu_out: int
+    flags: tuple[int, int]  # Z, N
+    ticks: int
+    running: bool
+    decoded: DecodedInstruction
+    taken: int | None  # the taken count of the instruction's PC, None if it had none
+    memory: tuple[int, bytes] | None  # (address, old contents) of a store
+    registers: list[tuple[int, int]]  # (register, old value) of the registers changed
+
+
+class Debugger:
+    """
+    Debugs `cpu`, freshly loaded (the session is recorded from its start, see above).
+
+    `listing` maps addresses to source lines and `symbols` labels to (section, address),
+    as for `Profiler`; without them locations are addresses only.
+    """
+
+    def __init__(
+        self,
+        cpu: CPU,
+        listing: dict[int, str] | None = None,
+        symbols: dict[str, tuple[str, int]] | None = None,
+        checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    ) -> None:
+        if cpu.ticks != 0:
+            raise ValueError("The debugger records a run from its start: attach it before running")
+        self.cpu = cpu
+        self.listing: dict[int, str] = listing or {}
+        self.symbols: dict[str, tuple[str, int]] = symbols or {}
+        self.labels: Labels = Labels(self.symbols)
+        self.checkpoint_every: int = checkpoint_every
+        self.base: int = cpu.decode_cache.base
+        self.breakpoints: bytearray = bytearray(-(-len(cpu.instr_mem) // 4))  # per instruction
+        self.watchpoints: dict[int, int] = {}  # address: the value last seen
+        self.undo: deque[Undo] = deque(maxlen=UNDO_LIMIT)
+        self.jit: JitEngine = JitEngine(cpu)
+        self.store_blocks: dict[Block, bool] = {}  # whether a block has a store in it
+        self.recorder: Recorder = Recorder(cpu)
+        self.live = cpu.input_device.source  # the input not read yet, recorded as it is
+        self.recorder.checkpoint(cpu)
+
+    # --- locations ---
+
+    def address(self, location: str) -> int:
+        """The address of `label`, `label+0x8` or a number (`0x188`, `392`)."""
+        return parse_location(location, self.symbols)
+
+    def breakpoint_index(self, pc: int) -> int:
+        index: int = (pc - self.base) >> 2
+        if pc & 3 or not 0 <= index < len(self.breakpoints):
+            raise ValueError(f"No instruction at {pc:#06x}")
+        return index
+
+    def at_breakpoint(self) -> bool:
+        index: int = (self.cpu.pc - self.base) >> 2
+        return 0 <= index < len(self.breakpoints) and self.breakpoints[index] == 1
+
+    def where(self) -> str:
+        """Tick, PC with its label, MPC inside an instruction, and the source line."""
+        cpu = self.cpu
+        pc: int = cpu.pc
+        line: str = f"tick {cpu.ticks}  pc {pc:#06x}"
+        location: str = self.labels.location(pc)
+        if location != f"{pc:#06x}":  # the address itself when there is no label before it
+            line += f" {location}"
+        if cpu.mpc != 0 and cpu.running:
+            line += f"  mpc {cpu.mpc}, inside {cpu.ir & 0xFFFFFFFF:#010x}"
+        elif pc in self.listing:
+            line += f"  {self.listing[pc]}"
+        return line if cpu.running else line + "  (halted)"
+
+    # --- breakpoints and watchpoints ---
+
+    def add_breakpoint(self, location: str) -> int:
+        pc: int = self.address(location)
+        self.breakpoints[self.breakpoint_index(pc)] = 1
+        return pc
+
+    def remove_breakpoint(self, location: str) -> int:
+        pc: int = self.address(location)
+        self.breakpoints[self.breakpoint_index(pc)] = 0
+        return pc
+
+    def breakpoint_addresses(self) -> list[int]:
+        addresses: list[int] = []
+        index: int = self.breakpoints.find(1)
+        while index != -1:
+            addresses.append(self.base + 4 * index)
+            index = self.breakpoints.find(1, index + 1)
+        return addresses
+
+    def add_watchpoint(self, location: str) -> int:
+        address: int = self.address(location)
+        if not 0 <= address <= self.cpu.memory.size - WATCH_WIDTH:
+            raise ValueError(f"No data memory word at {address:#x}")
+        self.watchpoints[address] = self.cpu.memory.load_word(address)
+        return address
+
+    def remove_watchpoint(self, location: str) -> int:
+        address: int = self.address(location)
+        self.watchpoints.pop(address, None)
+        return address
+
+    def reload_watchpoints(self) -> None:
+        """Takes the watched words' values from memory again, after going back in time."""
+        for address in self.watchpoints:
+            self.watchpoints[address] = self.cpu.memory.load_word(address)
+
+    def watch_hit(self) -> Stop | None:
+        """The watchpoint the instruction just executed stored to, if any."""
+        cpu = self.cpu
+        decoded: DecodedInstruction = cpu.decoded
+        if decoded.opcode != STORE_OPCODE:
+            return None
+        address: int = cpu.alu_out
+        end: int = address + (4 if decoded.funct3 == 0 else 1)  # sw or sb
+        for watched, old in self.watchpoints.items():
+            if address < watched + WATCH_WIDTH and watched < end:
+                new: int = cpu.memory.load_word(watched)
+                self.watchpoints[watched] = new
+                return Stop("watchpoint", f"{watched:#x}: {old} -> {new}")
+        return None
+
+    def stores(self, block: Block) -> bool:
+        has_store: bool | None = self.store_blocks.get(block)
+        if has_store is None:
+            fetch = self.cpu.decode_cache.fetch
+            has_store = self.store_blocks[block] = any(
+                fetch(pc).opcode == STORE_OPCODE
+                for pc in range(block.pc, block.pc + 4 * block.length, 4)
+            )
+        return has_store
+
+    # --- forward ---
+
+    def checkpoint(self) -> None:
+        """Keeps a checkpoint if the latest is `checkpoint_every` ticks behind."""
+        cpu = self.cpu
+        if cpu.mpc == 0 and cpu.running and cpu.ticks >= self.next_checkpoint():
+            self.recorder.checkpoint(cpu)
+
+    def next_checkpoint(self) -> int:
+        return self.recorder.recording.checkpoints[-1][0] + self.checkpoint_every
+
+    def step(self, count: int = 1) -> Stop:
+        """
+        Executes `count` instructions (finishing the current one first if the CPU is
+        inside one), stopping early at a breakpoint, a watchpoint or halt.
+        """
+        cpu = self.cpu
+        for i in range(count):
+            if not cpu.running:
+                return Stop("halted")
+            if i and self.at_breakpoint():  # not the first: stepping leaves a breakpoint
+                return Stop("breakpoint")
+            if cpu.mpc != 0:
+                self.undo.clear()
+                while cpu.mpc != 0 and cpu.running:
+                    cpu.step()
+            else:
+                self.step_undoable()
+            stop: Stop | None = self.watch_hit() if self.watchpoints else None
+            if stop is not None:
+                return stop
+            self.checkpoint()
+        return Stop("done" if cpu.running else "halted")
+
+    def step_undoable(self) -> None:
+        """Executes the instruction at PC and pushes what it overwrote onto `undo`."""
+        cpu = self.cpu
+        pc: int = cpu.pc
+        registers: list[int] = cpu.registers.copy()
+        decoded: DecodedInstruction = cpu.decode_cache.fetch(pc)
+        memory: tuple[int, bytes] | None = None
+        if decoded.opcode == STORE_OPCODE:
+            address: int = op_add(registers[decoded.rs1], decoded.imm)
+            if 0 <= address < cpu.memory.size:
+                memory = (address, bytes(cpu.data_mem[address : address + 4]))
+        undo = Undo(
+            pc,
+            cpu.ir,
+            cpu.mpc,
+            cpu.alu_out,
+            (cpu.flags["Z"], cpu.flags["N"]),
+            cpu.ticks,
+            cpu.running,
+            cpu.decoded,
+            cpu.perf.taken.get(pc),
+            memory,
+            [],
+        )
+        address_map = cpu.address_map
+        device_accesses: int = address_map.device_loads + address_map.device_stores
+
+        self.jit.interpreter.step()
+        if address_map.device_loads + address_map.device_stores != device_accesses:
+            self.undo.clear()  # I/O cannot be undone: going back re-executes instead
+            return
+        undo.registers = [(i, old) for i, old in enumerate(registers) if cpu.registers[i] != old]
+        self.undo.append(undo)
+
+    def micro_step(self, count: int = 1) -> Stop:
+        """Executes `count` microinstructions (on the microcode engine, traced as usual)."""
+        cpu = self.cpu
+        self.undo.clear()
+        for _ in range(count):
+            if not cpu.running:
+                return Stop("halted")
+            cpu.step()
+            self.checkpoint()
+        return Stop("done" if cpu.running else "halted")
+
+    def run(self, max_ticks: int | None = None) -> Stop:
+        """
+        Runs until a breakpoint, a watchpoint or halt, or until more than `max_ticks`
+        ticks have been spent in all. A breakpoint at the PC the run starts at does not
+        stop it again.
+        """
+        cpu = self.cpu
+        self.undo.clear()
+        while cpu.mpc != 0 and cpu.running:  # the JIT starts at FETCH
+            cpu.step()
+        try:
+            return self.run_blocks(sys.maxsize if max_ticks is None else max_ticks)
+        finally:
+            self.jit.retire_counts()
+
+    def run_blocks(self, max_ticks: int) -> Stop:
+        cpu = self.cpu
+        jit = self.jit
+        step = jit.interpreter.step
+        breakpoints: bytearray = self.breakpoints
+        armed: bool = breakpoints.find(1) != -1
+        watching: bool = bool(self.watchpoints)
+        resuming: bool = True
+        next_checkpoint: int = self.next_checkpoint()
+        # whether a block has to be stepped: for this run, breakpoints do not change
+        stepped: dict[Block, bool] = {}
+
+        if not cpu.running:
+            return Stop("halted")
+        block: Block = jit.block_at(cpu.pc)
+        while True:
+            if cpu.ticks >= next_checkpoint:
+                jit.retire_counts()  # the counters are part of the checkpoint
+                self.checkpoint()
+                next_checkpoint = self.next_checkpoint()
+
+            step_block: bool | None = False
+            if armed or watching:  # nothing to look up otherwise: as fast as the JIT
+                step_block = stepped.get(block)
+                if step_block is None:
+                    first: int = (block.pc - self.base) >> 2
+                    step_block = stepped[block] = (
+                        armed and breakpoints.find(1, first, first + block.length) != -1
+                    ) or (watching and self.stores(block))
+
+            if not step_block and cpu.ticks + block.ticks <= max_ticks:
+                resuming = False
+                block.runs += 1
+                if block.fn(cpu):
+                    block.stops[cpu.pc] = block.stops.get(cpu.pc, 0) + 1
+                    step()  # MMIO or slow-path memory access, as in JitEngine.run_blocks
+                if not cpu.running:
+                    return Stop("halted")
+                pc: int = cpu.pc
+                successor: Block | None = block.exits.get(pc)
+                if successor is None:
+                    successor = block.exits[pc] = jit.block_at(pc)
+                block = successor
+                continue
+
+            # one instruction at a time, to the end of the block or the first jump
+            for _ in range(max(block.length, 1)):
+                if armed and not resuming and self.at_breakpoint():
+                    return Stop("breakpoint")
+                resuming = False
+                pc = cpu.pc
+                step()
+                stop: Stop | None = self.watch_hit() if watching else None
+                if stop is not None:
+                    return stop
+                if not cpu.running:
+                    return Stop("halted")
+                if cpu.ticks > max_ticks:
+                    return Stop("budget")
+                if cpu.pc != pc + 4:
+                    break
+            block = jit.block_at(cpu.pc)
+
+    # --- backward ---
+
+    def reverse_step(self, count: int = 1) -> Stop:
+        """Goes back `count` instructions (to the start of the current one, if inside one)."""
+        cpu = self.cpu
+        for _ in range(count):
+            if self.undo:
+                self.apply(self.undo.pop())
+                continue
+            if cpu.ticks == 0:
+                return Stop("start")
+            if cpu.mpc == 0 or not cpu.running:
+                self.travel(cpu.ticks - 1)  # into the previous instruction
+            self.travel(instruction_start(cpu))
+        return Stop("done")
+
+    def reverse_micro_step(self, count: int = 1) -> Stop:
+        """Goes back `count` microinstructions (ticks)."""
+        if self.cpu.ticks == 0:
+            return Stop("start")
+        self.travel(max(self.cpu.ticks - count, 0))
+        return Stop("done")
+
+    def apply(self, undo: Undo) -> None:
+        cpu = self.cpu
+        cpu.pc, cpu.ir, cpu.mpc, cpu.alu_out = undo.pc, undo.ir, undo.mpc, undo.alu_out
+        cpu.flags["Z"], cpu.flags["N"] = undo.flags
+        cpu.ticks, cpu.running, cpu.decoded = undo.ticks, undo.running, undo.decoded
+        for register, value in undo.registers:
+            cpu.registers[register] = value
+        if undo.memory is not None:
+            address, contents = undo.memory
+            cpu.data_mem[address : address + len(contents)] = contents
+        executed: dict[int, int] = cpu.perf.executed
+        executed[undo.pc] -= 1
+        if not executed[undo.pc]:
+            del executed[undo.pc]
+        if undo.taken is None:
+            cpu.perf.taken.pop(undo.pc, None)
+        else:
+            cpu.perf.taken[undo.pc] = undo.taken
+        cpu.logger.resync()
+        self.reload_watchpoints()
+
+    def travel(self, tick: int) -> None:
+        """Brings the CPU back to `tick` (not after the current one) from the checkpoints."""
+        cpu = self.cpu
+        if not 0 <= tick <= cpu.ticks:
+            raise ValueError(f"Tick {tick} is not between 0 and the current tick {cpu.ticks}")
+        self.undo.clear()
+        goto_tick(cpu, self.recorder.recording, tick)
+        # the recorded input up to where the run got, then the rest of the input
+        cpu.input_device.source = itertools.chain(cpu.input_device.source, self.live)
+        self.reload_watchpoints()
+
+    # --- command line ---
+
+    def registers(self) -> str:
+        registers: list[int] = self.cpu.registers
+        return "\n".join(
+            " ".join(f"r{j:02d}={registers[j] & 0xFFFFFFFF:08X}" for j in range(i, i + 4))
+            for i in range(0, 32, 4)
+        )
+
+    def report(self, stop: Stop) -> str:
+        if stop.reason == "breakpoint":
+            return f"Breakpoint at {self.where()}"
+        if stop.reason == "watchpoint":
+            return f"Watchpoint {stop.detail} at {self.where()}"
+        if stop.reason == "budget":
+            return f"Tick budget spent at {self.where()}"
+        if stop.reason == "start":
+            return f"At the start: {self.where()}"
+        return self.where()
+
+    def command(self, line: str) -> str:
+        """Executes one command line (see `HELP`) and returns what it prints."""
+        words: list[str] = line.split()
+        if not words:
+            return ""
+        name: str = ALIASES.get(words[0], words[0])
+        arguments: list[str] = words[1:]
+        count: int = int(arguments[0], 0) if arguments and name in COUNTED else 1
+
+        if name == "break" and arguments:
+            pc: int = self.add_breakpoint(arguments[0])
+            return f"Breakpoint at {pc:#06x} {self.labels.location(pc)}"
+        if name == "delete" and arguments:
+            pc = self.remove_breakpoint(arguments[0])
+            return f"Deleted the breakpoint at {pc:#06x}"
+        if name == "watch" and arguments:
+            address: int = self.add_watchpoint(arguments[0])
+            return f"Watchpoint at {address:#x} = {self.watchpoints[address]}"
+        if name == "unwatch" and arguments:
+            return f"Deleted the watchpoint at {self.remove_watchpoint(arguments[0]):#x}"
+        if name == "info":
+            lines: list[str] = [
+                f"breakpoint {pc:#06x} {self.labels.location(pc)}"
+                for pc in self.breakpoint_addresses()
+            ]
+            lines += [
+                f"watchpoint {address:#x} = {value}" for address, value in self.watchpoints.items()
+            ]
+            return "\n".join(lines) or "No breakpoints or watchpoints"
+        if name == "step":
+            return self.report(self.step(count))
+        if name == "micro":
+            return self.report(self.micro_step(count))
+        if name == "continue":
+            limit: int | None = self.cpu.ticks + count if arguments else None
+            return self.report(self.run(limit))
+        if name == "reverse":
+            return self.report(self.reverse_step(count))
+        if name == "reverse-micro":
+            return self.report(self.reverse_micro_step(count))
+        if name == "goto" and arguments:
+            self.travel(int(arguments[0], 0))
+            return self.where()
+        if name == "regs":
+            return self.registers()
+        if name == "x" and arguments:
+            start: int = self.address(arguments[0])
+            words_shown: int = int(arguments[1], 0) if len(arguments) > 1 else 1
+            return "\n".join(
+                f"{address:08X}: {self.cpu.memory.load_word(address) & 0xFFFFFFFF:08X}"
+                for address in range(start, start + 4 * words_shown, 4)
+            )
+        if name == "where":
+            return self.where()
+        return HELP
+
+    def repl(self, commands: Iterable[str] = sys.stdin, out: IO[str] = sys.stdout) -> None:
+        """Reads commands until `quit` or the end of `commands`, printing to `out`."""
+        print(self.where(), file=out)
+        print("(rdb) ", end="", file=out, flush=True)
+        for line in commands:
+            if line.strip() in ("q", "quit"):
+                break
+            try:
+                print(self.command(line), file=out)
+            except Exception as e:  # report and go on: the session is not lost to a typo
+                print(f"Error: {e}", file=out)
+            print("(rdb) ", end="", file=out, flush=True)
@@ -0,0 +1,169 @@
+"""Instruction predecoding and the per-PC decode cache."""
+
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass
+from mmap import mmap
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # for mypy
+    from machine.microcode import MicrocodeROM
+
+# Anything instruction memory can be loaded from without a copy
+Buffer = bytes | bytearray | memoryview | mmap
+
+
+@dataclass(slots=True)
+class DecodedInstruction:
+    """
+    All fields of an instruction word that the datapath ever looks at.
+
+    `imm` is the sign-extended immediate of the instruction's own format
+    (I, S, B, U or J), so the micro-steps never have to re-slice `IR`.
+    `mpc` is the start address of the instruction's microprogram, or None if
+    the decode table has no match (the error is raised at DECODE DISPATCH).
+    """
+
+    word: int
+    opcode: int
+    rd: int
+    funct3: int
+    rs1: int
+    rs2: int
+    funct7: int
+    imm: int
+    mpc: int | None
+
+
+def imm_i(ir: int) -> int:
+    imm: int = (ir >> 20) & 0xFFF
+    if imm & 0x800:
+        imm |= -1 << 12  # sign-extend 12-bit immediate
+    return imm
+
+
+def imm_s(ir: int) -> int:
+    imm_11_5: int = (ir >> 25) & 0x7F
+    imm_4_0: int = (ir >> 7) & 0x1F
+    imm: int = (imm_11_5 << 5) | imm_4_0
+    if imm & 0x800:
+        imm |= -1 << 12  # sign-extend 12-bit immediate
+    return imm
+
+
+def imm_b(ir: int) -> int:
+    imm_12: int = (ir >> 31) & 0x1
+    imm_10_5: int = (ir >> 25) & 0x3F
+    imm_4_1: int = (ir >> 8) & 0xF
+    imm_11: int = (ir >> 7) & 0x1
+
+    imm: int = (imm_12 << 12) | (imm_11 << 11) | (imm_10_5 << 5) | (imm_4_1 << 1)
+    if imm & 0x1000:
+        imm |= -1 << 13  # sign-extend 13-bit immediate (imm[12] is sign bit)
+    return imm
+
+
+def imm_u(ir: int) -> int:
+    return ir & 0xFFFFF000
+
+
+def imm_j(ir: int) -> int:
+    imm_20: int = (ir >> 31) & 0x1
+    imm_10_1: int = (ir >> 21) & 0x3FF
+    imm_11: int = (ir >> 20) & 0x1
+    imm_19_12: int = (ir >> 12) & 0xFF
+
+    imm: int = (imm_20 << 20) | (imm_19_12 << 12) | (imm_11 << 11) | (imm_10_1 << 1)
+
+    # sign extend from bit 20 if negative
+    if imm & (1 << 20):
+        imm |= -1 << 21
+    return imm
+
+
+IMMEDIATE_BY_OPCODE = {
+    0x13: imm_i,  # addi, andi, ori
+    0x03: imm_i,  # lw, lb
+    0x67: imm_i,  # jalr
+    0x23: imm_s,  # sw, sb
+    0x63: imm_b,  # beq, bne, bgt, ble
+    0x37: imm_u,  # lui
+    0x6F: imm_j,  # jal
+}
+
+
+def decode(word: int, rom: MicrocodeROM) -> DecodedInstruction:
+    """Splits an instruction word into its fields and resolves its microprogram."""
+    opcode: int = word & 0x7F
+    funct3: int = (word >> 12) & 0x7
+    funct7: int = (word >> 25) & 0x7F
+    imm_fn = IMMEDIATE_BY_OPCODE.get(opcode)
+
+    try:
+        mpc: int | None = rom.get_decode_address(opcode, funct3, funct7)
+    except ValueError:
+        mpc = None
+
+    return DecodedInstruction(
+        word=word,
+        opcode=opcode,
+        rd=(word >> 7) & 0x1F,
+        funct3=funct3,
+        rs1=(word >> 15) & 0x1F,
+        rs2=(word >> 20) & 0x1F,
+        funct7=funct7,
+        imm=imm_fn(word) if imm_fn else 0,
+        mpc=mpc,
+    )
+
+
+class DecodeCache:
+    """
+    Predecoded instructions keyed by PC.
+
+    Instruction memory is read-only for running programs (Harvard architecture),
+    so an entry stays valid until the memory itself is replaced, at which point
+    the owner must call `invalidate`.
+
+    `instr_mem` may be any buffer (bytes, bytearray, mmap) holding the text image
+    placed at address `base`; everything outside of it reads as zero. Words are
+    fetched through a `memoryview` cast to 32-bit words, without copying the image
+    or slicing a new bytes object per fetch.
+    """
+
+    def __init__(self, instr_mem: Buffer, rom: MicrocodeROM, base: int = 0) -> None:
+        self.rom: MicrocodeROM = rom
+        self.entries: dict[int, DecodedInstruction] = {}
+        self.set_memory(instr_mem, base)
+
+    def set_memory(self, instr_mem: Buffer, base: int = 0) -> None:
+        self.instr_mem: Buffer = instr_mem
+        self.base: int = base
+        view = memoryview(instr_mem)
+        # native 32-bit words are only the ISA's little-endian words on little-endian hosts
+        self.words: memoryview | None = None
+        if sys.byteorder == "little" and view.nbytes % 4 == 0:
+            self.words = view.cast("B").cast("I")
+
+    def read_word(self, pc: int) -> int:
+        offset: int = pc - self.base
+        if self.words is not None and offset & 3 == 0 and 0 <= offset >> 2 < len(self.words):
+            return self.words[offset >> 2]
+        if offset < 0:
+            return 0
+        # unaligned, a partial word at the end, or a big-endian host
+        return int.from_bytes(memoryview(self.instr_mem)[offset : offset + 4], "little")
+
+    def fetch(self, pc: int) -> DecodedInstruction:
+        """Returns the decoded instruction at `pc`, decoding it on first use."""
+        decoded: DecodedInstruction | None = self.entries.get(pc)
+        if decoded is None:
+            decoded = self.entries[pc] = decode(self.read_word(pc), self.rom)
+        return decoded
+
+    def invalidate(self, instr_mem: Buffer | None = None, base: int | None = None) -> None:
+        """Drops every cached entry, optionally switching to new instruction memory."""
+        if instr_mem is not None:
+            self.set_memory(instr_mem, self.base if base is None else base)
+        self.entries.clear()
@@ -0,0 +1,147 @@
+"""Memory-mapped I/O devices (see `AddressMap` in machine/memory.py)."""
+
+from __future__ import annotations
+
+import sys
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from typing import IO
+
+from machine.alu import to_signed32
+from machine.memory import MemoryFault
+
+# Default MMIO addresses of the standard devices
+MMIO_INPUT = 0x1
+MMIO_OUTPUT = 0x2
+
+
+class Device:
+    """
+    A memory-mapped device.
+
+    Accesses are routed to the device by their start address; `width` is 4 for
+    lw/sw and 1 for lb/sb. Loads return the value as it is written to rd.
+    """
+
+    def load(self, address: int, width: int) -> int:
+        raise MemoryFault(address, width, "load")
+
+    def store(self, address: int, width: int, value: int) -> None:
+        raise MemoryFault(address, width, "store")
+
+
+class InputDevice(Device):
+    """
+    Every load consumes the next input value; 0 once the input is exhausted.
+
+    Values are pulled one at a time from `source` (any iterator, e.g. `read_bytes` or
+    `read_words` over a file), so the input is never loaded up front; `pending` holds
+    values pushed back in front of it. `consumed` counts the values delivered so far,
+    `position` the values taken from `source` (where a checkpoint resumes the input).
+    """
+
+    def __init__(self, values: Iterable[int] = ()) -> None:
+        self.source: Iterator[int] = iter(values)
+        self.pending: deque[int] = deque()
+        self.consumed: int = 0
+        self.position: int = 0
+
+    def load(self, address: int, width: int) -> int:
+        value: int | None
+        if self.pending:
+            value = self.pending.popleft()
+        else:
+            value = next(self.source, None)
+            if value is None:
+                return 0
+            self.position += 1
+        self.consumed += 1
+        return to_signed32(value)
+
+    def push_back(self, values: Iterable[int]) -> None:
+        """Makes `values` the next ones read, ahead of the rest of the input."""
+        self.pending.extendleft(reversed(list(values)))
+
+
+def read_bytes(f: IO[bytes], chunk_size: int = 1 << 16) -> Iterator[int]:
+    """Yields the bytes of `f` and a terminating 0, unless the input already ends with one."""
+    with f:
+        # read1 returns what is available instead of waiting for a full chunk (stdin)
+        read = getattr(f, "read1", f.read)
+        last: int | None = None
+        while chunk := read(chunk_size):
+            yield from chunk
+            last = chunk[-1]
+    if last != 0:
+        yield 0
+
+
+def read_words(f: IO[str]) -> Iterator[int]:
+    """Yields the integers of a text file with one number per line (blank lines skipped)."""
+    with f:
+        for line in f:
+            line = line.strip()
+            if line == "":
+                continue
+            try:
+                yield int(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid number in input file: {e}") from e
+
+
+def open_input(path: str, as_words: bool = False) -> Iterator[int]:
+    """Opens `path` (`-` for stdin) as a lazily read stream of input values."""
+    if path == "-":
+        # a separate file object over fd 0, so finishing the input does not close stdin
+        fd: int | str = sys.stdin.fileno()
+        closefd: bool = False
+    else:
+        fd, closefd = path, True
+    if as_words:
+        return read_words(open(fd, closefd=closefd))  # noqa: SIM115 -- closed by the reader
+    return read_bytes(open(fd, "rb", closefd=closefd))  # noqa: SIM115
+
+
+class OutputDevice(Device):
+    """
+    `sb` outputs a character, `sw` a number.
+
+    Every value is written to `stream` (if any) as it is produced: characters as they
+    are, numbers in decimal followed by a newline; `listener` (if any) is called with the
+    same text. Only the last `tail_size` values are kept in `tail` (all of them if None),
+    as one-character strings for characters and ints for numbers; `count` and `chars`
+    count everything ever output.
+    """
+
+    def __init__(self, stream: IO[str] | None = None, tail_size: int | None = None) -> None:
+        self.stream: IO[str] | None = stream
+        self.listener: Callable[[str], None] | None = None
+        self.tail: deque[int | str] = deque(maxlen=tail_size)
+        self.count: int = 0
+        self.chars: int = 0
+
+    def store(self, address: int, width: int, value: int) -> None:
+        self.count += 1
+        if width == 1:
+            text: str = chr(value & 0xFF)
+            self.chars += 1
+            self.tail.append(text)
+        else:
+            self.tail.append(value)
+            if self.stream is None and self.listener is None:
+                return
+            text = f"{value}\n"
+        if self.stream is not None:
+            self.stream.write(text)
+        if self.listener is not None:
+            self.listener(text)
+
+    def render(self) -> str:
+        """The kept output: numbers one per line if there were only numbers, else joined."""
+        if self.chars == 0:
+            return "\n".join(str(x) for x in self.tail)
+        return "".join(str(x) for x in self.tail)
+
+    def flush(self) -> None:
+        if self.stream is not None:
+            self.stream.flush()
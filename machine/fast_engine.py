@@ -0,0 +1,190 @@
+"""Functional execution engine: runs whole instructions instead of microinstructions."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+
+from machine.alu import ALU, Operation
+from machine.decoder import DecodedInstruction
+from machine.isa import INSTRUCTION_SET
+from machine.machine import CPU, memory_read, memory_write, should_jump
+from machine.microcode import MicroInstruction
+
+Handler = Callable[[CPU, DecodedInstruction], None]
+
+
+class FastEngine:
+    """
+    Executes one ISA instruction per dispatch, bypassing the microcode sequencer.
+
+    After every instruction the architectural state (PC, IR, registers, flags, ALU_OUT,
+    data memory, I/O buffers) is the same as after the microcode engine returns to FETCH,
+    and each instruction is charged FETCH + DECODE + the length of its microprogram in
+    the ROM, so tick counts match too. Nothing is written to the trace: the microcode
+    engine stays the reference for cycle-accurate traces.
+    """
+
+    def __init__(self, cpu: CPU) -> None:
+        self.cpu = cpu
+        # microprogram start address -> (handler, ticks per instruction)
+        self.handlers: dict[int, tuple[Handler, int]] = {}
+        for start, name in cpu.microcode_rom.entry_names.items():
+            program: list[MicroInstruction] = cpu.microcode_rom.microprogram(start)
+            handler: Handler = make_handler(name, start, program, cpu.alu)
+            self.handlers[start] = (handler, 2 + len(program))
+
+    def step(self) -> int:
+        """Executes a single instruction and returns the number of ticks it took."""
+        cpu = self.cpu
+        pc: int = cpu.pc
+        executed: dict[int, int] = cpu.perf.executed
+        executed[pc] = executed.get(pc, 0) + 1
+        decoded: DecodedInstruction = cpu.decode_cache.fetch(pc)
+        cpu.decoded = decoded
+        cpu.ir = decoded.word
+        cpu.pc = pc + 4
+
+        mpc: int | None = decoded.mpc
+        if mpc is None:
+            # no match in the decode table: let the ROM report the unsupported instruction
+            mpc = cpu.microcode_rom.get_decode_address(
+                decoded.opcode, decoded.funct3, decoded.funct7
+            )
+
+        handler, ticks = self.handlers[mpc]
+        handler(cpu, decoded)
+        cpu.ticks += ticks
+        return ticks
+
+    def run(self, max_ticks: int, stop_at: frozenset[int] = frozenset()) -> None:
+        """
+        Runs until halt, until more than `max_ticks` ticks have been spent, or until the
+        next instruction is at a PC in `stop_at`.
+        """
+        cpu = self.cpu
+        step = self.step
+        if stop_at:
+            while cpu.running and cpu.pc not in stop_at:
+                step()
+                if cpu.ticks > max_ticks:
+                    break
+            return
+        while cpu.running:
+            step()
+            if cpu.ticks > max_ticks:
+                break
+
+
+def set_flags(cpu: CPU, value: int) -> None:
+    cpu.flags["Z"] = int(value == 0)
+    cpu.flags["N"] = int(value < 0)
+
+
+def make_handler(name: str, start: int, program: list[MicroInstruction], alu: ALU) -> Handler:
+    """Builds the instruction-level equivalent of the microprogram for `name`."""
+    typ: str = INSTRUCTION_SET[name]["type"]
+    # ALU operations in the order the microprogram uses them
+    ops: list[Operation] = [alu.table[mi.alu_op] for mi in program if mi.alu_op is not None]
+
+    if typ == "R":
+        (alu_r,) = ops
+
+        def exec_r(cpu: CPU, d: DecodedInstruction) -> None:
+            out: int = alu_r(cpu.registers[d.rs1], cpu.registers[d.rs2])
+            cpu.alu_out = out
+            set_flags(cpu, out)
+            if d.rd != 0:
+                cpu.registers[d.rd] = out
+
+        return exec_r
+
+    if name in ("lw", "lb"):
+        (address,) = ops
+
+        def exec_load(cpu: CPU, d: DecodedInstruction) -> None:
+            cpu.alu_out = address(cpu.registers[d.rs1], d.imm)
+            memory_read(cpu)
+
+        return exec_load
+
+    if name == "jalr":
+        (target,) = ops
+
+        def exec_jalr(cpu: CPU, d: DecodedInstruction) -> None:
+            # same order as the microprogram: link first, then read rs1 (it may be rd)
+            if d.rd != 0:
+                cpu.registers[d.rd] = cpu.pc
+            cpu.pc -= 4
+            cpu.alu_out = target(cpu.registers[d.rs1], d.imm)
+            cpu.pc = cpu.alu_out
+
+        return exec_jalr
+
+    if typ == "I":
+        (alu_i,) = ops
+
+        def exec_i(cpu: CPU, d: DecodedInstruction) -> None:
+            out: int = alu_i(cpu.registers[d.rs1], d.imm)
+            cpu.alu_out = out
+            set_flags(cpu, out)
+            if d.rd != 0:
+                cpu.registers[d.rd] = out
+
+        return exec_i
+
+    if typ == "S":
+        store_byte: bool = program[-1].store_byte
+        (store_address,) = ops
+
+        def exec_store(cpu: CPU, d: DecodedInstruction) -> None:
+            cpu.alu_out = store_address(cpu.registers[d.rs1], d.imm)
+            memory_write(cpu, store_byte)
+
+        return exec_store
+
+    if typ == "B":
+        condition: str | None = program[-1].jump_if
+        compare, offset = ops
+
+        def exec_branch(cpu: CPU, d: DecodedInstruction) -> None:
+            set_flags(cpu, compare(cpu.registers[d.rs1], cpu.registers[d.rs2]))
+            pc: int = cpu.pc - 4
+            cpu.alu_out = offset(pc, d.imm)
+            if should_jump(cpu, condition):
+                taken: dict[int, int] = cpu.perf.taken
+                taken[pc] = taken.get(pc, 0) + 1
+                cpu.pc = cpu.alu_out
+
+        return exec_branch
+
+    if typ == "U":
+        (upper,) = ops
+
+        def exec_lui(cpu: CPU, d: DecodedInstruction) -> None:
+            cpu.alu_out = upper(0, d.imm)
+            if d.rd != 0:
+                cpu.registers[d.rd] = cpu.alu_out
+
+        return exec_lui
+
+    if typ == "J":
+        link, jump = ops
+
+        def exec_jal(cpu: CPU, d: DecodedInstruction) -> None:
+            cpu.alu_out = link(cpu.pc - 4, 4)
+            if d.rd != 0:
+                cpu.registers[d.rd] = cpu.alu_out
+            cpu.alu_out = jump(cpu.pc - 4, d.imm)
+            cpu.pc = cpu.alu_out
+
+        return exec_jal
+
+    if typ == "SYS":
+
+        def exec_halt(cpu: CPU, d: DecodedInstruction) -> None:
+            cpu.mpc = start  # the microcode engine stops on the HALT microinstruction
+            cpu.running = False
+
+        return exec_halt
+
+    raise ValueError(f"Unsupported instruction type: {typ}")
@@ -0,0 +1,136 @@
+"""Program images: what the translator produces and the machine loads."""
+
+from __future__ import annotations
+
+import bisect
+import mmap
+from dataclasses import dataclass, field
+
+from machine.decoder import Buffer
+
+# Symbol kinds in .sym files, as printed by nm
+SYMBOL_KINDS = {".text": "T", ".data": "D", "": "A"}
+SYMBOL_SECTIONS = {kind: section for section, kind in SYMBOL_KINDS.items()}
+
+
+def load_binary(path: str) -> Buffer:
+    # Mapped read-only instead of read: the CPU fetches from the page cache directly
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return b""  # empty files cannot be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_listing(path: str) -> dict[int, str]:
+    """Address: source line, from a .text.log listing."""
+    listing: dict[int, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            # 00000100(int 256) - 00430313 - 0000...0011 - addi t1, t1, msg
+            address, _, _, source = line.rstrip("\n").split(" - ", 3)
+            listing[int(address[:8], 16)] = source
+    return listing
+
+
+def read_symbols(path: str) -> dict[str, tuple[str, int]]:
+    """Label: (section, address), from a .sym file."""
+    symbols: dict[str, tuple[str, int]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            address, kind, label = line.split()
+            symbols[label] = (SYMBOL_SECTIONS.get(kind, ""), int(address, 16))
+    return symbols
+
+
+def parse_location(location: str, symbols: dict[str, tuple[str, int]]) -> int:
+    """The address of `label`, `label+0x8` or a number (`0x188`, `392`)."""
+    label, plus, offset = location.partition("+")
+    try:
+        if label in symbols:
+            return symbols[label][1] + (int(offset, 0) if plus else 0)
+        return int(location, 0)
+    except ValueError:
+        raise ValueError(f"Unknown label or address `{location}`") from None
+
+
+class Labels:
+    """The labels of one section of a program, sorted by address, to name addresses by."""
+
+    def __init__(self, symbols: dict[str, tuple[str, int]], section: str = ".text") -> None:
+        labels = sorted(
+            (address, label) for label, (where, address) in symbols.items() if where == section
+        )
+        self.addresses: list[int] = [address for address, _ in labels]
+        self.names: list[str] = [label for _, label in labels]
+
+    def location(self, address: int) -> str:
+        """`label+0x8` for the nearest label at or before `address`, the address if none."""
+        i: int = bisect.bisect_right(self.addresses, address) - 1
+        if i < 0:
+            return f"{address:#06x}"
+        offset: int = address - self.addresses[i]
+        return self.names[i] if offset == 0 else f"{self.names[i]}+{offset:#x}"
+
+    def at(self, address: int) -> str | None:
+        """The label at exactly `address`, if any."""
+        i: int = bisect.bisect_left(self.addresses, address)
+        if i < len(self.addresses) and self.addresses[i] == address:
+            return self.names[i]
+        return None
+
+
+@dataclass(slots=True)
+class Image:
+    """
+    An assembled program.
+
+    `text` holds the instruction words placed at address `entry` (which is also the
+    initial PC), `data` the initial contents of data memory. `text_log` and `data_log`
+    are the listings the translator writes next to the binaries, `symbols` maps every
+    label to its section (".text", ".data", or "" outside both) and address.
+    """
+
+    text: Buffer
+    data: Buffer
+    entry: int
+    text_log: str = ""
+    data_log: str = ""
+    symbols: dict[str, tuple[str, int]] = field(default_factory=dict)
+
+    def text_bin(self) -> bytes:
+        """Contents of the .text.bin file: the entry address, then the instructions."""
+        return self.entry.to_bytes(4, "little") + bytes(self.text)
+
+    @classmethod
+    def load(cls, text_path: str, data_path: str) -> Image:
+        """Maps a .text.bin/.data.bin pair without copying it."""
+        text_image: Buffer = load_binary(text_path)
+        entry: int = int.from_bytes(text_image[:4], "little")
+        # Instructions stay in the mapped file; the CPU fetches them at entry onwards
+        return cls(memoryview(text_image)[4:], load_binary(data_path), entry)
+
+    def symbol_table(self) -> str:
+        """Contents of the .sym file: `address kind label` lines in address order, like nm."""
+        return "".join(
+            f"{address:08X} {SYMBOL_KINDS[section]} {label}\n"
+            for label, (section, address) in sorted(
+                self.symbols.items(), key=lambda item: (item[1][1], item[0])
+            )
+        )
+
+    def write(self, target_path: str) -> None:
+        """Writes `<target_path>.text.bin`, `.data.bin`, `.text.log`, `.data.log` and `.sym`."""
+        with open(target_path + ".text.bin", "wb") as f:
+            f.write(self.text_bin())
+
+        with open(target_path + ".data.bin", "wb") as f:
+            f.write(self.data)
+
+        with open(target_path + ".text.log", "w", encoding="utf-8") as f:
+            f.write(self.text_log)
+
+        with open(target_path + ".data.log", "w", encoding="utf-8") as f:
+            f.write(self.data_log)
+
+        with open(target_path + ".sym", "w", encoding="utf-8") as f:
+            f.write(self.symbol_table())
@@ -0,0 +1,340 @@
+"""Basic-block translation engine: compiles straight-line code to Python functions."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import cast
+
+from machine.alu import Operation, op_add, op_and, op_mul, op_or, op_sub, op_xor, to_signed32
+from machine.decoder import DecodedInstruction
+from machine.fast_engine import FastEngine
+from machine.isa import INSTRUCTION_SET
+from machine.machine import CPU
+from machine.memory import PAGE_BITS, PageEntry
+from machine.microcode import MicroInstruction
+
+MAX_BLOCK_LENGTH = 64  # instructions; keeps the generated functions small
+
+# ALU operations emitted inline (with the 32-bit wrap-around check where needed);
+# everything else is called through the ALU table
+INLINE_WRAPPED: dict[Operation, str] = {op_add: "+", op_sub: "-", op_mul: "*"}
+INLINE_BITWISE: dict[Operation, str] = {op_and: "&", op_or: "|", op_xor: "^"}
+
+# should_jump() conditions on the result of the compare (sub) step
+BRANCH_TESTS: dict[str, str] = {"Z": "== 0", "NZ": "!= 0", "GT": "> 0", "LE": "<= 0"}
+
+
+@dataclass(slots=True, eq=False)
+class Block:
+    """
+    A compiled basic block.
+
+    `fn(cpu)` runs the whole block and leaves the CPU at the next instruction boundary.
+    It returns True when it stopped early in front of an MMIO access or a memory access
+    the inline code does not handle (unaligned or out of range): that instruction is
+    left for the interpreter. `runs` counts the calls and `stops` the early returns by
+    the PC they stopped at, until `JitEngine.retire_counts()` adds them to `cpu.perf`.
+    """
+
+    pc: int
+    fn: Callable[[CPU], bool | None]
+    ticks: int  # ticks of a run through the whole block
+    length: int  # instructions
+    source: str
+    exits: dict[int, Block] = field(default_factory=dict)  # chained successors by PC
+    runs: int = 0
+    stops: dict[int, int] = field(default_factory=dict)
+
+
+class JitEngine:
+    """
+    Runs programs as chained basic blocks.
+
+    A block is a straight-line run of instructions ending at a branch, jal, jalr or halt.
+    Each block is translated to Python source once, compiled with `compile()` and cached
+    by its start PC; after a block finishes, the engine follows the link to its successor
+    (resolved once per exit PC). State and tick counts match `FastEngine` instruction for
+    instruction; MMIO accesses, unaligned or out-of-range memory accesses, the last
+    partial block before the tick budget runs out and blocks holding a PC to stop at are
+    executed by the `FastEngine` interpreter.
+    """
+
+    def __init__(self, cpu: CPU) -> None:
+        self.cpu = cpu
+        self.interpreter: FastEngine = FastEngine(cpu)
+        self.blocks: dict[int, Block] = {}
+
+    def block_at(self, pc: int) -> Block:
+        block: Block | None = self.blocks.get(pc)
+        if block is None:
+            block = self.blocks[pc] = translate_block(self.cpu, pc)
+        return block
+
+    def run(self, max_ticks: int, stop_at: frozenset[int] = frozenset()) -> None:
+        """
+        Runs until halt, until more than `max_ticks` ticks have been spent, or until the
+        next instruction is at a PC in `stop_at`.
+        """
+        try:
+            self.run_blocks(max_ticks, stop_at)
+        finally:
+            self.retire_counts()
+
+    def run_blocks(self, max_ticks: int, stop_at: frozenset[int]) -> None:
+        cpu = self.cpu
+        step = self.interpreter.step
+        # whether a block holds a PC of `stop_at`, for this run
+        stopping: dict[Block, bool] = {}
+        if not cpu.running:
+            return
+
+        block: Block = self.block_at(cpu.pc)
+        while True:
+            stops_inside: bool | None = False
+            if stop_at:
+                stops_inside = stopping.get(block)
+                if stops_inside is None:
+                    end: int = block.pc + 4 * block.length
+                    stops_inside = stopping[block] = not stop_at.isdisjoint(range(block.pc, end, 4))
+
+            if stops_inside or cpu.ticks + block.ticks > max_ticks:
+                # one instruction at a time, to the end of the block or the first jump: the
+                # interpreter stops at the same instruction as the other engines
+                for _ in range(max(block.length, 1)):
+                    pc: int = cpu.pc
+                    if pc in stop_at:
+                        return
+                    step()
+                    if not cpu.running or cpu.ticks > max_ticks:
+                        return
+                    if cpu.pc != pc + 4:
+                        break
+                block = self.block_at(cpu.pc)
+                continue
+
+            block.runs += 1
+            if block.fn(cpu):
+                stops: dict[int, int] = block.stops
+                stops[cpu.pc] = stops.get(cpu.pc, 0) + 1
+                step()  # MMIO or slow-path memory access: executed by the interpreter
+            if not cpu.running:
+                return
+
+            pc = cpu.pc
+            successor: Block | None = block.exits.get(pc)
+            if successor is None:
+                successor = block.exits[pc] = self.block_at(pc)
+            block = successor
+
+    def retire_counts(self) -> None:
+        """Adds the instructions run by compiled blocks to `cpu.perf.executed`."""
+        executed: dict[int, int] = self.cpu.perf.executed
+        for block in self.blocks.values():
+            remaining: int = block.runs
+            for pc in range(block.pc, block.pc + 4 * block.length, 4):
+                remaining -= block.stops.get(pc, 0)  # left to the interpreter from here on
+                if remaining:
+                    executed[pc] = executed.get(pc, 0) + remaining
+            block.runs = 0
+            block.stops.clear()
+
+
+def translate_block(cpu: CPU, start: int) -> Block:
+    """Collects the basic block starting at `start` and compiles it."""
+    rom = cpu.microcode_rom
+    instructions: list[tuple[int, DecodedInstruction, str, list[MicroInstruction]]] = []
+    pc: int = start
+    while len(instructions) < MAX_BLOCK_LENGTH:
+        decoded: DecodedInstruction = cpu.decode_cache.fetch(pc)
+        if decoded.mpc is None or decoded.mpc not in rom.entry_names:
+            break  # left to the interpreter, which reports the error
+        name: str = rom.entry_names[decoded.mpc]
+        instructions.append((pc, decoded, name, rom.microprogram(decoded.mpc)))
+        pc += 4
+        if name == "jalr" or INSTRUCTION_SET[name]["type"] in ("B", "J", "SYS"):
+            break
+
+    return BlockCompiler(cpu, start, instructions).compile()
+
+
+class BlockCompiler:
+    """Generates the Python source of one block."""
+
+    def __init__(
+        self,
+        cpu: CPU,
+        start: int,
+        instructions: list[tuple[int, DecodedInstruction, str, list[MicroInstruction]]],
+    ) -> None:
+        self.cpu = cpu
+        self.start = start
+        self.instructions = instructions
+        self.lines: list[str] = []
+        self.namespace: dict[str, object] = {"to_signed32": to_signed32, "taken": cpu.perf.taken}
+        # names of the sets of pages with load and store devices, if there are any
+        self.load_pages: str | None = self.page_set("load_pages", cpu.address_map.load_pages)
+        self.store_pages: str | None = self.page_set("store_pages", cpu.address_map.store_pages)
+        self.ticks: int = 0  # ticks of the instructions emitted so far
+        # expressions holding the latest ALU_OUT and flag-setting result, if any
+        self.alu_out: str | None = None
+        self.flags_from: str | None = None
+
+    def page_set(self, name: str, pages: dict[int, PageEntry]) -> str | None:
+        if not pages:
+            return None
+        self.namespace[name] = frozenset(pages)
+        return name
+
+    def emit(self, line: str, indent: int = 1) -> None:
+        self.lines.append("    " * indent + line)
+
+    def emit_alu(self, target: str, operation: Operation, a: str, b: str) -> None:
+        if operation in INLINE_WRAPPED:
+            self.emit(f"{target} = {a} {INLINE_WRAPPED[operation]} {b}")
+            self.emit(f"if not -0x80000000 <= {target} <= 0x7FFFFFFF:")
+            self.emit(f"{target} = to_signed32({target})", 2)
+        elif operation in INLINE_BITWISE:
+            self.emit(f"{target} = {a} {INLINE_BITWISE[operation]} {b}")
+        else:
+            name: str = f"op_{operation.__name__}"
+            self.namespace[name] = operation
+            self.emit(f"{target} = {name}({a}, {b})")
+
+    def emit_commit(self, next_pc: str, index: int, indent: int = 1) -> None:
+        """Writes back the state after the first `index` instructions of the block."""
+        self.emit(f"cpu.pc = {next_pc}", indent)
+        if index > 0:
+            self.emit(f"cpu.ir = {self.instructions[index - 1][1].word}", indent)
+            self.emit(f"cpu.decoded = D{index - 1}", indent)
+        if self.alu_out is not None:
+            self.emit(f"cpu.alu_out = {self.alu_out}", indent)
+        if self.flags_from is not None:
+            self.emit(f'flags["Z"] = int({self.flags_from} == 0)', indent)
+            self.emit(f'flags["N"] = int({self.flags_from} < 0)', indent)
+        if self.ticks:
+            self.emit(f"cpu.ticks += {self.ticks}", indent)
+
+    def slow_access(self, address: str, width: int, device_pages: str | None) -> str:
+        """
+        The condition under which a memory access is left to the interpreter: the
+        inline fast paths only cover in-range accesses (aligned ones for words) to pages
+        without devices.
+        """
+        memory = self.cpu.memory
+        if width == 4:
+            condition: str = f"{address} & 3 or not 0 <= {address} < {memory.word_limit}"
+        else:
+            condition = f"not 0 <= {address} < {memory.size}"
+        if device_pages is not None:
+            condition += f" or {address} >> {PAGE_BITS} in {device_pages}"
+        return condition
+
+    def emit_slow_path_exit(self, condition: str, index: int, pc: int) -> None:
+        """Leaves the block in front of an access the inline fast path does not handle."""
+        self.emit(f"if {condition}:")
+        self.emit_commit(str(pc), index, 2)
+        self.emit("return True", 2)
+
+    def compile(self) -> Block:
+        if not self.instructions:
+            return self.finish(lambda cpu: True, "# no decodable instruction", 0)
+
+        next_pc: str = ""
+        for index, (pc, d, name, program) in enumerate(self.instructions):
+            self.namespace[f"D{index}"] = d
+            ops: list[Operation] = [
+                self.cpu.alu.table[mi.alu_op] for mi in program if mi.alu_op is not None
+            ]
+            typ: str = INSTRUCTION_SET[name]["type"]
+            v: str = f"v{index}"
+            next_pc = str(pc + 4)
+            self.emit(f"# {pc:#06x}: {name}")
+
+            if typ == "R" or (typ == "I" and name not in ("lw", "lb", "jalr")):
+                b: str = f"regs[{d.rs2}]" if typ == "R" else str(d.imm)
+                self.emit_alu(v, ops[0], f"regs[{d.rs1}]", b)
+                if d.rd != 0:
+                    self.emit(f"regs[{d.rd}] = {v}")
+                self.alu_out = self.flags_from = v
+
+            elif name in ("lw", "lb"):
+                self.emit_alu(v, ops[0], f"regs[{d.rs1}]", str(d.imm))
+                if name == "lw":
+                    self.emit_slow_path_exit(self.slow_access(v, 4, self.load_pages), index, pc)
+                    self.emit(f"regs[{d.rd}] = words[{v} >> 2]")
+                else:
+                    self.emit_slow_path_exit(self.slow_access(v, 1, self.load_pages), index, pc)
+                    self.emit(f"x = mem[{v}]")
+                    self.emit(f"regs[{d.rd}] = x - 0x100 if x & 0x80 else x")
+                self.alu_out = v
+
+            elif typ == "S":
+                self.emit_alu(v, ops[0], f"regs[{d.rs1}]", str(d.imm))
+                if program[-1].store_byte:
+                    self.emit_slow_path_exit(self.slow_access(v, 1, self.store_pages), index, pc)
+                    self.emit(f"mem[{v}] = regs[{d.rs2}] & 0xFF")
+                    self.emit(f"dirty[{v} >> {PAGE_BITS}] = 1")
+                else:
+                    self.emit_slow_path_exit(self.slow_access(v, 4, self.store_pages), index, pc)
+                    self.emit(f"words[{v} >> 2] = regs[{d.rs2}]")
+                    self.emit(f"dirty[{v} >> {PAGE_BITS}] = 1")
+                self.alu_out = v
+
+            elif typ == "B":
+                compare, offset = ops
+                self.emit_alu(v, compare, f"regs[{d.rs1}]", f"regs[{d.rs2}]")
+                target: int = offset(pc, d.imm)
+                test: str | None = BRANCH_TESTS.get(program[-1].jump_if or "")
+                if test is not None:
+                    self.emit(f"if {v} {test}:")
+                    self.emit(f"next_pc = {target}", 2)
+                    self.emit(f"taken[{pc}] = taken.get({pc}, 0) + 1", 2)
+                    self.emit("else:")
+                    self.emit(f"next_pc = {pc + 4}", 2)
+                    next_pc = "next_pc"
+                self.flags_from = v
+                self.alu_out = str(target)
+
+            elif typ == "J":
+                link, jump = ops
+                if d.rd != 0:
+                    self.emit(f"regs[{d.rd}] = {link(pc, 4)}")
+                next_pc = self.alu_out = str(jump(pc, d.imm))
+
+            elif name == "jalr":
+                # link first, then read rs1 (it may be rd), as the microprogram does
+                if d.rd != 0:
+                    self.emit(f"regs[{d.rd}] = {pc + 4}")
+                self.emit_alu(v, ops[0], f"regs[{d.rs1}]", str(d.imm))
+                next_pc = self.alu_out = v
+
+            elif typ == "U":
+                value: int = ops[0](0, d.imm)
+                if d.rd != 0:
+                    self.emit(f"regs[{d.rd}] = {value}")
+                self.alu_out = str(value)
+
+            elif typ == "SYS":
+                self.emit(f"cpu.mpc = {d.mpc}  # stopped on the HALT microinstruction")
+                self.emit("cpu.running = False")
+
+            self.ticks += 2 + len(program)
+
+        self.emit_commit(next_pc, len(self.instructions))
+        header: list[str] = [
+            "def block(cpu):",
+            "    regs = cpu.registers",
+            "    mem = cpu.data_mem",
+            "    words = cpu.memory.words",
+            "    dirty = cpu.memory.dirty",
+            "    flags = cpu.flags",
+        ]
+        source: str = "\n".join(header + self.lines) + "\n"
+        code = compile(source, f"<block {self.start:#06x}>", "exec")
+        exec(code, self.namespace)
+        fn = cast(Callable[[CPU], bool | None], self.namespace["block"])
+        return self.finish(fn, source, self.ticks)
+
+    def finish(self, fn: Callable[[CPU], bool | None], source: str, ticks: int) -> Block:
+        return Block(self.start, fn, ticks, len(self.instructions), source)
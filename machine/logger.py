@@ -2,43 +2,129 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from collections import deque
+from collections.abc import Callable
+from typing import IO, TYPE_CHECKING, Any
+
+from machine.binary_trace import MAGIC, encode_record, format_line
 
 if TYPE_CHECKING:  # for mypy
     from machine.machine import CPU
 
 import os
 
+TRACE_LEVELS = ("off", "instruction", "microstep")
+TRACE_FORMATS = ("text", "binary")
+
 
 class Logger:
-    """Logs the state of the CPU at each step."""
+    """
+    Logs the state of the CPU at each step.
+
+    Trace levels:
+        off         -- nothing is traced and no file is created;
+        instruction -- a line whenever PC changes (the format of the golden traces);
+        microstep   -- a line for every microinstruction.
+
+    Lines are buffered in memory and written out in chunks of `flush_every` lines. With
+    `ring_size` set, only the last `ring_size` lines are kept and they are written when
+    the run finishes (on halt or on error), which keeps long runs cheap while still
+    showing how they ended.
 
-    def __init__(self, cpu: CPU, log_dir: str = "log_output") -> None:
+    The `binary` format writes packed records to `trace.bin` instead of text lines to
+    `trace.log` (see machine/binary_trace.py, which also decodes them back to text).
+    """
+
+    def __init__(
+        self,
+        cpu: CPU,
+        log_dir: str = "log_output",
+        level: str = "instruction",
+        ring_size: int | None = None,
+        flush_every: int = 16384,
+        trace_format: str = "text",
+    ) -> None:
         """
         Initializes the Logger.
 
         Args:
             cpu: The CPU instance to monitor.
             log_dir: Directory to store log files.
+            level: One of TRACE_LEVELS.
+            ring_size: Keep only the last `ring_size` lines (None: keep everything).
+            flush_every: Number of buffered lines written to the file at once.
+            trace_format: One of TRACE_FORMATS.
         """
+        if level not in TRACE_LEVELS:
+            raise ValueError(f"Unknown trace level `{level}`, expected one of {TRACE_LEVELS}")
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(
+                f"Unknown trace format `{trace_format}`, expected one of {TRACE_FORMATS}"
+            )
+
         self.cpu = cpu
+        self.level: str = level
         self.last_pc: int = cpu.pc
         self.last_registers: list[int] = cpu.registers.copy()
+        self.flush_every: int = flush_every
+        self.binary: bool = trace_format == "binary"
+        # text lines or binary records
+        self.pending: list[Any] | deque[Any] = (
+            deque(maxlen=ring_size) if ring_size is not None else []
+        )
+        self.log_file: IO[Any] | None = None
 
-        os.makedirs(log_dir, exist_ok=True)
-        self.log_file = open(os.path.join(log_dir, "trace.log"), "w") # noqa: SIM115
+        if level != "off":
+            os.makedirs(log_dir, exist_ok=True)
+            if self.binary:
+                self.log_file = open(os.path.join(log_dir, "trace.bin"), "wb")  # noqa: SIM115
+                self.log_file.write(MAGIC)
+            else:
+                self.log_file = open(os.path.join(log_dir, "trace.log"), "w")  # noqa: SIM115
 
-    def _changed_registers(self) -> str:
+    def hook(self) -> Callable[[], None]:
+        """Returns the function the CPU calls before every microinstruction."""
+        if self.level == "microstep":
+            return self._log_state
+        if self.level == "instruction":
+            return self.log
+        return lambda: None
+
+    def _changed_registers(self) -> list[tuple[int, int]]:
         """
-        Compares current registers with the last logged state and returns a string
-        describing changes.
+        Returns (register, new value) for the registers written since the last logged
+        state whose value changed.
+
+        Only registers marked in `cpu.dirty_registers` (a bit per register, set by the
+        datapath on every write) are compared, instead of the whole register file.
         """
-        changes: list[str] = []
-        for i, (old, new) in enumerate(zip(self.last_registers, self.cpu.registers, strict=False)):
-            if old != new:
-                changes.append(f"r{i}={new:08X}({new})")
+        mask: int = self.cpu.dirty_registers
+        if not mask:
+            return []
+        self.cpu.dirty_registers = 0
+
+        changes: list[tuple[int, int]] = []
+        registers: list[int] = self.cpu.registers
+        last: list[int] = self.last_registers
+        while mask:
+            lowest: int = mask & -mask
+            mask ^= lowest
+            i: int = lowest.bit_length() - 1
+            new: int = registers[i]
+            if last[i] != new:
+                changes.append((i, new))
+                last[i] = new
+        return changes
+
+    def resync(self) -> None:
+        """
+        Continues the trace from the CPU's current state, after it was set rather than
+        reached (restoring a checkpoint, going back in time), instead of reporting all
+        of it as changes.
+        """
+        self.cpu.dirty_registers = 0
+        self.last_pc = self.cpu.pc
         self.last_registers = self.cpu.registers.copy()
-        return " ".join(changes)
 
     def log(self) -> None:
         """Logs the CPU state if the Program Counter (PC) has changed."""
@@ -47,16 +133,37 @@ class Logger:
             self.last_pc = self.cpu.pc
 
     def _log_state(self) -> None:
-        """Writes the current CPU state to the log file."""
-        reg_changes: str = self._changed_registers()
-        line: str = (
-            f"PC=0x{self.cpu.pc:08X}({self.cpu.pc}) "
-            f"MPC={self.cpu.mpc} "
-            f"NZ={self.cpu.flags['N']}{self.cpu.flags['Z']} "
-            f"IR=0x{self.cpu.ir:08X}({self.cpu.ir}) " + reg_changes
+        """Buffers a line (or a binary record) with the current CPU state."""
+        cpu = self.cpu
+        encode = encode_record if self.binary else format_line
+        self.pending.append(
+            encode(
+                cpu.pc,
+                cpu.mpc,
+                cpu.flags["N"],
+                cpu.flags["Z"],
+                cpu.ir,
+                self._changed_registers(),
+            )
         )
-        self.log_file.write(line + "\n")
+        if isinstance(self.pending, list) and len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered lines to the trace file."""
+        if self.log_file is None or not self.pending:
+            return
+        if self.binary:
+            self.log_file.write(b"".join(self.pending))
+        else:
+            self.log_file.write("\n".join(self.pending) + "\n")
+        self.log_file.flush()
+        self.pending.clear()
 
     def finish(self) -> None:
-        """Closes the log file."""
+        """Writes what is still buffered (the whole ring in ring mode) and closes the log file."""
+        if self.log_file is None:
+            return
+        self.flush()
         self.log_file.close()
+        self.log_file = None
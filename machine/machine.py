@@ -1,154 +1,299 @@
 
+import mmap
+from collections import deque
+from collections.abc import Callable
+from typing import IO
+
+from machine.alu import ALU
+from machine.decoder import Buffer, DecodeCache, DecodedInstruction, decode
+from machine.devices import MMIO_INPUT, MMIO_OUTPUT, InputDevice, OutputDevice, open_input
 from machine.logger import Logger
-from machine.microcode import MicrocodeROM, MicroInstruction
+from machine.memory import AddressMap, Memory
+from machine.microcode import IllegalInstruction, MicrocodeROM, MicroInstruction
+from machine.perf import PerfCounters
+
+DATA_MEMORY_SIZE = 64 * 1024
 
 
 class CPU:
-    def __init__(self, instr_mem: bytes, data_mem: bytes) -> None:
+    def __init__(
+        self,
+        instr_mem: Buffer,
+        data_mem: Buffer,
+        trace_level: str = "instruction",
+        trace_ring: int | None = None,
+        log_dir: str = "log_output",
+        trace_format: str = "text",
+        text_base: int = 0,
+        data_size: int = DATA_MEMORY_SIZE,
+        output_stream: IO[str] | None = None,
+        output_tail: int | None = None,
+    ) -> None:
+        """
+        `instr_mem` is the text image placed at address `text_base` (it is read in
+        place, not copied), `data_mem` the initial contents of the `data_size`-byte
+        data memory. Output is streamed to `output_stream`, and the last `output_tail`
+        values (all if None) are kept in `output_buffer`.
+        """
         self.pc: int = 0
         self.ir: int = 0
         self.mpc: int = 0
         self.registers: list[int] = [0] * 32
-        self.data_mem: bytearray = bytearray(1024 * 64)
-        self.instr_mem: bytes = instr_mem
+        self.dirty_registers: int = 0  # bit i set when register i is written (see Logger)
+        self.memory: Memory = Memory(data_size, data_mem)
+        self.data_mem: mmap.mmap = self.memory.data  # raw bytes of `memory`
+        # loads from MMIO_INPUT and stores to MMIO_OUTPUT; the other directions are RAM
+        self.input_device: InputDevice = InputDevice()
+        self.output_device: OutputDevice = OutputDevice(output_stream, output_tail)
+        self.address_map: AddressMap = AddressMap(self.memory)
+        self.address_map.map_device(MMIO_INPUT, MMIO_INPUT + 1, self.input_device, stores=False)
+        self.address_map.map_device(MMIO_OUTPUT, MMIO_OUTPUT + 1, self.output_device, loads=False)
         self.alu_out: int = 0
         self.flags: dict[str, int] = {"Z": 0, "N": 0}
-        self.output_buffer: list[int | str] = []
-        self.input_buffer: list[int] = []
         self.running: bool = True
+        self.ticks: int = 0
+        self.perf: PerfCounters = PerfCounters()
 
-        # Load initial data memory
-        self.data_mem[: len(data_mem)] = data_mem
-
-        self.cu: ControlUnit = ControlUnit()
         self.microcode_rom: MicrocodeROM = MicrocodeROM()
-        self.logger: Logger = Logger(self)
+        self.alu: ALU = self.microcode_rom.alu
+        self.cu: ControlUnit = ControlUnit(self.alu)
+        self.micro_ops: list[MicroOp] = self.microcode_rom.compile(self.cu.compile)
+        self.decode_cache: DecodeCache = DecodeCache(instr_mem, self.microcode_rom, text_base)
+        self.decoded: DecodedInstruction = decode(0, self.microcode_rom)
+        self.logger: Logger = Logger(self, log_dir, trace_level, trace_ring, trace_format=trace_format)
+        self.log_step: Callable[[], None] = self.logger.hook()
+
+    @property
+    def output_buffer(self) -> deque[int | str]:
+        return self.output_device.tail
+
+    @property
+    def instr_mem(self) -> Buffer:
+        return self.decode_cache.instr_mem
+
+    @instr_mem.setter
+    def instr_mem(self, instr_mem: Buffer) -> None:
+        # Predecoded entries describe the old memory contents
+        self.decode_cache.invalidate(instr_mem)
 
     def load_input_file(self, filename: str, as_words: bool = False) -> None:
         """
-        Loads input data into the input buffer.
+        Connects the input device to a file (`-` for stdin).
 
-        If as_words is False, reads the file as raw bytes (byte-by-byte).
+        If as_words is False, the file is fed byte by byte, followed by a 0 byte unless
+        it already ends with one.
         If as_words is True, treats the file as a text file with one integer per line,
         and parses each line into a 32-bit signed integer.
+
+        The file is read lazily, as the program consumes it.
         """
+        self.input_device.source = open_input(filename, as_words)
 
-        with open(filename, "rb") as f:
-            data = f.read()
+    def step(self) -> None:
+        """Executes one microinstruction, which is one tick (an instruction takes several)."""
+        self.log_step()
+        self.micro_ops[self.mpc](self)
+        self.ticks += 1
 
-        if as_words:
-            with open(filename) as f:
-                lines = f.readlines()
 
-            try:
-                self.input_buffer = [int(line.strip()) for line in lines if line.strip() != ""]
-            except ValueError as e:
-                raise ValueError(f"Invalid number in input file: {e}") from e
+MicroOp = Callable[[CPU], None]
 
-        else:
-            with open(filename, "rb") as f:
-                data = f.read()
-            if not data.endswith(b"\x00"):
-                data += b"\x00"
-            self.input_buffer = list(data)
 
-    # TODO: `step` and `tick` should be renamed or be the same for easier understanding
-    def step(self) -> None:
-        microinstr: MicroInstruction = self.microcode_rom[self.mpc]
-        self.logger.log()
-        self.cu.execute(self, microinstr)
+class ControlUnit:
+    """
+    Turns microinstructions into specialized callables.
 
+    The ROM is fixed once it is filled, so every microinstruction is compiled once into a
+    closure that performs only its active datapath actions (with the ALU operation already
+    resolved to a function); the CPU then dispatches through a flat list indexed by MPC.
+    """
 
-class ControlUnit:
-    def execute(self, cpu: CPU, mi: MicroInstruction) -> None:
-        if cpu.mpc == 1000:
+    def __init__(self, alu: ALU) -> None:
+        self.alu: ALU = alu
+
+    def compile(self, mpc: int, mi: MicroInstruction) -> MicroOp:
+        if mpc == 1000:
             """======= DECODE DISPATCH ======="""
-            # Dispatch to correct microprogram start address
-            opcode: int = cpu.ir & 0x7F
-            funct3_decode: int | None = (cpu.ir >> 12) & 0x7
-            funct7: int | None = (cpu.ir >> 25) & 0x7F
-            mpc_new: int = cpu.microcode_rom.get_decode_address(opcode, funct3_decode, funct7)
-            cpu.mpc = mpc_new
-            return
+            return decode_dispatch
 
         if mi.halt:
-            cpu.running = False
-            return
+            return halt
+
+        actions: list[MicroOp] = []
 
         # Instruction Fetch
         if mi.latch_ir:
-            word: int = int.from_bytes(cpu.instr_mem[cpu.pc : cpu.pc + 4], "little")
-            cpu.ir = word
+            actions.append(fetch)
 
         # === ALU stage must happen before PC update ===
         if mi.latch_alu:
-            a, b = extract_operands(cpu, mi)
-            cpu.alu_out = ALU.exec(mi.latch_alu, a, b)
-
-            if mi.set_flags:
-                cpu.flags["Z"] = int(cpu.alu_out == 0)
-                cpu.flags["N"] = int(cpu.alu_out < 0)
+            assert mi.alu_op is not None
+            actions.append(alu_stage(mi, self.alu.table[mi.alu_op]))
 
         if mi.latch_pc == "inc":
-            cpu.pc += 4
-        elif mi.latch_pc == "alu" or (mi.latch_pc == "branch" and should_jump(cpu, mi.jump_if)):
-            cpu.pc = cpu.alu_out
+            actions.append(pc_inc)
+        elif mi.latch_pc == "alu":
+            actions.append(pc_from_alu)
+        elif mi.latch_pc == "branch":
+            actions.append(pc_branch(mi.jump_if))
 
         if mi.mem_read:
-            rd_read: int = (cpu.ir >> 7) & 0x1F
-            addr_read: int = cpu.alu_out
-            funct3_mem: int = (cpu.ir >> 12) & 0x7
-
-            if addr_read == 0x1:
-                value: int = cpu.input_buffer.pop(0) if cpu.input_buffer else 0
-
-            else:
-                if funct3_mem == 0b000:  # lw
-                    value = int.from_bytes(cpu.data_mem[addr_read : addr_read + 4], "little")
-                elif funct3_mem == 0b001:  # lb
-                    value = cpu.data_mem[addr_read]
-                    if value & 0x80:  # sign-extend
-                        value |= -1 << 8
-                else:
-                    raise ValueError(f"Unsupported funct3 for mem_read: {funct3_mem:03b}")
-
-            cpu.registers[rd_read] = value & 0xFFFFFFFF
-
-        # FIXME: solve the output buffer at 0x2 hardcoded problem
+            actions.append(memory_read)
+
         if mi.mem_write:
-            addr_write: int = cpu.alu_out
-            val: int = cpu.registers[(cpu.ir >> 20) & 0x1F]  # rs2
-
-            # TODO: clean-up code. too much branching. works for now tho
-            # sb
-            if mi.store_byte:
-                val &= 0xFF
-                if addr_write == 0x2:
-                    cpu.output_buffer.append(chr(val))  # Output character
-                else:
-                    cpu.data_mem[addr_write] = val
-            # sw
-            else:
-                if addr_write == 0x2:
-                    cpu.output_buffer.append(int(val))
-                else:
-                    cpu.data_mem[addr_write : addr_write + 4] = val.to_bytes(4, "little")
+            actions.append(store_byte if mi.store_byte else store_word)
 
         # Register write back
         if mi.latch_reg == "rd":
-            rd_writeback_alu: int = (cpu.ir >> 7) & 0x1F  # rd = instr[11..7]
-            # if rd == 0 then the register isnt used. for example, in jal command
-            # jal r0, <label> essentialy works as goto <label>
-            if rd_writeback_alu != 0:
-                cpu.registers[rd_writeback_alu] = cpu.alu_out
+            actions.append(writeback_alu)
 
         if mi.latch_reg == "rd_pc":
-            rd_writeback_pc: int = (cpu.ir >> 7) & 0x1F  # rd in i-type. cringe but works for jalr
-            if rd_writeback_pc != 0:
-                cpu.registers[rd_writeback_pc] = cpu.pc
+            actions.append(writeback_pc)
+
+        return sequence(actions, mi.next_mpc)
+
+
+def sequence(actions: list[MicroOp], next_mpc: int | None) -> MicroOp:
+    """Chains the datapath actions of one microinstruction and the MPC update."""
+    if next_mpc is None:
+        return run_actions(actions)
+
+    if len(actions) == 1:
+        (action,) = actions
+
+        def single(cpu: CPU) -> None:
+            action(cpu)
+            cpu.mpc = next_mpc
+
+        return single
+
+    def chained(cpu: CPU) -> None:
+        for action in actions:
+            action(cpu)
+        cpu.mpc = next_mpc
+
+    return chained
+
+
+def run_actions(actions: list[MicroOp]) -> MicroOp:
+    def chained(cpu: CPU) -> None:
+        for action in actions:
+            action(cpu)
+
+    return chained
+
+
+def decode_dispatch(cpu: CPU) -> None:
+    # Dispatch to correct microprogram start address (resolved once per PC at fetch)
+    decoded: DecodedInstruction = cpu.decoded
+    mpc_new: int | None = decoded.mpc
+    if mpc_new is None:
+        # no match in the decode table: let the ROM report the unsupported instruction
+        mpc_new = cpu.microcode_rom.get_decode_address(
+            decoded.opcode, decoded.funct3, decoded.funct7
+        )
+    cpu.mpc = mpc_new
+
+
+def halt(cpu: CPU) -> None:
+    cpu.running = False
+
 
-        if mi.next_mpc is not None:
-            cpu.mpc = mi.next_mpc
+def fetch(cpu: CPU) -> None:
+    pc: int = cpu.pc
+    executed: dict[int, int] = cpu.perf.executed
+    executed[pc] = executed.get(pc, 0) + 1
+    cpu.decoded = cpu.decode_cache.fetch(pc)
+    cpu.ir = cpu.decoded.word
+
+
+def alu_stage(mi: MicroInstruction, operation: Callable[[int, int], int]) -> MicroOp:
+    if mi.set_flags:
+
+        def alu_with_flags(cpu: CPU) -> None:
+            a, b = extract_operands(cpu, mi)
+            cpu.alu_out = operation(a, b)
+            cpu.flags["Z"] = int(cpu.alu_out == 0)
+            cpu.flags["N"] = int(cpu.alu_out < 0)
+
+        return alu_with_flags
+
+    def alu(cpu: CPU) -> None:
+        a, b = extract_operands(cpu, mi)
+        cpu.alu_out = operation(a, b)
+
+    return alu
+
+
+def pc_inc(cpu: CPU) -> None:
+    cpu.pc += 4
+
+
+def pc_from_alu(cpu: CPU) -> None:
+    cpu.pc = cpu.alu_out
+
+
+def pc_branch(condition: str | None) -> MicroOp:
+    def branch(cpu: CPU) -> None:
+        if should_jump(cpu, condition):
+            taken: dict[int, int] = cpu.perf.taken
+            pc: int = cpu.pc - 4  # the branch, FETCH already moved the PC on
+            taken[pc] = taken.get(pc, 0) + 1
+            cpu.pc = cpu.alu_out
+
+    return branch
+
+
+def store_byte(cpu: CPU) -> None:
+    memory_write(cpu, True)
+
+
+def store_word(cpu: CPU) -> None:
+    memory_write(cpu, False)
+
+
+def writeback_alu(cpu: CPU) -> None:
+    rd_writeback_alu: int = cpu.decoded.rd  # rd = instr[11..7]
+    # if rd == 0 then the register isnt used. for example, in jal command
+    # jal r0, <label> essentialy works as goto <label>
+    if rd_writeback_alu != 0:
+        cpu.registers[rd_writeback_alu] = cpu.alu_out
+        cpu.dirty_registers |= 1 << rd_writeback_alu
+
+
+def writeback_pc(cpu: CPU) -> None:
+    rd_writeback_pc: int = cpu.decoded.rd  # rd in i-type. cringe but works for jalr
+    if rd_writeback_pc != 0:
+        cpu.registers[rd_writeback_pc] = cpu.pc
+        cpu.dirty_registers |= 1 << rd_writeback_pc
+
+
+def memory_read(cpu: CPU) -> None:
+    """Loads rd from the address in ALU_OUT (lw/lb) through the address map."""
+    rd_read: int = cpu.decoded.rd
+    addr_read: int = cpu.alu_out
+    funct3_mem: int = cpu.decoded.funct3
+
+    if funct3_mem == 0b000:  # lw
+        value: int = cpu.address_map.load_word(addr_read)
+    elif funct3_mem == 0b001:  # lb, sign-extended
+        value = cpu.address_map.load_byte(addr_read)
+    else:
+        raise IllegalInstruction(f"Unsupported funct3 for mem_read: {funct3_mem:03b}")
+
+    cpu.registers[rd_read] = value
+    cpu.dirty_registers |= 1 << rd_read
+
+
+def memory_write(cpu: CPU, store_byte: bool) -> None:
+    """Stores rs2 to the address in ALU_OUT (sw/sb) through the address map."""
+    addr_write: int = cpu.alu_out
+    val: int = cpu.registers[cpu.decoded.rs2]
+
+    if store_byte:
+        cpu.address_map.store_byte(addr_write, val)
+    else:
+        cpu.address_map.store_word(addr_write, val)
 
 
 def should_jump(cpu: CPU, condition: str | None) -> bool:
@@ -167,142 +312,39 @@ def should_jump(cpu: CPU, condition: str | None) -> bool:
 
 # that's tough man...
 def extract_operands(cpu: CPU, mi: MicroInstruction) -> tuple[int, int]:
-    ir: int = cpu.ir
-    opcode: int = ir & 0x7F
+    decoded: DecodedInstruction = cpu.decoded
+    opcode: int = decoded.opcode
 
     if opcode == 0x33:
-        return extract_operands_r(cpu, ir)
+        return cpu.registers[decoded.rs1], cpu.registers[decoded.rs2]
 
     elif opcode in (0x13, 0x03):  # I-type: addi, lw, jalr
-        return extract_operands_i(cpu, ir)
+        return cpu.registers[decoded.rs1], decoded.imm
     elif opcode == 0x67:  # jalr
         cpu.pc -= 4  # to work with current pc
-        return extract_operands_i(cpu, ir)
+        return cpu.registers[decoded.rs1], decoded.imm
 
     elif opcode == 0x23:  # S-type: sw
-        return extract_operands_s(cpu, ir)
+        return cpu.registers[decoded.rs1], decoded.imm
 
     elif opcode == 0x63:  # B-type: beq, etc.
-        first, second, imm = extract_operands_b(cpu, ir)
         # cpu.pc -= 4  # to work with current pc
         if mi.latch_alu == "branch_offset":
             return (
                 cpu.pc - 4,
-                imm,
+                decoded.imm,
             )  # pc -4 cuz at this point, pc points to the NEXT instruction, not current. OMFG I LOST 10+ HOURS ON THIG BUG BRO
         else:
-            return first, second
+            return cpu.registers[decoded.rs1], cpu.registers[decoded.rs2]
 
     elif opcode == 0x6F:  # J-type: jal
         # cpu.pc -= 4  # to work with current pc (cur pc is incremented after FETCH phase)
         if mi.latch_alu == "jal_link":
             return cpu.pc - 4, 4
         elif mi.latch_alu == "jal_offset":
-            return extract_operands_j(cpu, ir)
+            return cpu.pc - 4, decoded.imm
 
     elif opcode == 0x37:  # U-type: lui
-        return extract_operands_u(cpu, ir)
-
-    raise ValueError(f"Unsupported opcode {opcode:#x} in extract_operands")
-
-
-def extract_operands_r(cpu: CPU, ir: int) -> tuple[int, int]:
-    rs1: int = (ir >> 15) & 0x1F
-    rs2: int = (ir >> 20) & 0x1F
-    return cpu.registers[rs1], cpu.registers[rs2]
-
-
-# def extract_regs_i(cpu: CPU, ir: int) -> Tuple[int, int]:
-#     rd = (ir >> 7) & 0x1F
-#     rs1 = (ir >> 15) & 0x1F
-#     return cpu.registers[rs1], rd
-
-
-def extract_operands_i(cpu: CPU, ir: int) -> tuple[int, int]:
-    rs1: int = (ir >> 15) & 0x1F
-    imm: int = (ir >> 20) & 0xFFF
-    if imm & 0x800:
-        imm |= -1 << 12  # sign-extend 12-bit immediate
-    rs1_val: int = cpu.registers[rs1]
-    return rs1_val, imm
-
-
-def extract_operands_s(cpu: CPU, ir: int) -> tuple[int, int]:
-    rs1: int = (ir >> 15) & 0x1F
-    # rs2 = (ir >> 20) & 0x1F
-    imm_11_5: int = (ir >> 25) & 0x7F
-    imm_4_0: int = (ir >> 7) & 0x1F
-    imm: int = (imm_11_5 << 5) | imm_4_0
-    if imm & 0x800:
-        imm |= -1 << 12  # sign-extend 12-bit immediate
-    rs1_val: int = cpu.registers[rs1]
-    return rs1_val, imm
-
-
-def extract_operands_b(cpu: CPU, ir: int) -> tuple[int, int, int]:
-    rs1: int = (ir >> 15) & 0x1F
-    rs2: int = (ir >> 20) & 0x1F
-    imm_12: int = (ir >> 31) & 0x1
-    imm_10_5: int = (ir >> 25) & 0x3F
-    imm_4_1: int = (ir >> 8) & 0xF
-    imm_11: int = (ir >> 7) & 0x1
-
-    imm: int = (imm_12 << 12) | (imm_11 << 11) | (imm_10_5 << 5) | (imm_4_1 << 1)
-    if imm & 0x1000:
-        imm |= -1 << 13  # sign-extend 13-bit immediate (imm[12] is sign bit)
-
-    rs1_val: int = cpu.registers[rs1]
-    rs2_val: int = cpu.registers[rs2]
-    return rs1_val, rs2_val, imm
-
-
-def extract_operands_u(cpu: CPU, ir: int) -> tuple[int, int]:
-    imm: int = ir & 0xFFFFF000
-    return 0, imm
-
-
-def extract_operands_j(cpu: CPU, ir: int) -> tuple[int, int]:
-    imm_20: int = (ir >> 31) & 0x1
-    imm_10_1: int = (ir >> 21) & 0x3FF
-    imm_11: int = (ir >> 20) & 0x1
-    imm_19_12: int = (ir >> 12) & 0xFF
-
-    imm: int = (imm_20 << 20) | (imm_19_12 << 12) | (imm_11 << 11) | (imm_10_1 << 1)
-
-    # sign extend from bit 20 if negative
-    if imm & (1 << 20):
-        imm |= -1 << 21
-
-    return cpu.pc - 4, imm
-
-
-class ALU:
-    @staticmethod
-    def exec(op: str, a: int, b: int) -> int:
-        if op in {"add", "addi"}:
-            return a + b
-        if op in {"sub"}:
-            return a - b
-        if op in {"mul"}:
-            return a * b
-        if op in {"div"}:
-            return a // b if b != 0 else 0
-        if op in {"and", "andi"}:
-            return a & b
-        if op in {"or", "ori"}:
-            return a | b
-        if op in {"xor", "xori"}:
-            return a ^ b
-        if op in {"lsl"}:
-            return a << b
-        if op in {"lsr"}:
-            return a >> b
-        if op == "lui":
-            return b << 12
-        if op == "jal_link":  # PC + 4
-            return a + b
-        if op == "jal_offset":  # PC + offset
-            return a + b
-        if op == "branch_offset":
-            return a + b  # a = pc, b = imm
-        return 0
+        return 0, decoded.imm
+
+    raise IllegalInstruction(f"Unsupported opcode {opcode:#x} in extract_operands")
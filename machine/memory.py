@@ -0,0 +1,223 @@
+"""Data memory: RAM with an aligned-word view, and the address map routing accesses to it."""
+
+from __future__ import annotations
+
+import mmap
+import sys
+from typing import TYPE_CHECKING
+
+from machine.decoder import Buffer
+
+if TYPE_CHECKING:  # for mypy
+    from machine.devices import Device
+
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+
+# (start, end, device) of the device ranges overlapping a page
+PageEntry = list[tuple[int, int, "Device"]]
+
+
+def format_size(size: int) -> str:
+    return f"{size // 1024}KB" if size % 1024 == 0 else f"{size} bytes"
+
+
+def allocate_memory(size: int) -> mmap.mmap:
+    """
+    Zero-filled private anonymous mapping: the OS hands out zero pages lazily, so only
+    the pages a program actually touches cost anything.
+    """
+    if hasattr(mmap, "MAP_PRIVATE"):  # not shared with forked worker processes
+        return mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE)
+    return mmap.mmap(-1, size)
+
+
+class MemoryFault(Exception):  # noqa: N818 -- a machine fault, named as such
+    """A program accessed memory outside of the machine's data memory."""
+
+    def __init__(self, address: int, width: int, access: str) -> None:
+        self.address: int = address
+        self.width: int = width
+        self.access: str = access
+        super().__init__(f"Memory fault: {access} of {width} byte(s) at {address:#x}")
+
+
+class Memory:
+    """
+    Data memory of `size` bytes (a multiple of 4).
+
+    Bytes live in `data`; `words` is a `memoryview` of the same buffer cast to signed
+    32-bit words, so an aligned `lw`/`sw` is a single index into it, without slicing
+    temporary bytes objects. Unaligned words take the slow path through `data`.
+    Every access outside of `[0, size)` raises `MemoryFault`.
+
+    `dirty` has a flag per `PAGE_SIZE`-byte page, set by every store to it, so the
+    pages written since the image was loaded are known without comparing memory:
+    checkpoints and diffs only touch those.
+    """
+
+    def __init__(self, size: int, image: Buffer = b"") -> None:
+        if size <= 0 or size % 4:
+            raise ValueError(f"Memory size must be a positive multiple of 4, got {size}")
+        if len(image) > size:
+            raise ValueError(f"Data memory overflow: data exceeds allocated {format_size(size)}.")
+        self.size: int = size
+        self.data: mmap.mmap = allocate_memory(size)
+        self.data[: len(image)] = image
+        # initial contents, what clean pages still hold: the caller's buffer (a read-only
+        # image), kept without a copy
+        self.image: Buffer = image
+        self.dirty: bytearray = bytearray(-(-size // PAGE_SIZE))
+        self.words: memoryview = memoryview(self.data).cast("i")
+        # native words are the ISA's little-endian words only on little-endian hosts;
+        # elsewhere every word access takes the slow path
+        self.word_limit: int = size if sys.byteorder == "little" else 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def load_word(self, address: int) -> int:
+        """Returns the signed 32-bit word at `address`."""
+        if not address & 3 and 0 <= address < self.word_limit:
+            return self.words[address >> 2]
+        if not 0 <= address <= self.size - 4:
+            raise MemoryFault(address, 4, "load")
+        return int.from_bytes(self.data[address : address + 4], "little", signed=True)
+
+    def load_byte(self, address: int) -> int:
+        """Returns the unsigned byte at `address`."""
+        if not 0 <= address < self.size:
+            raise MemoryFault(address, 1, "load")
+        return self.data[address]
+
+    def store_word(self, address: int, value: int) -> None:
+        """Stores a register value (already in the signed 32-bit range) at `address`."""
+        if not address & 3 and 0 <= address < self.word_limit:
+            self.words[address >> 2] = value
+            self.dirty[address >> PAGE_BITS] = 1
+            return
+        if not 0 <= address <= self.size - 4:
+            raise MemoryFault(address, 4, "store")
+        self.data[address : address + 4] = (value & 0xFFFFFFFF).to_bytes(4, "little")
+        self.dirty[address >> PAGE_BITS] = self.dirty[(address + 3) >> PAGE_BITS] = 1
+
+    def store_byte(self, address: int, value: int) -> None:
+        if not 0 <= address < self.size:
+            raise MemoryFault(address, 1, "store")
+        self.data[address] = value & 0xFF
+        self.dirty[address >> PAGE_BITS] = 1
+
+    def dirty_pages(self) -> list[int]:
+        """Numbers of the pages written since the image was loaded, in order."""
+        pages: list[int] = []
+        page: int = self.dirty.find(1)
+        while page != -1:
+            pages.append(page)
+            page = self.dirty.find(1, page + 1)
+        return pages
+
+    def page(self, page: int) -> bytes:
+        return self.data[page << PAGE_BITS : (page + 1) << PAGE_BITS]
+
+    def initial_page(self, page: int) -> bytes:
+        """What `page` held when the image was loaded."""
+        start: int = page << PAGE_BITS
+        return bytes(self.image[start : start + PAGE_SIZE]).ljust(len(self.page(page)), b"\0")
+
+    def write_page(self, page: int, contents: bytes, dirty: bool = True) -> None:
+        """Overwrites `page` (restoring a checkpoint, say) and sets its dirty flag."""
+        self.data[page << PAGE_BITS : (page + 1) << PAGE_BITS] = contents
+        self.dirty[page] = dirty
+
+    def diff_pages(self, other: Memory) -> list[int]:
+        """
+        Numbers of the pages whose contents differ from `other` (a memory of the same
+        size loaded with the same image, e.g. of another run): only pages written in
+        either are compared.
+        """
+        candidates: set[int] = set(self.dirty_pages()) | set(other.dirty_pages())
+        return sorted(page for page in candidates if self.page(page) != other.page(page))
+
+
+class AddressMap:
+    """
+    The data address space: RAM plus memory-mapped devices registered by address range.
+
+    Accesses are routed by the address they start at. Loads and stores have separate
+    page tables (`PAGE_SIZE`-byte pages) that only hold the pages some device range
+    overlaps, so an access to a plain RAM page costs one dictionary miss before going
+    to `memory`. A page may mix RAM and devices (page 0 does, with the standard
+    devices at 0x1 and 0x2): addresses outside of the device ranges there are RAM.
+    """
+
+    def __init__(self, memory: Memory) -> None:
+        self.memory: Memory = memory
+        self.load_pages: dict[int, PageEntry] = {}
+        self.store_pages: dict[int, PageEntry] = {}
+        # accesses routed to devices (see `PerfCounters`)
+        self.device_loads: int = 0
+        self.device_stores: int = 0
+
+    def map_device(
+        self, start: int, end: int, device: Device, *, loads: bool = True, stores: bool = True
+    ) -> None:
+        """Routes loads and/or stores starting in `[start, end)` to `device`."""
+        if not 0 <= start < end:
+            raise ValueError(f"Invalid device range [{start:#x}, {end:#x})")
+        for enabled, pages in ((loads, self.load_pages), (stores, self.store_pages)):
+            if not enabled:
+                continue
+            for page in range(start >> PAGE_BITS, ((end - 1) >> PAGE_BITS) + 1):
+                entry: PageEntry = pages.setdefault(page, [])
+                for other_start, other_end, _ in entry:
+                    if start < other_end and other_start < end:
+                        raise ValueError(
+                            f"Device range [{start:#x}, {end:#x}) overlaps "
+                            f"[{other_start:#x}, {other_end:#x})"
+                        )
+                entry.append((start, end, device))
+
+    @staticmethod
+    def find_device(pages: dict[int, PageEntry], address: int) -> Device | None:
+        entry: PageEntry | None = pages.get(address >> PAGE_BITS)
+        if entry is not None:
+            for start, end, device in entry:
+                if start <= address < end:
+                    return device
+        return None
+
+    def load_word(self, address: int) -> int:
+        if address >> PAGE_BITS in self.load_pages:
+            device: Device | None = self.find_device(self.load_pages, address)
+            if device is not None:
+                self.device_loads += 1
+                return device.load(address, 4)
+        return self.memory.load_word(address)
+
+    def load_byte(self, address: int) -> int:
+        """Loads a byte; RAM bytes are sign-extended, device values are returned as is."""
+        if address >> PAGE_BITS in self.load_pages:
+            device: Device | None = self.find_device(self.load_pages, address)
+            if device is not None:
+                self.device_loads += 1
+                return device.load(address, 1)
+        value: int = self.memory.load_byte(address)
+        return value - 0x100 if value & 0x80 else value
+
+    def store_word(self, address: int, value: int) -> None:
+        if address >> PAGE_BITS in self.store_pages:
+            device: Device | None = self.find_device(self.store_pages, address)
+            if device is not None:
+                self.device_stores += 1
+                device.store(address, 4, value)
+                return
+        self.memory.store_word(address, value)
+
+    def store_byte(self, address: int, value: int) -> None:
+        if address >> PAGE_BITS in self.store_pages:
+            device: Device | None = self.find_device(self.store_pages, address)
+            if device is not None:
+                self.device_stores += 1
+                device.store(address, 1, value)
+                return
+        self.memory.store_byte(address, value)
@@ -1,8 +1,15 @@
+from collections.abc import Callable
 from dataclasses import dataclass
+from typing import Any
 
+from machine.alu import ALU
 from machine.isa import INSTRUCTION_SET
 
 
+class IllegalInstruction(ValueError):  # noqa: N818 -- a machine fault, named as such
+    """A program executed an instruction word the machine has no microprogram for."""
+
+
 @dataclass
 class MicroInstruction:
     comment: str = ""
@@ -10,6 +17,7 @@ class MicroInstruction:
     latch_ir: bool = False
     latch_reg: str | None = None  # register number (as string) or None
     latch_alu: str | None = None  # operation: add, sub, mul...
+    alu_op: int | None = None  # id of latch_alu in the ROM's ALU table
     latch_ar: str | None = None  # address in memory
     mem_read: bool = False
     mem_write: bool = False
@@ -24,10 +32,13 @@ class MicrocodeROM:
     def __init__(self) -> None:
         self.code: dict[int, MicroInstruction] = {}
         self.decode_table: dict[tuple[int, int | None, int | None], int] = {}
+        self.entry_names: dict[int, str] = {}  # microprogram start -> instruction name
         self.mpc_counter: int = 100
+        self.alu: ALU = ALU()
 
         self.fill_fetch()
         self.fill_from_isa()
+        self.assign_alu_ops()
 
     def __getitem__(self, mpc: int) -> MicroInstruction:
         """
@@ -40,6 +51,28 @@ class MicrocodeROM:
         """
         return self.code.get(mpc, MicroInstruction(comment="HALT", halt=True))
 
+    def assign_alu_ops(self) -> None:
+        """Gives every ALU operation used by the microcode an integer id in `self.alu`."""
+        for mpc in sorted(self.code):
+            instr: MicroInstruction = self.code[mpc]
+            if instr.latch_alu:
+                instr.alu_op = self.alu.op_id(instr.latch_alu)
+
+    def compile(
+        self, builder: Callable[[int, MicroInstruction], Callable[[Any], None]]
+    ) -> list[Callable[[Any], None]]:
+        """
+        Compiles the ROM into a flat list indexed by mpc.
+
+        `builder(mpc, instr)` turns one microinstruction into a callable; empty slots get
+        the compiled HALT instruction, the same as `rom[mpc]` would return.
+        """
+        halt: Callable[[Any], None] = builder(-1, MicroInstruction(comment="HALT", halt=True))
+        compiled: list[Callable[[Any], None]] = [halt] * (max(self.code) + 1)
+        for mpc, instr in self.code.items():
+            compiled[mpc] = builder(mpc, instr)
+        return compiled
+
     def fill_fetch(self) -> None:
         """
         Create the first 3 microinstructions that are executed for any instruction.
@@ -57,6 +90,7 @@ class MicrocodeROM:
         funct3: int | None = None,
         funct7: int | None = None,
         mpc: int | None = None,
+        name: str | None = None,
     ) -> None:
         """
         Register a match: (opcode, funct3, funct7) -> mpc
@@ -64,6 +98,8 @@ class MicrocodeROM:
         key: tuple[int, int | None, int | None] = (opcode, funct3, funct7)
         if mpc is not None:
             self.decode_table[key] = mpc
+            if name is not None:
+                self.entry_names[mpc] = name
 
     def get_decode_address(
         self, opcode: int, funct3: int | None = None, funct7: int | None = None
@@ -81,7 +117,7 @@ class MicrocodeROM:
             or self.decode_table.get((opcode, None, None))
         )
         if result is None:
-            raise ValueError(
+            raise IllegalInstruction(
                 f"Unsupported instruction: opcode=0b{opcode:07b} (0x{opcode:02X}), "
                 f"funct3={'-' if funct3 is None else f'0b{funct3:03b}'}, "
                 f"funct7={'-' if funct7 is None else f'0b{funct7:07b}'}"
@@ -89,6 +125,21 @@ class MicrocodeROM:
 
         return result
 
+    def microprogram(self, start: int) -> list[MicroInstruction]:
+        """
+        Returns the microinstructions executed after DECODE DISPATCH jumps to `start`,
+        up to and including the one that returns to FETCH (or halts).
+        """
+        program: list[MicroInstruction] = []
+        mpc: int | None = start
+        while mpc is not None:
+            mi: MicroInstruction = self[mpc]
+            program.append(mi)
+            if mi.halt or mi.next_mpc == 0:
+                break
+            mpc = mi.next_mpc
+        return program
+
     def alloc(self, count: int = 1) -> int:
         addr: int = self.mpc_counter
         self.mpc_counter += count
@@ -104,7 +155,7 @@ class MicrocodeROM:
 
             if t == "R":
                 addr: int = self.alloc(2)
-                self.register_decode(opcode, funct3, funct7, addr)
+                self.register_decode(opcode, funct3, funct7, addr, name=op)
                 self.code[addr] = MicroInstruction(
                     comment=f"R-{op}", latch_alu=op, set_flags=True, next_mpc=addr + 1
                 )
@@ -113,7 +164,7 @@ class MicrocodeROM:
             elif t == "I":
                 if op == "lw":
                     addr = self.alloc(2)
-                    self.register_decode(opcode, funct3, None, addr)
+                    self.register_decode(opcode, funct3, None, addr, name=op)
                     self.code[addr] = MicroInstruction(
                         comment="I-LW addr", latch_alu="add", next_mpc=addr + 1
                     )
@@ -122,7 +173,7 @@ class MicrocodeROM:
                     )
                 elif op == "lb":
                     addr = self.alloc(2)
-                    self.register_decode(opcode, funct3, None, addr)
+                    self.register_decode(opcode, funct3, None, addr, name=op)
                     self.code[addr] = MicroInstruction(
                         comment="I-LB addr", latch_alu="add", next_mpc=addr + 1
                     )
@@ -131,7 +182,7 @@ class MicrocodeROM:
                     )
                 elif op == "jalr":
                     addr = self.alloc(3)
-                    self.register_decode(opcode, funct3, None, addr)
+                    self.register_decode(opcode, funct3, None, addr, name=op)
                     self.code[addr] = MicroInstruction(
                         comment="I-JALR save return address",
                         latch_reg="rd_pc",
@@ -145,7 +196,7 @@ class MicrocodeROM:
                     )
                 else:
                     addr = self.alloc(2)
-                    self.register_decode(opcode, funct3, None, addr)
+                    self.register_decode(opcode, funct3, None, addr, name=op)
                     self.code[addr] = MicroInstruction(
                         comment=f"I-{op}",
                         latch_alu=op,
@@ -156,7 +207,7 @@ class MicrocodeROM:
 
             elif t == "S":
                 addr = self.alloc(2)
-                self.register_decode(opcode, funct3, None, addr)
+                self.register_decode(opcode, funct3, None, addr, name=op)
                 self.code[addr] = MicroInstruction(
                     comment=f"S-{op} addr", latch_alu="add", next_mpc=addr + 1
                 )
@@ -176,7 +227,7 @@ class MicrocodeROM:
                 addr = self.alloc(3)
                 cond_map: dict[str, str] = {"beq": "Z", "bne": "NZ", "bgt": "GT", "ble": "LE"}
                 cond: str = cond_map[op]
-                self.register_decode(opcode, funct3, None, addr)
+                self.register_decode(opcode, funct3, None, addr, name=op)
 
                 self.code[addr] = MicroInstruction(
                     comment=f"B-{op} cmp",
@@ -195,7 +246,7 @@ class MicrocodeROM:
 
             elif t == "U":
                 addr = self.alloc(2)
-                self.register_decode(opcode, None, None, addr)
+                self.register_decode(opcode, None, None, addr, name=op)
                 self.code[addr] = MicroInstruction(
                     comment="U-LUI", latch_alu="lui", next_mpc=addr + 1
                 )
@@ -205,7 +256,7 @@ class MicrocodeROM:
 
             elif t == "J":
                 addr = self.alloc(2)
-                self.register_decode(opcode, None, None, addr)
+                self.register_decode(opcode, None, None, addr, name=op)
                 # save PC + 4
                 self.code[addr] = MicroInstruction(
                     comment="J-JAL link",
@@ -223,5 +274,5 @@ class MicrocodeROM:
                 )
 
             elif t == "SYS":
-                self.register_decode(opcode, None, None, 9999)
+                self.register_decode(opcode, None, None, 9999, name=op)
                 self.code[9999] = MicroInstruction(comment="HALT", halt=True)
@@ -0,0 +1,106 @@
+"""Performance counters kept by every engine, and the report built from them."""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import TYPE_CHECKING, Any
+
+from machine.isa import INSTRUCTION_SET
+
+if TYPE_CHECKING:
+    from machine.machine import CPU
+
+
+def instruction_class(name: str) -> str:
+    """The class an instruction is reported under: alu, load, store, branch, jump, ..."""
+    if name in ("lw", "lb"):
+        return "load"
+    if name == "jalr":
+        return "jump"
+    return {
+        "R": "alu",
+        "I": "alu",
+        "S": "store",
+        "B": "branch",
+        "J": "jump",
+        "U": "upper",
+        "SYS": "system",
+    }[INSTRUCTION_SET[name]["type"]]
+
+
+class PerfCounters:
+    """
+    What a program executed, counted as it runs (`cpu.perf`).
+
+    `executed` counts the instructions retired at every PC and `taken` the taken
+    branches at every PC; the microcode engine counts an instruction once it is fetched.
+    Everything else follows from these because every instruction takes a fixed number
+    of ticks (FETCH + DECODE + its microprogram): ticks per instruction class, CPI and
+    the number of loads and stores. MMIO accesses are counted by the address map.
+    """
+
+    def __init__(self) -> None:
+        self.executed: dict[int, int] = {}
+        self.taken: dict[int, int] = {}
+
+    @property
+    def instructions(self) -> int:
+        return sum(self.executed.values())
+
+    def instruction_at(self, cpu: CPU, pc: int) -> tuple[str, int] | None:
+        """(mnemonic, ticks) of the instruction at `pc`, None if it does not decode."""
+        rom = cpu.microcode_rom
+        mpc: int | None = cpu.decode_cache.fetch(pc).mpc
+        if mpc is None or mpc not in rom.entry_names:
+            return None
+        return rom.entry_names[mpc], 2 + len(rom.microprogram(mpc))
+
+    def report(self, cpu: CPU) -> dict[str, Any]:
+        """The counters of `cpu` as a JSON-serializable dict."""
+        classes: dict[str, dict[str, Any]] = {}
+        mnemonics: dict[str, int] = {}
+        branches: dict[str, dict[str, int]] = {}
+        loads = stores = 0
+        for pc, count in sorted(self.executed.items()):
+            instruction = self.instruction_at(cpu, pc)
+            if instruction is None:
+                continue  # stopped at DECODE with an error
+            name, ticks = instruction
+            mnemonics[name] = mnemonics.get(name, 0) + count
+            group: str = instruction_class(name)
+            totals = classes.setdefault(group, {"instructions": 0, "ticks": 0})
+            totals["instructions"] += count
+            totals["ticks"] += count * ticks
+            if group == "load":
+                loads += count
+            elif group == "store":
+                stores += count
+            elif group == "branch":
+                taken: int = self.taken.get(pc, 0)
+                branches[f"{pc:#06x}"] = {"taken": taken, "not_taken": count - taken}
+
+        for totals in classes.values():
+            totals["cpi"] = totals["ticks"] / totals["instructions"]
+        instructions: int = self.instructions
+        return {
+            "halted": not cpu.running,
+            "ticks": cpu.ticks,
+            "instructions": instructions,
+            "cpi": cpu.ticks / instructions if instructions else 0.0,
+            "classes": dict(sorted(classes.items())),
+            "mnemonics": dict(sorted(mnemonics.items())),
+            "branches": branches,
+            "memory": {
+                "loads": loads,
+                "stores": stores,
+                "mmio_loads": cpu.address_map.device_loads,
+                "mmio_stores": cpu.address_map.device_stores,
+            },
+        }
+
+    def write_report(self, cpu: CPU, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(cpu), f, indent=2)
+            f.write("\n")
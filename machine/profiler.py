@@ -0,0 +1,152 @@
+"""
+Hot spots of a program: ticks per PC joined with the translator's listing and symbols.
+
+Ticks per PC come from the performance counters (`cpu.perf`), which every engine keeps
+anyway: each instruction takes a fixed number of ticks, so executions times ticks is
+exact, no sampling involved. For the call graph the profiler steps the program one
+instruction at a time and keeps a shadow call stack: `jal`/`jalr` with a link register
+other than r0 is a call (the callee is named after the label at its target), a `jalr`
+without one that lands on a return address pops the frames up to it. The stacks are
+written in the folded format flame graph tools read (`root;callee;... ticks`).
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from machine.fast_engine import FastEngine
+from machine.image import Labels
+from machine.isa import INSTRUCTION_SET
+
+if TYPE_CHECKING:
+    from machine.machine import CPU
+
+JAL_OPCODE: int = INSTRUCTION_SET["jal"]["opcode"]
+JALR_OPCODE: int = INSTRUCTION_SET["jalr"]["opcode"]
+
+
+@dataclass(slots=True)
+class HotSpot:
+    pc: int
+    ticks: int
+    executions: int
+    location: str  # nearest label at or before `pc`, plus the offset from it
+    source: str  # the line in the listing, "" if there is none
+
+
+class Profiler:
+    """
+    Profiles `cpu` from its entry point on.
+
+    `listing` maps addresses to source lines (`read_listing` of the .text.log) and
+    `symbols` labels to (section, address) (`Image.symbols` or `read_symbols` of the
+    .sym file); without them PCs are shown as addresses only. `stacks` holds the ticks
+    spent in every call stack seen so far.
+    """
+
+    def __init__(
+        self,
+        cpu: CPU,
+        listing: dict[int, str] | None = None,
+        symbols: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        self.cpu = cpu
+        self.listing: dict[int, str] = listing or {}
+        self.labels: Labels = Labels(symbols or {})
+        self.stacks: dict[str, int] = {}
+        # shadow call stack: (folded stack, return address) of every active frame
+        self.frames: list[tuple[str, int]] = [(self.routine(cpu.pc), -1)]
+
+    def location(self, pc: int) -> str:
+        """`label+0x8` for the nearest label at or before `pc`, the address if there is none."""
+        return self.labels.location(pc)
+
+    def routine(self, pc: int) -> str:
+        """Frame name for code starting at `pc`: its label, or the address."""
+        return self.labels.at(pc) or f"{pc:#06x}"
+
+    def run(self, engine: str, max_ticks: int) -> None:
+        """
+        Runs the program like `run_engine`, until halt or until more than `max_ticks`
+        ticks have been spent, recording the call stacks on the way.
+
+        The microcode engine is stepped microinstruction by microinstruction (so traces
+        are written as usual); "fast" and "jit" both run on the fast engine, since the
+        JIT cannot stop at every instruction. Tick counts are the same either way.
+        """
+        cpu = self.cpu
+        start: int = cpu.ticks
+        try:
+            if engine == "microcode":
+                while cpu.running:
+                    cpu.step()
+                    if cpu.mpc == 0 or not cpu.running:  # back at FETCH: one instruction done
+                        self.retire(start)
+                        start = cpu.ticks
+                    if cpu.ticks > max_ticks:
+                        break
+            else:
+                step = FastEngine(cpu).step
+                while cpu.running:
+                    step()
+                    self.retire(start)
+                    start = cpu.ticks
+                    if cpu.ticks > max_ticks:
+                        break
+        finally:
+            if cpu.ticks > start:  # stopped inside an instruction
+                stack: str = self.frames[-1][0]
+                self.stacks[stack] = self.stacks.get(stack, 0) + cpu.ticks - start
+
+    def retire(self, start: int) -> None:
+        """Charges the instruction just executed (`cpu.decoded`) to the current stack."""
+        cpu = self.cpu
+        frames = self.frames
+        stack: str = frames[-1][0]
+        self.stacks[stack] = self.stacks.get(stack, 0) + cpu.ticks - start
+
+        decoded = cpu.decoded
+        if decoded.opcode != JAL_OPCODE and decoded.opcode != JALR_OPCODE:
+            return
+        if decoded.rd != 0:  # call: the link register holds the return address
+            frames.append((f"{stack};{self.routine(cpu.pc)}", cpu.registers[decoded.rd]))
+            return
+        for depth in range(len(frames) - 1, 0, -1):
+            if frames[depth][1] == cpu.pc:  # return, possibly past frames that never did
+                del frames[depth:]
+                break
+
+    def hot_spots(self) -> list[HotSpot]:
+        """Every executed PC, most ticks first."""
+        cpu = self.cpu
+        spots: list[HotSpot] = []
+        for pc, count in cpu.perf.executed.items():
+            instruction = cpu.perf.instruction_at(cpu, pc)
+            ticks: int = count * instruction[1] if instruction is not None else 0
+            spots.append(HotSpot(pc, ticks, count, self.location(pc), self.listing.get(pc, "")))
+        spots.sort(key=lambda spot: (-spot.ticks, spot.pc))
+        return spots
+
+    def format_table(self, limit: int = 20) -> str:
+        """The `limit` hottest PCs as a table, with their share of all ticks."""
+        total: int = self.cpu.ticks or 1
+        lines: list[str] = [
+            f"{'ticks':>10} {'%':>6} {'count':>8}  {'pc':<8} {'location':<20} source"
+        ]
+        for spot in self.hot_spots()[:limit]:
+            lines.append(
+                f"{spot.ticks:>10} {100 * spot.ticks / total:>6.2f} {spot.executions:>8}  "
+                f"{spot.pc:08X} {spot.location:<20} {spot.source}"
+            )
+        return "\n".join(lines)
+
+    def folded(self) -> str:
+        """The call stacks in folded format: `root;callee;... ticks` lines."""
+        return "".join(f"{stack} {ticks}\n" for stack, ticks in sorted(self.stacks.items()))
+
+    def write_folded(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
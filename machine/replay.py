@@ -0,0 +1,206 @@
+"""
+Record and replay: re-execute a run without its input, and jump to any tick of it.
+
+While recording, every value the program takes from its input source is logged with
+the tick its loading instruction started at, and a checkpoint (machine/checkpoint.py)
+is kept every so many ticks. A recording replaces the input: replayed values are
+checked against their recorded ticks, so a run that takes another path (a changed
+program, a bug in an engine) is reported where it diverges instead of going on with
+wrong input. `goto_tick` restores the nearest checkpoint at or before a tick and
+re-executes only from there.
+
+The file is `MAGIC`, then a zlib-compressed body: the program hash (32 bytes), the
+data memory size (u32), the number of input values (u32) and per value the tick delta
+from the previous one and the value (zigzag-encoded), as LEB128 varints, then the
+number of checkpoints (u32) and per checkpoint its tick (u64), length (u32) and bytes.
+"""
+
+from __future__ import annotations
+
+import bisect
+import struct
+import zlib
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from machine.api import run_engine
+from machine.checkpoint import capture, program_hash, restore
+
+if TYPE_CHECKING:
+    from machine.machine import CPU
+
+MAGIC = b"RISCROLL-REPLAY\x01"
+DEFAULT_CHECKPOINT_EVERY = 100_000
+HEADER = struct.Struct("<32sII")
+COUNT = struct.Struct("<I")
+CHECKPOINT = struct.Struct("<QI")
+
+
+class ReplayError(Exception):
+    """A recording that cannot be read, or a replayed run that diverges from it."""
+
+
+def instruction_start(cpu: CPU) -> int:
+    """
+    The tick the current instruction started at (its FETCH): the same on every engine,
+    unlike `cpu.ticks` in the middle of a microprogram.
+    """
+    if cpu.mpc == 0 or cpu.decoded.mpc is None:
+        return cpu.ticks
+    if cpu.mpc == 1000:  # DECODE DISPATCH: only FETCH done
+        return cpu.ticks - 1
+    return cpu.ticks - 2 - (cpu.mpc - cpu.decoded.mpc)  # FETCH, DECODE, micro-steps so far
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """(value, offset past it)"""
+    value = shift = 0
+    while True:
+        byte: int = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+@dataclass(slots=True)
+class Recording:
+    """What a run read, and when: enough to replay it without its input."""
+
+    program: bytes  # `program_hash` of the recorded machine
+    data_size: int
+    inputs: list[tuple[int, int]] = field(default_factory=list)  # (tick, value)
+    checkpoints: list[tuple[int, bytes]] = field(default_factory=list)  # (tick, checkpoint)
+
+    def encode(self) -> bytes:
+        body = bytearray(HEADER.pack(self.program, self.data_size, len(self.inputs)))
+        previous: int = 0
+        for tick, value in self.inputs:
+            write_varint(body, tick - previous)
+            write_varint(body, value << 1 if value >= 0 else (~value << 1) | 1)
+            previous = tick
+        body += COUNT.pack(len(self.checkpoints))
+        for tick, checkpoint in self.checkpoints:
+            body += CHECKPOINT.pack(tick, len(checkpoint))
+            body += checkpoint
+        return MAGIC + zlib.compress(body)
+
+    @classmethod
+    def decode(cls, data: bytes) -> Recording:
+        if not data.startswith(MAGIC):
+            raise ReplayError("Not a RISCroll recording")
+        try:
+            body: bytes = zlib.decompress(data[len(MAGIC) :])
+            program, data_size, count = HEADER.unpack_from(body)
+            recording = cls(program, data_size)
+            offset: int = HEADER.size
+            tick: int = 0
+            for _ in range(count):
+                delta, offset = read_varint(body, offset)
+                value, offset = read_varint(body, offset)
+                tick += delta
+                recording.inputs.append((tick, ~(value >> 1) if value & 1 else value >> 1))
+            (count,) = COUNT.unpack_from(body, offset)
+            offset += COUNT.size
+            for _ in range(count):
+                tick, length = CHECKPOINT.unpack_from(body, offset)
+                offset += CHECKPOINT.size
+                recording.checkpoints.append((tick, body[offset : offset + length]))
+                offset += length
+        except (zlib.error, struct.error, IndexError) as e:
+            raise ReplayError(f"Corrupt recording: {e}") from e
+        return recording
+
+    def write(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.encode())
+
+    @classmethod
+    def read(cls, path: str) -> Recording:
+        with open(path, "rb") as f:
+            return cls.decode(f.read())
+
+    def check(self, cpu: CPU) -> None:
+        """Raises ReplayError unless `cpu` is loaded with the recorded program."""
+        if self.program != program_hash(cpu) or self.data_size != cpu.memory.size:
+            raise ReplayError("Recording was made of another program or memory size")
+
+    def source(self, cpu: CPU, start: int = 0) -> Iterator[int]:
+        """The recorded input of `cpu` from the `start`-th value on, checked tick by tick."""
+        for tick, value in self.inputs[start:]:
+            if instruction_start(cpu) != tick:
+                raise ReplayError(
+                    f"Replay diverged: input read at tick {instruction_start(cpu)}, "
+                    f"recorded at tick {tick}"
+                )
+            yield value
+
+
+class Recorder:
+    """
+    Records the input `cpu` takes from its source from now on into `recording`;
+    `checkpoint` (the `save` of `run_with_checkpoints`) adds a checkpoint.
+    """
+
+    def __init__(self, cpu: CPU) -> None:
+        self.cpu = cpu
+        self.recording = Recording(program_hash(cpu), cpu.memory.size)
+        cpu.input_device.source = self.record(cpu.input_device.source)
+
+    def record(self, source: Iterator[int]) -> Iterator[int]:
+        inputs: list[tuple[int, int]] = self.recording.inputs
+        for value in source:
+            inputs.append((instruction_start(self.cpu), value))
+            yield value
+
+    def checkpoint(self, cpu: CPU) -> None:
+        self.recording.checkpoints.append((cpu.ticks, capture(cpu)))
+
+
+def replay(cpu: CPU, recording: Recording) -> None:
+    """Feeds `cpu`, loaded with the recorded program (and no input), the recorded input."""
+    recording.check(cpu)
+    cpu.input_device.source = recording.source(cpu, cpu.input_device.position)
+
+
+def goto_tick(cpu: CPU, recording: Recording, tick: int, engine: str = "jit") -> int:
+    """
+    Brings `cpu`, freshly loaded with the recorded program (and no input), to `tick`
+    (or to its halt, if that comes first): restores the latest checkpoint at or before
+    `tick` and runs on from there with the recorded input, on `engine` up to the last
+    instruction boundary before `tick` and micro-step by micro-step after it. Nothing
+    is traced on the way. Returns the tick of the checkpoint used (0 for none).
+    """
+    recording.check(cpu)
+    ticks: list[int] = [checkpoint_tick for checkpoint_tick, _ in recording.checkpoints]
+    i: int = bisect.bisect_right(ticks, tick) - 1
+    start: int = 0
+    if i >= 0:
+        start, checkpoint = recording.checkpoints[i]
+        restore(cpu, checkpoint)
+    replay(cpu, recording)
+
+    log_step = cpu.log_step
+    cpu.log_step = lambda: None
+    try:
+        # longest instruction: FETCH, DECODE and the longest microprogram
+        longest: int = 2 + max(
+            len(cpu.microcode_rom.microprogram(mpc)) for mpc in cpu.microcode_rom.entry_names
+        )
+        if tick - longest > cpu.ticks:
+            run_engine(cpu, engine, tick - longest)
+        while cpu.running and cpu.ticks < tick:
+            cpu.step()
+    finally:
+        cpu.log_step = log_step
+    cpu.logger.resync()  # the trace goes on from here
+    return start
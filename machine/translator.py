@@ -1,11 +1,16 @@
 # translator.py
 import codecs
+import os
 import re
 import struct
 import sys
-from collections.abc import Sequence
+from dataclasses import dataclass
 
-from isa import ALIAS_REGISTERS, INSTRUCTION_SET
+if __name__ == "__main__":  # run as a script: make the `machine` package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from machine.image import Image  # noqa: E402
+from machine.isa import ALIAS_REGISTERS, INSTRUCTION_SET  # noqa: E402
 
 for i in range(32):
     ALIAS_REGISTERS[f"r{i}"] = i
@@ -15,32 +20,6 @@ def reg_to_num(reg):
     return ALIAS_REGISTERS[reg.strip(",")]
 
 
-def to_bytes_data(data_debug: list[tuple[int, str, int]]) -> bytes:
-    """
-    Converts data segment debug information into a byte sequence.
-    data_debug contains (address, source_line, value_to_encode).
-    """
-    binary_bytes = bytearray()
-
-    for _, line_type, val in data_debug:
-        if line_type.startswith(".byte"):
-            binary_bytes.append(val & 0xFF)
-        elif line_type.startswith(".word"):
-            binary_bytes.extend(val.to_bytes(4, "little"))
-        else:
-            raise ValueError(f"Unsupported data line format: {line_type}")
-
-    return bytes(binary_bytes)
-
-
-def to_bytes_text(text_code: list[int], entry_point: int) -> bytes:
-    binary_bytes = bytearray()
-    binary_bytes.extend(entry_point.to_bytes(4, "little"))
-    for instr in text_code:
-        binary_bytes.extend(instr.to_bytes(4, "little"))
-    return bytes(binary_bytes)
-
-
 def to_hex(debug_info: list[tuple[int, str, int]]) -> str:
     """
     Generates a human-readable hexadecimal and binary representation
@@ -48,193 +27,344 @@ def to_hex(debug_info: list[tuple[int, str, int]]) -> str:
     debug_info: list of (address, source_mnemonic, encoded_value)
     """
     result = []
+    columns: dict[int, str] = {}  # "HEX - BIN" of every distinct word, formatted once
     for addr, mnemonic, word in debug_info:
-        hex_word = f"{word:08X}"
-        bin_word = f"{word:032b}"
-        result.append(f"{addr:08X}(int {addr}) - {hex_word} - {bin_word} - {mnemonic}")
+        encoded = columns.get(word)
+        if encoded is None:
+            encoded = columns[word] = f"{word:08X} - {word:032b}"
+        result.append(f"{addr:08X}(int {addr}) - {encoded} - {mnemonic}")
     return "\n".join(result)
 
 
-def expand_macros(lines: list[str]) -> list[str]:
+MAX_MACRO_DEPTH = 64
+
+# `\name` of a macro parameter, or `\@`: a number unique to each expansion, for labels
+MACRO_ARGUMENT = re.compile(r"\\(\w+|@)")
+
+
+@dataclass(slots=True)
+class Macro:
     """
-    Parses and expands macros defined in the source code using regex substitution.
-    Cleans up comma artifacts in argument names and values.
+    A `.macro` compiled at definition into a template.
+
+    Every body line is pre-split into its literal `segments` around the argument slots,
+    so an expansion only concatenates: segments[0] + value of slots[0] + segments[1] ...
+    Slot `len(params)` is `\\@`. The line's first word is kept too when no argument is
+    part of it, to tell nested macro uses from other lines without splitting them.
     """
-    macros = {}
-    expanded = []
-    in_macro = False
+
+    name: str
+    params: list[str]
+    lines: list[tuple[list[str], list[int], str | None]]
+
+    @classmethod
+    def compile(cls, name: str, params: list[str], body: list[str]) -> "Macro":
+        lines: list[tuple[list[str], list[int], str | None]] = []
+        for line in body:
+            parts: list[str] = MACRO_ARGUMENT.split(line)
+            slots: list[int] = []
+            for key in parts[1::2]:
+                if key == "@":
+                    slots.append(len(params))
+                elif key in params:
+                    slots.append(params.index(key))
+                else:
+                    raise ValueError(f"Unknown macro argument `\\{key}` in: {line}")
+            prefix: str = parts[0]
+            words: list[str] = prefix.split(None, 1)
+            first_word: str | None = words[0] if words else ""
+            if slots and (not words or len(words) == 1 and not prefix[-1].isspace()):
+                first_word = None  # starts with an argument
+            lines.append((parts[0::2], slots, first_word))
+        return cls(name, params, lines)
+
+    def expand(self, args: list[str], unique: int) -> list[tuple[str, str | None]]:
+        """The body for `args`, as (line, first word of the line if known) pairs."""
+        if len(args) != len(self.params):
+            raise ValueError(
+                f"Macro `{self.name}` expects {len(self.params)} args, got {len(args)}"
+            )
+        values: list[str] = [*args, str(unique)]
+        expanded: list[tuple[str, str | None]] = []
+        for segments, slots, first_word in self.lines:
+            if not slots:
+                expanded.append((segments[0], first_word))
+                continue
+            parts: list[str] = [segments[0]]
+            for slot, segment in zip(slots, segments[1:], strict=True):
+                parts += (values[slot], segment)
+            expanded.append(("".join(parts), first_word))
+        return expanded
+
+
+def expand_macros(lines: list[str], max_depth: int = MAX_MACRO_DEPTH) -> list[str]:
+    """
+    Collects `.macro` definitions and replaces their uses with the body.
+
+    Macro bodies may use other macros (also recursively, up to `max_depth` nested
+    expansions). `\\@` in a body becomes a number unique to each expansion, so a macro
+    can define labels like `loop_\\@:` and still be used more than once.
+    """
+    macros: dict[str, Macro] = {}
+    expanded: list[str] = []
+    expansions: int = 0
     macro_name = ""
-    macro_args = []
-    macro_body: list[str] = []
+    macro_args: list[str] = []
+    macro_body: list[str] | None = None
+
+    def emit(line: str, depth: int) -> None:
+        nonlocal expansions
+        head = line.split(None, 1)
+        macro = macros.get(head[0]) if head else None
+        if macro is None:
+            expanded.append(line)
+            return
+        if depth >= max_depth:
+            raise ValueError(
+                f"Macro `{macro.name}` nested more than {max_depth} levels deep "
+                f"(recursive?) in: {line.strip()}"
+            )
+        args = head[1].split("#")[0].replace(",", " ").split() if len(head) > 1 else []
+        expansions += 1
+        for body_line, first_word in macro.expand(args, expansions):
+            if first_word is None or first_word in macros:
+                emit(body_line, depth + 1)
+            else:
+                expanded.append(body_line)
 
     for line in lines:
         stripped = line.strip()
-        if stripped.startswith(".macro"):
+        if macro_body is not None:
+            if stripped == ".endmacro":
+                macros[macro_name] = Macro.compile(macro_name, macro_args, macro_body)
+                macro_body = None
+            else:
+                macro_body.append(line)
+        elif stripped.startswith(".macro"):
             parts = stripped.split()
             macro_name = parts[1]
             macro_args = [a.strip(",") for a in parts[2:]]
-            in_macro = True
             macro_body = []
-        elif stripped == ".endmacro":
-            macros[macro_name] = (macro_args, macro_body)
-            in_macro = False
-        elif in_macro:
-            macro_body.append(line)
         else:
-            tokens = stripped.split()
-            if tokens and tokens[0] in macros:
-                macro_name = tokens[0]
-                actual_args = [a.strip(",") for a in tokens[1:]]
-                formal_args, body = macros[macro_name]
+            emit(line, 0)
 
-                if len(actual_args) != len(formal_args):
-                    raise ValueError(
-                        f"Macro `{macro_name}` expects {len(formal_args)} args, got {len(actual_args)}"
-                    )
+    return expanded
 
-                arg_map = dict(zip(formal_args, actual_args, strict=False))
 
-                for body_line in body:
+WORD = struct.Struct("<I")
 
-                    def replacer(match, arg_map=arg_map, body_line=body_line):
-                        key = match.group(1)
-                        if key not in arg_map:
-                            raise ValueError(f"Unknown macro argument `\\{key}` in: {body_line}")
-                        return arg_map[key]
+# (section, index of the instruction or data item, its tokens) of a label use to patch
+Fixup = tuple[str, int, list[str]]
 
-                    replaced = re.sub(r"\\(\w+)", replacer, body_line)
-                    expanded.append(replaced)
-            else:
-                expanded.append(line)
 
-    return expanded
+def label_reference(operand: str) -> str | None:
+    """The label an operand refers to (also inside low()/high()), None for a number."""
+    operand = operand.strip(",")
+    if operand.startswith(("low(", "high(")):
+        return operand[operand.index("(") + 1 : -1]
+    if operand[:1].isdigit() or operand[:1] in "+-":
+        return None
+    return operand
 
 
-def first_pass(
-    lines: list[str],
-) -> tuple[dict[str, int], list[tuple[int, str, int]], list[tuple[int, str]]]:
+class Assembler:
     """
-    - Resolve labels and their addresses
-    - Split into .text and .data sections
-    - Track .org directives
+    Translates source lines (macros already expanded) into an `Image` in one pass.
+
+    Every line is split once and emitted right away: instructions into `text`, which is
+    preallocated for one instruction per line, data into `data`. An instruction or
+    `.word` that uses a label not defined yet is emitted as 0 and recorded in `fixups`
+    under that label; `finish()` patches them once all labels are known and reports the
+    labels that never were.
     """
-    addr_of_instr = 0
-    label_map = {}
-    section = None
-    org = {".text": 0x0, ".data": 0x0}
-    data_segment = []
-    text_segment = []
 
-    for line in lines:
+    def __init__(self, line_count: int) -> None:
+        self.labels: dict[str, int] = {}
+        self.symbols: dict[str, tuple[str, int]] = {}  # label: (section, address)
+        self.fixups: dict[str, list[Fixup]] = {}
+        self.section: str | None = None
+        self.org: dict[str, int] = {".text": 0x0, ".data": 0x0}
+        self.address: int = 0
+        # Words of the instructions that encode the same wherever they are: repeated
+        # lines (common in generated code) are not split and encoded again
+        self.encoded: dict[str, int] = {}
+
+        self.text = bytearray(4 * line_count)
+        self.text_debug: list[tuple[int, str]] = []  # (address, source line)
+        self.data = bytearray()
+        self.data_debug: list[tuple[int, str, int]] = []  # (address, source line, offset)
+
+    def feed(self, line: str) -> None:
         line = line.split("#")[0].strip()  # remove comments
         if not line:
-            continue
+            return
 
         if line.startswith(".org"):
             _, addr = line.split()
-            addr_of_instr = int(addr, 0)
-            if section:  # Only update if a section is active
-                org[section] = addr_of_instr
-            continue
+            self.address = int(addr, 0)
+            if self.section:  # Only update if a section is active
+                self.org[self.section] = self.address
+            return
 
-        if line in [".text", ".data"]:
-            section = line
-            addr_of_instr = org[section]  # reset addr to .org
-            continue
+        if line in (".text", ".data"):
+            self.section = line
+            self.address = self.org[line]  # reset addr to .org
+            return
 
         if ":" in line:
-            label, rest = line.split(":", 1)
-            label = label.strip()
-            label_map[label] = addr_of_instr  # store label address
-            line = rest.strip()
+            label, line = line.split(":", 1)
+            self.define(label.strip())
+            line = line.strip()
             if not line:
-                continue
-
-        if section == ".data":
-            if line.startswith(".word"):
-                _, val_str = line.split(None, 1)
-                try:
-                    val = int(val_str.strip(), 0)
-                except ValueError:
-                    # If it's a label, add it to data_segment for later resolution
-                    label_map[val_str.strip()] = addr_of_instr  # Placeholder for data labels
-                    val = 0  # Placeholder value, actual resolution in second_pass
-                    data_segment.append((addr_of_instr, f".word {val_str.strip()}", val))
-
-                data_segment.append(
-                    (addr_of_instr, line, val)
-                )  # Store line for debug, and resolved/placeholder val
-                addr_of_instr += 4
-            elif line.startswith(".byte"):
-                _, val_str = line.split(None, 1)
-                val_str = val_str.strip().strip("'\"")
-                decoded = codecs.decode(val_str.encode("utf-8"), "unicode_escape")
-                for c in decoded:
-                    data_segment.append(
-                        (addr_of_instr, f".byte {ord(c)}", ord(c))
-                    )  # Store byte as int
-                    addr_of_instr += 1
-
-        elif section == ".text":
-            text_segment.append((addr_of_instr, line))
-            addr_of_instr += 4
-
-    return label_map, data_segment, text_segment
-
-
-def second_pass(
-    segment_instructions: Sequence[tuple[int, str] | tuple[int, str, int]],
-    label_map: dict[str, int],
-) -> tuple[list[int], list[tuple[int, str, int]]]:
-    """
-    Convert instructions and data to machine code.
-
-    Args:
-        segment_instructions: List of (address, source_line) for text or
-                              (address, source_line, pre_parsed_value) for data.
-        label_map: A dictionary mapping label names to their resolved addresses.
-
-    Returns:
-        - list of binary instructions/data (list of ints)
-        - debug info (address, source_line, encoded_value)
-    """
-    code = []
-    debug_info = []
-
-    for item in segment_instructions:
-        addr_of_instr = item[0]
-        line = item[1]
-
-        if len(item) == 3:  # This is a data segment entry with pre-parsed value
-            # For .word and .byte from data segment, item will be (addr, line_str, parsed_val)
-            original_value = item[2]
-            if line.startswith(".word"):
-                # Re-evaluate if it was a label initially
-                resolved_val = get_token(line.split()[1].strip(), label_map)
-                code.append(resolved_val & 0xFFFFFFFF)
-                debug_info.append((addr_of_instr, line, resolved_val))
-            elif line.startswith(".byte"):
-                # Already correctly parsed as an integer in first_pass for characters
-                code.append(original_value & 0xFF)
-                debug_info.append((addr_of_instr, line, original_value & 0xFF))
+                return
+
+        if self.section == ".text":
+            self.emit_instruction(line)
+        elif self.section == ".data":
+            self.emit_data(line)
+
+    def define(self, label: str) -> None:
+        if label in self.labels:
+            raise ValueError(f"Duplicate label `{label}`")
+        self.labels[label] = self.address
+        self.symbols[label] = (self.section or "", self.address)
+
+    def value(self, operand: str, pc: int = 0, relative: bool = False) -> int | None:
+        """`get_token` over the labels defined so far: None for a label not defined yet."""
+        if operand[:1] in "0123456789+-":
+            return int(operand, 0)
+        if operand.startswith("low("):
+            address = self.labels.get(operand[4:-1])
+            return None if address is None else address & 0xFFF
+        if operand.startswith("high("):
+            address = self.labels.get(operand[5:-1])
+            return None if address is None else address & 0xFFFFF000
+        address = self.labels.get(operand)
+        if address is None or not relative:
+            return address
+        return address - pc
+
+    def emit_instruction(self, line: str) -> None:
+        address: int = self.address
+        index: int = len(self.text_debug)
+        self.text_debug.append((address, line))
+        self.address += 4
+        cached: int | None = self.encoded.get(line)
+        if cached is not None:
+            WORD.pack_into(self.text, 4 * index, cached)
+            return
+
+        tokens: list[str] = line.replace(",", " ").split()
+        typ, base = ENCODINGS[tokens[0]]
+
+        # Same as `encode`, but with the operands split once and labels not defined
+        # yet left to a fixup instead of failing
+        reg = ALIAS_REGISTERS
+        operand: str = ""
+        imm: int | None = 0
+        if typ == "R":
+            word = pack_r(base, reg[tokens[1]], reg[tokens[2]], reg[tokens[3]])
+        elif typ == "I" or typ == "S":
+            if typ == "S" or "(" in tokens[2]:
+                # lw t0, 0(t0)
+                operand, rs1 = tokens[2].split("(")
+                rs1 = rs1.rstrip(")")
             else:
-                raise ValueError(f"Unexpected data segment format: {line}")
-        else:  # This is a text segment instruction
-            instr, operands = parse_line(line)
-            binary = encode((instr, operands), label_map, addr_of_instr)
-            code.append(binary)
-            debug_info.append((addr_of_instr, line, binary))
-    return code, debug_info
-
+                operand, rs1 = tokens[3], tokens[2]
+            imm = self.value(operand)
+            if imm is not None:
+                pack = pack_i if typ == "I" else pack_s
+                word = pack(base, reg[tokens[1]], reg[rs1], imm)
+        elif typ == "B":
+            operand = tokens[3]
+            imm = self.value(operand, address, relative=True)
+            if imm is not None:
+                word = pack_b(base, reg[tokens[1]], reg[tokens[2]], imm)
+        elif typ == "U" or typ == "J":
+            operand = tokens[2]
+            imm = self.value(operand, address, relative=typ == "J")
+            if imm is not None:
+                word = (pack_u if typ == "U" else pack_j)(base, reg[tokens[1]], imm)
+        else:
+            word = encode((tokens[0], tokens[1:]), self.labels, address)
 
-def parse_line(line: str) -> tuple[str, list[str]]:
-    parts = line.strip().split()
-    instr = parts[0]
-    operands = parts[1:] if len(parts) > 1 else []
-    return (instr, operands)
+        if imm is None:
+            label = label_reference(operand)
+            assert label is not None
+            self.fixups.setdefault(label, []).append((".text", index, tokens))
+        else:
+            WORD.pack_into(self.text, 4 * index, word)
+            if typ != "B" and typ != "J":  # not relative to the address
+                self.encoded[line] = word
+
+    def emit_data(self, line: str) -> None:
+        if line.startswith(".word"):
+            tokens: list[str] = line.split()
+            index: int = len(self.data_debug)
+            self.data_debug.append((self.address, line, len(self.data)))
+            label = label_reference(tokens[1])
+            value: int = 0
+            if label is None or label in self.labels:
+                value = get_token(tokens[1], self.labels)
+            else:
+                self.fixups.setdefault(label, []).append((".data", index, tokens))
+            self.data += WORD.pack(value & 0xFFFFFFFF)
+            self.address += 4
+        elif line.startswith(".byte"):
+            _, val_str = line.split(None, 1)
+            val_str = val_str.strip().strip("'\"")
+            decoded = codecs.decode(val_str.encode("utf-8"), "unicode_escape")
+            for c in decoded:
+                self.data_debug.append((self.address, f".byte {ord(c)}", len(self.data)))
+                self.data.append(ord(c) & 0xFF)
+                self.address += 1
+
+    def patch(self, fixup: Fixup) -> None:
+        section, index, tokens = fixup
+        if section == ".text":
+            address, _ = self.text_debug[index]
+            binary = encode((tokens[0], tokens[1:]), self.labels, address)
+            WORD.pack_into(self.text, 4 * index, binary)
+        else:
+            _, _, offset = self.data_debug[index]
+            WORD.pack_into(self.data, offset, get_token(tokens[1], self.labels) & 0xFFFFFFFF)
+
+    def finish(self) -> Image:
+        for label, fixups in self.fixups.items():
+            if label not in self.labels:
+                section, index, _ = fixups[0]
+                debug = self.text_debug if section == ".text" else self.data_debug
+                raise ValueError(f"Undefined label `{label}` in: {debug[index][1]}")
+            for fixup in fixups:
+                self.patch(fixup)
+
+        if not self.text_debug:
+            raise ValueError("No .text segment found or no instructions in .text segment.")
+        text = bytes(self.text[: 4 * len(self.text_debug)])
+
+        text_debug = [
+            (address, line, word)
+            for (address, line), (word,) in zip(
+                self.text_debug, WORD.iter_unpack(text), strict=True
+            )
+        ]
+        # data_debug has the source info and the values of the data segment
+        data_debug = [
+            (address, line, self.data[offset])
+            if line.startswith(".byte")
+            else (address, line, WORD.unpack_from(self.data, offset)[0])
+            for address, line, offset in self.data_debug
+        ]
+        return Image(
+            text=text,
+            data=bytes(self.data),
+            entry=self.text_debug[0][0],
+            text_log=to_hex(text_debug),
+            data_log=to_hex(data_debug),
+            symbols=self.symbols,
+        )
 
 
-# TODO: check if .get() with default value is ok or not
 def get_token(operand: str, label_map: dict[str, int], pc: int = 0, relative: bool = False) -> int:
     """
     Converts an operand into a numeric value.
@@ -253,20 +383,29 @@ def get_token(operand: str, label_map: dict[str, int], pc: int = 0, relative: bo
 
     Returns:
         An integer representing the resolved value of the operand.
+
+    Raises:
+        ValueError: if the operand names a label missing from `label_map`.
     """
     operand = operand.strip(",")
     if operand.startswith("low("):
-        label = operand[4:-1]
-        return label_map.get(label, 0) & 0xFFF
+        return label_address(operand[4:-1], label_map) & 0xFFF
     elif operand.startswith("high("):
-        label = operand[5:-1]
-        return label_map.get(label, 0) & 0xFFFFF000
+        return label_address(operand[5:-1], label_map) & 0xFFFFF000
     elif operand in label_map:
         val = label_map[operand]
         return val - pc if relative else val
+    elif label_reference(operand) is not None:
+        raise ValueError(f"Undefined label `{operand}`")
     return int(operand, 0)
 
 
+def label_address(label: str, label_map: dict[str, int]) -> int:
+    if label not in label_map:
+        raise ValueError(f"Undefined label `{label}`")
+    return label_map[label]
+
+
 def twos_complement(value, bits):
     """
     Converts a signed integer to its two's complement representation
@@ -284,23 +423,82 @@ def twos_complement(value, bits):
     return value
 
 
-# TODO: write comms in `return` section of types
+# mnemonic -> (type, opcode | funct3 << 12 | funct7 << 25): the fixed bits of the instruction
+ENCODINGS: dict[str, tuple[str, int]] = {
+    name: (
+        info["type"],
+        info["opcode"] | info.get("funct3", 0) << 12 | info.get("funct7", 0) << 25,
+    )
+    for name, info in INSTRUCTION_SET.items()
+}
+
+
+def pack_r(base: int, rd: int, rs1: int, rs2: int) -> int:
+    return base | (rs2 << 20) | (rs1 << 15) | (rd << 7)
+
+
+def pack_i(base: int, rd: int, rs1: int, imm: int) -> int:
+    return base | ((imm & 0xFFF) << 20) | (rs1 << 15) | (rd << 7)
+
+
+def pack_s(base: int, rs2: int, rs1: int, imm: int) -> int:
+    imm11_5 = (imm >> 5) & 0x7F
+    imm4_0 = imm & 0x1F
+    return base | (imm11_5 << 25) | (rs2 << 20) | (rs1 << 15) | (imm4_0 << 7)
+
+
+def pack_b(base: int, rs1: int, rs2: int, offset: int) -> int:
+    assert offset % 2 == 0, "B-type offset must be 2-byte aligned"
+    # 13 bit for sign + 12 for val, total offset includes implied 0
+    imm = twos_complement(offset, 13)
+
+    imm_11 = (imm >> 11) & 0x1  # imm[11] -> instr[7]
+    imm_4_1 = (imm >> 1) & 0xF  # imm[4:1] -> instr[11:8]
+    imm_10_5 = (imm >> 5) & 0x3F  # imm[10:5] -> instr[30:25]
+    imm_12 = (imm >> 12) & 0x1  # imm[12] -> instr[31]
+
+    return (
+        base
+        | (imm_12 << 31)
+        | (imm_10_5 << 25)
+        | (rs2 << 20)
+        | (rs1 << 15)
+        | (imm_4_1 << 8)
+        | (imm_11 << 7)
+    )
+
+
+def pack_u(base: int, rd: int, imm: int) -> int:
+    # imm from get_token for high() is already shifted by 12.
+    # Now place it into the correct bit positions in the instruction (bits 31-12)
+    return base | ((imm & 0xFFFFF) << 12) | (rd << 7)
+
+
+def pack_j(base: int, rd: int, offset: int) -> int:
+    assert offset % 2 == 0, "J-type offset must be 2-byte aligned"
+    imm = twos_complement(offset, 21)  # 21 bits (including implied 0)
+
+    imm_20 = (imm >> 20) & 0x1  # imm[20] -> instr[31]
+    imm_10_1 = (imm >> 1) & 0x3FF  # imm[10:1] -> instr[30:21]
+    imm_11 = (imm >> 11) & 0x1  # imm[11] -> instr[20]
+    imm_19_12 = (imm >> 12) & 0xFF  # imm[19:12] -> instr[19:12]
+
+    return base | (imm_20 << 31) | (imm_10_1 << 21) | (imm_11 << 20) | (imm_19_12 << 12) | (rd << 7)
+
+
 def encode(parsed: tuple[str, list[str]], label_map: dict[str, int], addr_of_instr: int) -> int:
+    """
+    Encodes one instruction, `parsed` as (mnemonic, operands), placed at `addr_of_instr`.
+
+    Returns:
+        The 32-bit instruction word.
+    """
     instr, operands = parsed
-    info = INSTRUCTION_SET[instr]
-    opcode = info["opcode"]
-    typ = info["type"]
+    typ, base = ENCODINGS[instr]
 
     if typ == "R":
         rd, rs1, rs2 = [reg_to_num(r) for r in operands]
-        return (
-            (info["funct7"] << 25)
-            | (rs2 << 20)
-            | (rs1 << 15)
-            | (info["funct3"] << 12)
-            | (rd << 7)
-            | opcode
-        )
+        return pack_r(base, rd, rs1, rs2)
 
     elif typ == "I":
         rd = reg_to_num(operands[0])
@@ -312,81 +510,32 @@ def encode(parsed: tuple[str, list[str]], label_map: dict[str, int], addr_of_ins
         else:
             rs1 = reg_to_num(operands[1])
             imm = get_token(operands[2], label_map)
-        return ((imm & 0xFFF) << 20) | (rs1 << 15) | (info["funct3"] << 12) | (rd << 7) | opcode
+        return pack_i(base, rd, rs1, imm)
 
     elif typ == "S":
         rs2 = reg_to_num(operands[0])
         offset_str, rs1_str = operands[1].split("(")
         rs1 = reg_to_num(rs1_str.rstrip(")"))
-        imm = get_token(offset_str, label_map)
-        imm11_5 = (imm >> 5) & 0x7F
-        imm4_0 = imm & 0x1F
-        return (
-            (imm11_5 << 25)
-            | (rs2 << 20)
-            | (rs1 << 15)
-            | (info["funct3"] << 12)
-            | (imm4_0 << 7)
-            | opcode
-        )
+        return pack_s(base, rs2, rs1, get_token(offset_str, label_map))
 
     elif typ == "B":
         rs1 = reg_to_num(operands[0])
         rs2 = reg_to_num(operands[1])
         # Offset is (target_label_address - current_pc)
         offset = get_token(operands[2], label_map, addr_of_instr, relative=True)
-
-        assert offset % 2 == 0, "B-type offset must be 2-byte aligned"
-        imm = twos_complement(
-            offset, 13
-        )  # 13 bit for sign + 12 for val, total offset includes implied 0
-
-        imm_11 = (imm >> 11) & 0x1  # imm[11] -> instr[7]
-        imm_4_1 = (imm >> 1) & 0xF  # imm[4:1] -> instr[11:8]
-        imm_10_5 = (imm >> 5) & 0x3F  # imm[10:5] -> instr[30:25]
-        imm_12 = (imm >> 12) & 0x1  # imm[12] -> instr[31]
-
-        return (
-            (imm_12 << 31)
-            | (imm_10_5 << 25)
-            | (rs2 << 20)
-            | (rs1 << 15)
-            | (info["funct3"] << 12)
-            | (imm_4_1 << 8)
-            | (imm_11 << 7)
-            | opcode
-        )
+        return pack_b(base, rs1, rs2, offset)
 
     elif typ == "U":
-        rd = reg_to_num(operands[0])
-        imm_val = get_token(operands[1], label_map)
-        # imm_val from get_token for high() is already shifted by 12.
-        # Now place it into the correct bit positions in the instruction (bits 31-12)
-        return ((imm_val & 0xFFFFF) << 12) | (rd << 7) | opcode
+        return pack_u(base, reg_to_num(operands[0]), get_token(operands[1], label_map))
 
     elif typ == "J":
         rd = reg_to_num(operands[0])
         # Offset is (target_label_address - current_pc)
         offset = get_token(operands[1], label_map, addr_of_instr, relative=True)
-        assert offset % 2 == 0, "J-type offset must be 2-byte aligned"
-        imm = twos_complement(offset, 21)  # 21 bits (including implied 0)
-
-        imm_20 = (imm >> 20) & 0x1  # imm[20] -> instr[31]
-        imm_10_1 = (imm >> 1) & 0x3FF  # imm[10:1] -> instr[30:21]
-        imm_11 = (imm >> 11) & 0x1  # imm[11] -> instr[20]
-        imm_19_12 = (imm >> 12) & 0xFF  # imm[19:12] -> instr[19:12]
-
-        return (
-            (imm_20 << 31)
-            | (imm_10_1 << 21)
-            | (imm_11 << 20)
-            | (imm_19_12 << 12)
-            | (rd << 7)
-            | opcode
-        )
+        return pack_j(base, rd, offset)
 
     elif typ == "SYS":
-        return opcode  # opcode is already 0x7F for `halt`
+        return base  # opcode is already 0x7F for `halt`
 
     else:
         raise NotImplementedError(f"Unsupported instruction type: {typ}")
@@ -408,63 +557,44 @@ def dump_bin_as_text(bin_path: str) -> None:
         f.write("\n".join(lines))
 
 
-def write_binaries(
-    text_code: list[int],
-    data_code_debug: list[tuple[int, str, int]],
-    text_debug: list[tuple[int, str, int]],
-    data_debug: list[tuple[int, str, int]],
-    target_path: str,
-) -> None:
-    """
-    Writes the binary code and debug logs to files.
-
-    Args:
-        text_code: List of encoded text segment instructions (ints).
-        data_code_debug: Debug info for data segment, used to generate .data.bin.
-                         Contains (address, source_line_type, value).
-        text_debug: Debug info for text segment (address, source_line, encoded_value).
-        data_debug: Debug info for data segment (address, source_line, encoded_value).
-        target_path: Base path for output files.
-    """
-    with open(target_path + ".data.bin", "wb") as f:
-        f.write(to_bytes_data(data_code_debug))  # Use data_debug to reconstruct data bytes
-
-    with open(target_path + ".text.log", "w", encoding="utf-8") as f:
-        f.write(to_hex(text_debug))
-
-    with open(target_path + ".data.log", "w", encoding="utf-8") as f:
-        f.write(to_hex(data_debug))
+def assemble(source: str) -> Image:
+    """Translates assembly source text into an in-memory program image."""
+    lines = expand_macros(source.splitlines())
+    assembler = Assembler(len(lines))
+    for line in lines:
+        assembler.feed(line)
+    return assembler.finish()
 
 
-def main(source_path, target_path):
-    """Create .bin files and debugging info"""
+def main(source_path, target_path, cache_dir=None):
+    """Create .bin files and debugging info, reusing cached images if `cache_dir` is set"""
 
     with open(source_path, encoding="utf-8") as f:
         source = f.read()
 
-    lines = expand_macros(source.splitlines())
-    label_map, data_segment, text_segment = first_pass(lines)
-
-    if not text_segment:
-        raise ValueError("No .text segment found or no instructions in .text segment.")
-    text_segment_start_address = text_segment[0][0]
-
-    # TODO: refactor
-
-    # data_code will be a flat list of bytes/words, data_debug will have source info
-    data_code_list, data_debug = second_pass(data_segment, label_map)
-    text_code, text_debug = second_pass(text_segment, label_map)
+    if cache_dir is None:
+        image = assemble(source)
+    else:
+        from machine.assembly_cache import AssemblyCache  # it imports this module
 
-    # a little messy, but i had to do it since i gotta put initial text segment addr
-    with open(target_path + ".text.bin", "wb") as f:
-        f.write(to_bytes_text(text_code, text_segment_start_address))
+        image = AssemblyCache(cache_dir).assemble(source)
 
-    # Pass data_debug to write_binaries for .data.bin generation
-    write_binaries(text_code, data_debug, text_debug, data_debug, target_path)
+    image.write(target_path)
     print(".text and .data binaries generated.")
 
 
 if __name__ == "__main__":
-    assert len(sys.argv) == 3, "Wrong arguments: translator.py <input_file> <target_file>"
-    _, source, target = sys.argv
-    main(source, target)
+    cache_dir = None
+    args = []
+    for arg in sys.argv[1:]:
+        if arg == "--cache" or arg.startswith("--cache="):
+            from machine.assembly_cache import DEFAULT_CACHE_DIR
+
+            cache_dir = arg.split("=", 1)[1] if "=" in arg else DEFAULT_CACHE_DIR
+        else:
+            args.append(arg)
+    assert len(args) == 2, (
+        "Wrong arguments: translator.py <input_file> <target_file> [--cache[=DIR]]"
+    )
+    source, target = args
+    main(source, target, cache_dir)
@@ -5,8 +5,8 @@ out_addr: .word 0x2
 .text
 .org 0x100
     # a1 = *in_addr
-    lui a1, high(in_addr)
-    addi a1, a1, low(in_addr)
+    lui a1, high(inp_addr)
+    addi a1, a1, low(inp_addr)
     lw a1, 0(a1)
 
     # a2 = *out_addr
@@ -0,0 +1,193 @@
+# run_batch.py
+"""
+Translates and runs many programs in parallel worker processes.
+
+The manifest is a JSON list of jobs (or an object with a "jobs" list):
+
+    [
+        {"name": "sort", "asm": "algorithms/sort.asm",
+         "input": "algorithms/sort_input.txt", "input_mode": "words"},
+        {"asm": "algorithms/hello_world.asm", "engine": "jit"}
+    ]
+
+Paths are relative to the manifest. `name` defaults to the file name of `asm`, and
+"engine", "trace", "text_size" and "data_size" override the defaults from the command
+line for one job. Each job gets its own directory `<out_dir>/<name>/` with the
+binaries, `stdout.txt`, `final_snapshot.txt` and `log_output/`, so jobs never share
+files. The results are printed as a table and written to `<out_dir>/results.json`.
+With `--cache`, assembled images are reused across runs (see machine/assembly_cache.py).
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from machine.api import FAULT
+from machine.assembly_cache import DEFAULT_CACHE_DIR, AssemblyCache
+from machine.translator import assemble
+from run_machine import ENGINES, run
+
+RUN_OPTIONS = ("engine", "trace", "text_size", "data_size")
+
+
+@dataclass
+class Job:
+    name: str
+    asm: str
+    input: str | None = None
+    input_mode: str = "bytes"
+    options: dict = field(default_factory=dict)  # RUN_OPTIONS given for this job
+
+
+@dataclass
+class JobResult:
+    name: str
+    status: str  # "halted", "stopped" (out of budget) or "error"
+    job_dir: str
+    ticks: int = 0
+    output: str = ""
+    error: str | None = None
+    translate_seconds: float = 0.0
+    run_seconds: float = 0.0
+
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    entries = manifest["jobs"] if isinstance(manifest, dict) else manifest
+    base = os.path.dirname(os.path.abspath(path))
+
+    jobs: list[Job] = []
+    for entry in entries:
+        asm = os.path.join(base, entry["asm"])
+        name = entry.get("name", os.path.splitext(os.path.basename(asm))[0])
+        if any(job.name == name for job in jobs):
+            raise ValueError(f"Duplicate job name in manifest: {name}")
+        jobs.append(
+            Job(
+                name=name,
+                asm=asm,
+                input=os.path.join(base, entry["input"]) if entry.get("input") else None,
+                input_mode=entry.get("input_mode", "bytes"),
+                options={key: entry[key] for key in RUN_OPTIONS if key in entry},
+            )
+        )
+    return jobs
+
+
+def run_job(job, out_dir, engine="microcode", trace="instruction", cache_dir=None):
+    """Translates and runs one job in `<out_dir>/<job.name>/` (called in a worker)."""
+    job_dir = os.path.abspath(os.path.join(out_dir, job.name))
+    os.makedirs(job_dir, exist_ok=True)
+    result = JobResult(job.name, "error", job_dir)
+    options = {"engine": engine, "trace": trace, **job.options}
+
+    start = time.perf_counter()
+    target = os.path.join(job_dir, "out")
+    try:
+        with open(job.asm, encoding="utf-8") as f:
+            source = f.read()
+        assemble_source = assemble if cache_dir is None else AssemblyCache(cache_dir).assemble
+        assemble_source(source).write(target)
+    except Exception as e:
+        result.error = f"translation failed: {type(e).__name__}: {e}"
+        return result
+    finally:
+        result.translate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        with (
+            open(os.path.join(job_dir, "stdout.txt"), "w") as stdout,
+            contextlib.redirect_stdout(stdout),
+        ):
+            cpu, status = run(
+                f"{target}.text.bin",
+                f"{target}.data.bin",
+                job.input,
+                job.input_mode,
+                engine=options["engine"],
+                trace_level=options["trace"],
+                out_dir=job_dir,
+                log_dir=os.path.join(job_dir, "log_output"),
+                **{key: options[key] for key in ("text_size", "data_size") if key in options},
+            )
+    except Exception as e:  # reported per job, the batch goes on
+        result.error = f"{type(e).__name__}: {e}"
+    else:
+        if status.reason == FAULT:
+            result.error = f"{type(status.fault).__name__}: {status.fault}"
+        else:
+            result.status = "halted" if status.halted else "stopped"
+        result.ticks = cpu.ticks
+        result.output = cpu.output_device.render()
+    result.run_seconds = time.perf_counter() - start
+    return result
+
+
+def run_batch(
+    jobs, out_dir="batch_out", workers=None, engine="microcode", trace="instruction", cache_dir=None
+):
+    """Runs `jobs` on `workers` processes (all cores by default), results in job order."""
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job, out_dir, engine, trace, cache_dir) for job in jobs]
+        results = [future.result() for future in futures]
+
+    with open(os.path.join(out_dir, "results.json"), "w") as f:
+        json.dump([asdict(result) for result in results], f, indent=2)
+    return results
+
+
+def print_report(results):
+    print(f"{'job':<24} {'status':<8} {'ticks':>10} {'translate':>10} {'run':>10}")
+    for r in results:
+        print(
+            f"{r.name:<24} {r.status:<8} {r.ticks:>10} "
+            f"{r.translate_seconds:>9.3f}s {r.run_seconds:>9.3f}s"
+        )
+        if r.error:
+            print(f"    {r.error}")
+    failed = sum(r.status == "error" for r in results)
+    print(f"{len(results)} jobs, {failed} failed")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(
+            "Usage: python run_batch.py <manifest.json> [--out-dir=DIR] [--jobs=N] "
+            "[--engine=microcode|fast|jit] [--trace=off|instruction|microstep] "
+            "[--cache[=DIR]]"
+        )
+        sys.exit(1)
+
+    out_dir = "batch_out"
+    workers = None
+    engine = "microcode"
+    trace = "instruction"
+    cache_dir = None
+    for arg in sys.argv[2:]:
+        if arg.startswith("--out-dir="):
+            out_dir = arg.split("=", 1)[1]
+        elif arg.startswith("--jobs="):
+            workers = int(arg.split("=")[1])
+        elif arg.startswith("--engine="):
+            engine = arg.split("=")[1]
+            if engine not in ENGINES:
+                print(f"Error: --engine must be one of {', '.join(ENGINES)}")
+                sys.exit(1)
+        elif arg.startswith("--trace="):
+            trace = arg.split("=")[1]
+        elif arg == "--cache" or arg.startswith("--cache="):
+            cache_dir = arg.split("=", 1)[1] if "=" in arg else DEFAULT_CACHE_DIR
+        else:
+            print(f"Error: unknown option {arg}")
+            sys.exit(1)
+
+    results = run_batch(load_manifest(sys.argv[1]), out_dir, workers, engine, trace, cache_dir)
+    print_report(results)
+    sys.exit(1 if any(r.status == "error" for r in results) else 0)
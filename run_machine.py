@@ -1,19 +1,58 @@
 # run_machine.py
+import os
+import re
 import sys
+import time
 
-from machine.machine import CPU
+from machine.api import (
+    BUDGET,
+    ENGINES,
+    FAULT,
+    HALTED,
+    Budget,
+    ExitStatus,
+    load,
+    run_until,
+)
+from machine.checkpoint import read_checkpoint, write_checkpoint
+from machine.debugger import Debugger
+from machine.image import Image, parse_location, read_listing, read_symbols
+from machine.logger import TRACE_FORMATS, TRACE_LEVELS
+from machine.machine import DATA_MEMORY_SIZE
+from machine.memory import format_size
+from machine.profiler import Profiler
+from machine.replay import DEFAULT_CHECKPOINT_EVERY, Recorder, Recording, goto_tick, replay
 
+TEXT_MEMORY_SIZE = 64 * 1024
+SIZE_SUFFIXES = {"K": 1024, "M": 1024 * 1024}
+# process exit status by ExitStatus.reason (0 for the others: a halt or a requested stop);
+# errors in the arguments exit with 1 too
+EXIT_CODES = {FAULT: 1, BUDGET: 2}
+LIMIT_OPTIONS = {"max-ticks": "ticks", "max-instructions": "instructions", "timeout": "seconds"}
 
-def load_binary(path):
-    with open(path, "rb") as f:
-        return f.read()
+
+def parse_size(text):
+    """Parses a memory size in bytes: `65536`, `0x10000`, `64K` or `1M`."""
+    multiplier = SIZE_SUFFIXES.get(text[-1:].upper(), 1)
+    if multiplier != 1:
+        text = text[:-1]
+    return int(text, 0) * multiplier
+
+
+def parse_number(text, kind=int, minimum=0):
+    """`text` as an int (or `kind`) of at least `minimum`; ValueError otherwise."""
+    number = kind(text)
+    if not number >= minimum:  # also rejects NaN
+        raise ValueError(f"{text} is less than {minimum}")
+    return number
 
 
 def dump_snapshot(cpu, path="out/final_snapshot.txt"):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
     with open(path, "w") as f:
         f.write("[Registers]\n")
         for i in range(0, 32, 4):
-            line = " ".join(f"r{j:02d}={cpu.registers[j]:08X}" for j in range(i, i + 4))
+            line = " ".join(f"r{j:02d}={cpu.registers[j] & 0xFFFFFFFF:08X}" for j in range(i, i + 4))
             f.write(line + "\n")
 
         # Dump memory: 0x300..0x340 (example range)
@@ -26,71 +65,259 @@ def dump_snapshot(cpu, path="out/final_snapshot.txt"):
             else:
                 f.write(f"{addr:08X}: (out of bounds)\n")
 
-        # Dump output buffer
+        # Dump output buffer (the kept tail of it, see --output-tail)
         f.write("\n[Output buffer]\n")
-        if all(isinstance(x, int) for x in cpu.output_buffer):
-            # Join integers with newline, making sure each is converted to string
-            output = "\n".join(str(x) for x in cpu.output_buffer)
+        f.write(cpu.output_device.render() + "\n")
+
+
+def load_cpu(
+    instr_path,
+    data_path,
+    input_file=None,
+    input_mode="bytes",
+    trace_level="instruction",
+    trace_ring=None,
+    trace_format="text",
+    text_size=TEXT_MEMORY_SIZE,
+    data_size=DATA_MEMORY_SIZE,
+    output_stream=None,
+    output_tail=None,
+    log_dir="log_output",
+):
+    # mapped, not read (see Image.load)
+    image = Image.load(instr_path, data_path)
+
+    if image.entry + len(image.text) > text_size:
+        raise ValueError(
+            "Instruction memory overflow: instructions exceed allocated "
+            f"{format_size(text_size)}."
+        )
+
+    cpu = load(
+        image,
+        trace_level=trace_level,
+        trace_ring=trace_ring,
+        trace_format=trace_format,
+        data_size=data_size,
+        output_stream=output_stream,
+        output_tail=output_tail,
+        log_dir=log_dir,
+    )
+
+    if input_file:
+        cpu.load_input_file(input_file, as_words=(input_mode == "words"))
+
+    return cpu
+
+
+def run(
+    instr_path,
+    data_path,
+    input_file=None,
+    input_mode="bytes",
+    engine="microcode",
+    trace_level="instruction",
+    trace_ring=None,
+    trace_format="text",
+    text_size=TEXT_MEMORY_SIZE,
+    data_size=DATA_MEMORY_SIZE,
+    output=None,
+    output_tail=None,
+    out_dir="out",
+    log_dir="log_output",
+    profile=None,
+    checkpoint_every=None,
+    resume=None,
+    record=None,
+    replay_path=None,
+    goto=None,
+    debug=False,
+    budget=None,
+    stop_at=(),
+    stop_on_output=None,
+):
+    # out_dir gets final_snapshot.txt, log_dir the trace
+    # profile: None, or the number of hot spots to print (see load_profiler)
+    # checkpoint_every: ticks between checkpoints written to <out_dir>/checkpoint.bin;
+    # resume: a checkpoint to restore (of the same program and input) before running
+    # record: file to record the input into; replay_path: a recording to take the input
+    # from (instead of input_file), goto: a tick to re-execute up to from its checkpoints
+    # debug: run the program under the interactive debugger, with commands from stdin
+    # budget: the limits of the run (machine.api.Budget, 100 000 ticks by default);
+    # stop_at: addresses to stop in front of; stop_on_output: a regular expression the
+    # output is matched against, stopping the run on a match
+    # output: None to print it after halt, "-" to stream it to stdout, or a file path
+    # Returns (cpu, its machine.api.ExitStatus), the status None after a debug session
+    output_stream = None
+    if output == "-":
+        output_stream = sys.stdout
+    elif output is not None:
+        output_stream = open(output, "w")  # noqa: SIM115 -- closed after the run
+
+    recorder = None
+    try:
+        cpu = load_cpu(
+            instr_path,
+            data_path,
+            input_file,
+            input_mode,
+            trace_level,
+            trace_ring,
+            trace_format,
+            text_size,
+            data_size,
+            output_stream,
+            output_tail,
+            log_dir,
+        )
+        if resume is not None:
+            read_checkpoint(cpu, resume)
+            print(f"Resumed from {resume} at tick {cpu.ticks}")
+        if replay_path is not None:
+            recording = Recording.read(replay_path)
+            if goto is None:
+                replay(cpu, recording)
+            else:
+                start = goto_tick(cpu, recording, goto)
+                print(f"Replayed to tick {cpu.ticks} from the checkpoint at tick {start}")
+        if record is not None:
+            recorder = Recorder(cpu)
+        profiler = None if profile is None else load_profiler(cpu, instr_path)
+        checkpoint_path = os.path.join(out_dir, "checkpoint.bin")
+        status = None
+        if debug:
+            debug_session(cpu, instr_path)
         else:
-            # Join characters directly
-            output = "".join(cpu.output_buffer)
+            status = execute(
+                cpu,
+                engine,
+                profiler,
+                checkpoint_every,
+                checkpoint_path,
+                recorder,
+                budget,
+                stop_at,
+                stop_on_output,
+            )
+    finally:
+        if output_stream is not None and output_stream is not sys.stdout:
+            output_stream.close()
+        if recorder is not None:  # also after errors: replaying them is the point
+            recorder.recording.write(record)
+            print(f"Recording written to {record}")
 
-        f.write(output + "\n")
+    # a fault or a stop leaves the machine running
+    print("==== MACHINE STOPPED ====" if cpu.running else "==== MACHINE HALTED ====")
 
+    if output is None:
+        print("Output buffer:")
+        print(cpu.output_device.render())
+    elif output != "-":
+        print(f"Output written to {output}")
 
-def run(instr_path, data_path, input_file=None, input_mode="bytes"):
-    full_instr_mem = load_binary(instr_path)
-    data_mem_bytes = load_binary(data_path)
+    dump_snapshot(cpu, os.path.join(out_dir, "final_snapshot.txt"))
+    cpu.perf.write_report(cpu, os.path.join(out_dir, "perf.json"))
+    if profiler is not None:
+        print("==== PROFILE ====")
+        print(profiler.format_table(profile))
+        profiler.write_folded(os.path.join(out_dir, "profile.folded"))
+    return cpu, status
 
-    # The first 4 bytes of the .text.bin file contain the entry point address
-    entry_pc = int.from_bytes(full_instr_mem[:4], "little")
-    instr_bytes = full_instr_mem[4:]
-    entry_pc = int.from_bytes(
-        full_instr_mem[:4], "little"
-    )  # the first 4 bytes to get the start addr of instructions
 
-    # Allocate instruction memory (e.g., 64 KB)
-    instr_mem = bytearray(64 * 1024)
-    # Place instructions at specific place in mem (from the start addr)
-    if entry_pc + len(instr_bytes) > len(instr_mem):
-        raise ValueError("Instruction memory overflow: instructions exceed allocated 64KB.")
-    instr_mem[entry_pc : entry_pc + len(instr_bytes)] = instr_bytes
+def load_debug_info(instr_path):
+    """(listing, symbols) from the .text.log and .sym the translator wrote next to `instr_path`."""
+    target = instr_path.removesuffix(".text.bin")
+    listing = read_listing(target + ".text.log") if os.path.exists(target + ".text.log") else {}
+    symbols = read_symbols(target + ".sym") if os.path.exists(target + ".sym") else {}
+    return listing, symbols
 
-    cpu = CPU(instr_mem, data_mem_bytes)
-    cpu.pc = entry_pc
 
-    if input_file:
-        cpu.load_input_file(input_file, as_words=(input_mode == "words"))
+def load_profiler(cpu, instr_path):
+    """A profiler with the listing and symbols the translator wrote next to `instr_path`."""
+    return Profiler(cpu, *load_debug_info(instr_path))
+
+
+def debug_session(cpu, instr_path):
+    print("==== DEBUGGER ==== (`help` lists the commands)")
+    try:
+        Debugger(cpu, *load_debug_info(instr_path)).repl()
+    finally:
+        cpu.logger.finish()
+        cpu.output_device.flush()
 
+
+def execute(
+    cpu,
+    engine,
+    profiler=None,
+    checkpoint_every=None,
+    checkpoint_path="checkpoint.bin",
+    recorder=None,
+    budget=None,
+    stop_at=(),
+    output_pattern=None,
+):
+    """Runs `cpu` as configured and returns its machine.api.ExitStatus."""
     print("==== MACHINE START ====")
-    # TODO: make step_count the same as tick_count in Microcode
-    step_count = 0
-    max_steps = 100_000
-    while cpu.running:
-        cpu.step()
-        step_count += 1
-        # sort for 30 nums requires more than 10_000 steps MonkaS
-        if step_count > max_steps:
-            print("Execution stopped: too many steps")
-            break
-
-    print("==== MACHINE HALTED ====")
-    cpu.logger.finish()
-
-    print("Output buffer:")
-    # pretty print
-    if all(isinstance(x, int) for x in cpu.output_buffer):
-        print("\n".join(str(x) for x in cpu.output_buffer))
-    else:
-        print("".join(str(x) for x in cpu.output_buffer))
-
-    dump_snapshot(cpu)
+    # every engine counts ticks (microinstructions), so the budget is the same for all;
+    # a resumed run gets a budget of its own
+    budget = budget or Budget()
+    try:
+        if profiler is not None:
+            status = run_profiled(cpu, engine, profiler, budget)
+        else:
+            save = None
+            if checkpoint_every is not None or recorder is not None:
+
+                def save(cpu):
+                    if checkpoint_every is not None:
+                        write_checkpoint(cpu, checkpoint_path)
+                    if recorder is not None:
+                        recorder.checkpoint(cpu)
+
+            every = checkpoint_every or DEFAULT_CHECKPOINT_EVERY
+            status = run_until(cpu, engine, budget, stop_at, output_pattern, every, save)
+    finally:
+        # also on errors, so a ring-buffer trace shows the steps that led to them
+        cpu.logger.finish()
+        cpu.output_device.flush()
+
+    if cpu.output_device.stream is sys.stdout:
+        print()  # end the streamed output's last line
+
+    if not status.halted:
+        print(f"Execution stopped: {status.describe()}")
+    if cpu.running and status.reason != FAULT:
+        write_checkpoint(cpu, checkpoint_path)
+        print(f"Checkpoint written to {checkpoint_path} (continue with --resume={checkpoint_path})")
+    return status
+
+
+def run_profiled(cpu, engine, profiler, budget):
+    """Profiler.run under the tick limit of `budget` (the only one it knows)."""
+    ticks, instructions, started = cpu.ticks, cpu.perf.instructions, time.perf_counter()
+    profiler.run(engine, sys.maxsize if budget.ticks is None else ticks + budget.ticks)
+    return ExitStatus(
+        BUDGET if cpu.running else HALTED,
+        ticks=cpu.ticks - ticks,
+        instructions=cpu.perf.instructions - instructions,
+        seconds=time.perf_counter() - started,
+        detail="ticks" if cpu.running else "",
+    )
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
         print(
-            "Usage: python run_machine.py <text_bin> <data_bin> [input_file] [--input-mode=bytes|words]"
+            "Usage: python run_machine.py <text_bin> <data_bin> [input_file] "
+            "[--input-mode=bytes|words] [--engine=microcode|fast|jit] "
+            "[--trace=off|instruction|microstep] [--trace-ring=N] "
+            "[--trace-format=text|binary] [--text-size=BYTES] [--data-size=BYTES] "
+            "[--output=FILE|-] [--output-tail=N] [--out-dir=DIR] [--log-dir=DIR] "
+            "[--profile[=N]] [--checkpoint-every=TICKS] [--resume=FILE] "
+            "[--record=FILE] [--replay=FILE [--goto-tick=TICK]] [--debug] "
+            "[--max-ticks=N] [--max-instructions=N] [--timeout=SECONDS] "
+            "[--stop-at=LOC ...] [--stop-on-output=REGEX]"
         )
         sys.exit(1)
 
@@ -98,6 +325,24 @@ if __name__ == "__main__":
     data_bin = sys.argv[2]
     input_file = None
     input_mode = None
+    engine = "microcode"
+    trace_level = "instruction"
+    trace_ring = None
+    trace_format = "text"
+    sizes = {"text": TEXT_MEMORY_SIZE, "data": DATA_MEMORY_SIZE}
+    output = None
+    output_tail = None
+    dirs = {"out": "out", "log": "log_output"}
+    profile = None
+    checkpoint_every = None
+    resume = None
+    record = None
+    replay_path = None
+    goto = None
+    debug = False
+    budget = Budget()
+    stop_locations = []
+    stop_on_output = None
 
     # Parse arguments starting from the third one
     for arg in sys.argv[3:]:
@@ -106,12 +351,113 @@ if __name__ == "__main__":
             if input_mode not in {"bytes", "words"}:
                 print("Error: --input-mode must be 'bytes' or 'words'")
                 sys.exit(1)
+        elif arg.startswith("--engine="):
+            engine = arg.split("=")[1]
+            if engine not in ENGINES:
+                print(f"Error: --engine must be one of {', '.join(ENGINES)}")
+                sys.exit(1)
+        elif arg.startswith("--trace="):
+            trace_level = arg.split("=")[1]
+            if trace_level not in TRACE_LEVELS:
+                print(f"Error: --trace must be one of {', '.join(TRACE_LEVELS)}")
+                sys.exit(1)
+        elif arg.startswith("--trace-ring="):
+            try:
+                trace_ring = parse_number(arg.split("=")[1], minimum=1)
+            except ValueError:
+                print("Error: --trace-ring must be a positive number of lines")
+                sys.exit(1)
+        elif arg.startswith("--trace-format="):
+            trace_format = arg.split("=")[1]
+            if trace_format not in TRACE_FORMATS:
+                print(f"Error: --trace-format must be one of {', '.join(TRACE_FORMATS)}")
+                sys.exit(1)
+        elif arg.startswith("--output="):
+            output = arg.split("=", 1)[1]
+        elif arg.startswith("--output-tail="):
+            try:
+                output_tail = parse_number(arg.split("=")[1])
+            except ValueError:
+                print("Error: --output-tail must be a non-negative number of values")
+                sys.exit(1)
+        elif arg.startswith(("--out-dir=", "--log-dir=")):
+            name, value = arg[2:].split("=", 1)
+            dirs[name.split("-")[0]] = value
+        elif arg == "--profile" or arg.startswith("--profile="):
+            profile = int(arg.split("=")[1]) if "=" in arg else 20
+        elif arg.startswith("--checkpoint-every="):
+            checkpoint_every = int(arg.split("=")[1])
+            if checkpoint_every <= 0:
+                print("Error: --checkpoint-every must be a positive number of ticks")
+                sys.exit(1)
+        elif arg.startswith("--resume="):
+            resume = arg.split("=", 1)[1]
+        elif arg.startswith("--record="):
+            record = arg.split("=", 1)[1]
+        elif arg.startswith("--replay="):
+            replay_path = arg.split("=", 1)[1]
+        elif arg.startswith("--goto-tick="):
+            try:
+                goto = parse_number(arg.split("=")[1])
+            except ValueError:
+                print("Error: --goto-tick must be a non-negative tick number")
+                sys.exit(1)
+        elif arg == "--debug":
+            debug = True
+        elif arg.startswith(("--max-ticks=", "--max-instructions=", "--timeout=")):
+            name, value = arg[2:].split("=", 1)
+            try:
+                number = parse_number(value, float if name == "timeout" else int)
+            except ValueError:
+                print(f"Error: --{name} must be a non-negative number (0 for no limit)")
+                sys.exit(1)
+            setattr(budget, LIMIT_OPTIONS[name], number or None)
+        elif arg.startswith("--stop-at="):
+            stop_locations.append(arg.split("=", 1)[1])
+        elif arg.startswith("--stop-on-output="):
+            stop_on_output = arg.split("=", 1)[1]
+            try:
+                re.compile(stop_on_output)
+            except re.error as e:
+                print(f"Error: --stop-on-output is not a valid regular expression: {e}")
+                sys.exit(1)
+        elif arg.startswith(("--text-size=", "--data-size=")):
+            name, value = arg[2:].split("=")
+            try:
+                sizes[name.split("-")[0]] = parse_size(value)
+            except ValueError:
+                print(f"Error: --{name} must be a number of bytes, e.g. 65536, 0x10000 or 64K")
+                sys.exit(1)
         else:
             if input_file is not None:
                 print("Error: multiple input files specified. Only one input file is supported.")
                 sys.exit(1)
             input_file = arg
 
+    if replay_path is not None and (input_file is not None or resume is not None):
+        print("Error: --replay takes the input from the recording, without input file or --resume")
+        sys.exit(1)
+    if goto is not None and replay_path is None:
+        print("Error: --goto-tick needs a recording to replay (--replay=FILE)")
+        sys.exit(1)
+    if record is not None and (replay_path is not None or resume is not None):
+        print("Error: --record records a run from its start, without --replay or --resume")
+        sys.exit(1)
+    if debug and any(option is not None for option in (resume, replay_path, record, profile)):
+        print("Error: --debug starts the program afresh: no --resume, --replay, --record, --profile")
+        sys.exit(1)
+
+    stops = stop_locations or stop_on_output is not None
+    if profile is not None and (stops or budget.instructions or budget.seconds):
+        print("Error: --profile runs under --max-ticks only, without other limits or stops")
+        sys.exit(1)
+    symbols = load_debug_info(instr_bin)[1] if stop_locations else {}
+    try:
+        stop_at = [parse_location(location, symbols) for location in stop_locations]
+    except ValueError as e:
+        print(f"Error: --stop-at: {e}")
+        sys.exit(1)
+
     # Warning if mode not specified when input_file is provided
     if input_file and input_mode is None:
         print("[WARNING] No --input-mode specified. Assuming 'bytes'")
@@ -123,4 +469,30 @@ if __name__ == "__main__":
             None  # Reset if no input file, so load_input_file isn't called with default mode
         )
 
-    run(instr_bin, data_bin, input_file, input_mode)
+    _, status = run(
+        instr_bin,
+        data_bin,
+        input_file,
+        input_mode,
+        engine,
+        trace_level,
+        trace_ring,
+        trace_format,
+        sizes["text"],
+        sizes["data"],
+        output,
+        output_tail,
+        dirs["out"],
+        dirs["log"],
+        profile,
+        checkpoint_every,
+        resume,
+        record,
+        replay_path,
+        goto,
+        debug,
+        budget,
+        stop_at,
+        stop_on_output,
+    )
+    sys.exit(0 if status is None else EXIT_CODES.get(status.reason, 0))
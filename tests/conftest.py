@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from run_machine import load_cpu
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    """Translates a program and returns a factory of fresh CPUs loaded with it."""
+
+    def _build(asm, input_file=None, input_mode="bytes"):
+        target = str(tmp_path / "out")
+        translator = os.path.join(ROOT, "machine", "translator.py")
+        subprocess.run(
+            [sys.executable, translator, os.path.join(ROOT, asm), target],
+            check=True,
+            capture_output=True,
+        )
+        input_path = os.path.join(ROOT, input_file) if input_file else None
+        return lambda **kwargs: load_cpu(
+            f"{target}.text.bin", f"{target}.data.bin", input_path, input_mode, **kwargs
+        )
+
+    monkeypatch.chdir(tmp_path)  # keep trace.log out of the repository
+    return _build
@@ -0,0 +1,39 @@
+import pytest
+
+from machine.alu import ALU, to_signed32
+from machine.microcode import MicrocodeROM
+
+
+@pytest.mark.parametrize(
+    ("op", "a", "b", "expected"),
+    [
+        ("add", 0x7FFFFFFF, 1, -0x80000000),
+        ("sub", -0x80000000, 1, 0x7FFFFFFF),
+        ("mul", 0x10000, 0x10000, 0),
+        ("div", -0x80000000, -1, -0x80000000),
+        ("div", 7, 0, 0),
+        ("lsl", 1, 31, -0x80000000),
+        ("lsl", 1, 33, 2),
+        ("lsr", -1, 28, 0xF),
+        ("andi", -1, 0xFF, 0xFF),
+    ],
+)
+def test_results_wrap_to_32_bits(op, a, b, expected):
+    alu = ALU()
+    assert alu.exec(alu.op_id(op), a, b) == expected
+
+
+def test_to_signed32():
+    assert to_signed32(0xFFFFFFFF) == -1
+    assert to_signed32(0x1_0000_0005) == 5
+    assert to_signed32(-0x80000001) == 0x7FFFFFFF
+
+
+def test_rom_assigns_an_id_to_every_alu_microinstruction():
+    rom = MicrocodeROM()
+    used = {mi.latch_alu for mi in rom.code.values() if mi.latch_alu}
+    assert set(rom.alu.op_ids) == used
+    assert sorted(rom.alu.op_ids.values()) == list(range(len(used)))
+    for mi in rom.code.values():
+        if mi.latch_alu:
+            assert rom.alu.op_ids[mi.latch_alu] == mi.alu_op
@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+from machine.api import (
+    BUDGET,
+    FAULT,
+    OUTPUT,
+    STOP_PC,
+    Budget,
+    execute,
+    input_values,
+    load,
+    run_until,
+)
+from machine.image import Image, read_listing, read_symbols
+from machine.memory import MemoryFault
+from machine.microcode import IllegalInstruction
+from machine.translator import assemble
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _source(name):
+    with open(os.path.join(ROOT, "algorithms", f"{name}.asm")) as f:
+        return f.read()
+
+
+def _expected_output(name):
+    with open(os.path.join(ROOT, "tests", "expected", name, "final_snapshot.txt")) as f:
+        return f.read().split("[Output buffer]\n", 1)[1].rstrip("\n")
+
+
+@pytest.mark.parametrize("engine", ["microcode", "fast", "jit"])
+def test_execute_runs_source_in_process(engine):
+    with open(os.path.join(ROOT, "algorithms", "sort_input.txt")) as f:
+        numbers = f.read()
+
+    result = execute(_source("sort"), numbers, "words", engine=engine)
+
+    assert result.halted
+    assert result.output == _expected_output("sort")
+    assert result.values == [int(line) for line in result.output.splitlines()]
+    assert result.ticks == execute(_source("sort"), numbers, "words").ticks
+
+
+def test_execute_takes_text_input_and_images():
+    image = assemble(_source("hello_user_name"))
+    result = execute(image, "Walter White", engine="jit")
+    assert result.output == _expected_output("hello_user_name")
+
+
+def test_input_values():
+    assert list(input_values("hi")) == [104, 105, 0]
+    assert list(input_values(b"x\x00")) == [120, 0]
+    assert list(input_values("1\n\n-2\n", "words")) == [1, -2]
+    assert list(input_values([5, 6], "words")) == [5, 6]
+
+
+def test_image_files_round_trip(tmp_path):
+    image = assemble(_source("sort"))
+    target = str(tmp_path / "sort")
+    image.write(target)
+
+    loaded = Image.load(f"{target}.text.bin", f"{target}.data.bin")
+    assert (loaded.entry, bytes(loaded.text), bytes(loaded.data)) == (
+        image.entry,
+        image.text,
+        image.data,
+    )
+    with open(f"{target}.text.log") as f:
+        assert f.read() == image.text_log
+    assert read_symbols(f"{target}.sym") == image.symbols
+    assert read_listing(f"{target}.text.log")[image.entry] == "lui a0, high(inp_addr)"
+
+
+@pytest.mark.parametrize(
+    ("budget", "limit"),
+    [(Budget(ticks=1_000), "ticks"), (Budget(instructions=77), "instructions")],
+)
+def test_budgets_stop_every_engine_at_the_same_instruction(budget, limit):
+    with open(os.path.join(ROOT, "algorithms", "sort_input.txt")) as f:
+        numbers = f.read()
+    results = [
+        execute(_source("sort"), numbers, "words", engine=engine, budget=budget)
+        for engine in ("microcode", "fast", "jit")
+    ]
+    for result in results:
+        assert (result.status.reason, result.status.detail) == (BUDGET, limit)
+        assert not result.halted and result.cpu.mpc == 0
+        assert (result.ticks, result.registers) == (results[0].ticks, results[0].registers)
+    if limit == "instructions":
+        assert results[0].status.instructions == 77
+    else:
+        assert 1_000 < results[0].ticks < 1_020
+
+
+@pytest.mark.parametrize("engine", ["microcode", "fast", "jit"])
+def test_runs_stop_at_a_pc_and_at_matching_output(engine):
+    image = assemble(_source("hello_world"))
+    loop = image.symbols["loop"][1]
+    cpu = load(image)
+    stops = [run_until(cpu, engine, stop_at=[loop]) for _ in range(3)]
+    assert [status.reason for status in stops] == [STOP_PC] * 3
+    assert cpu.pc == loop and cpu.output_device.render() == "he"
+
+    status = run_until(cpu, engine, output_pattern=r"o\s*w")
+    assert (status.reason, status.detail) == (OUTPUT, "o w")
+    assert cpu.output_device.render() == "hello w"
+    assert run_until(cpu, engine).halted
+    assert cpu.output_device.render() == "hello world!\0"
+
+
+def test_time_budgets_and_faults_end_runs_with_a_status():
+    status = execute(_source("sort"), "1\n", "words", budget=Budget(ticks=None, seconds=0)).status
+    assert (status.reason, status.detail, status.ticks) == (BUDGET, "seconds", 0)
+
+    result = execute(".text\n.org 0x100\nmain:\n    lui t0, 0x10\n    lw t1, 0(t0)\n    halt\n")
+    assert result.status.reason == FAULT and not result.halted
+    assert isinstance(result.status.fault, MemoryFault)
+    assert result.status.describe() == f"fault: {result.status.fault}"
+
+    jump = execute(".text\n.org 0x100\nmain:\n    addi t0, r0, -8\n    jalr r0, 0(t0)\n")
+    assert isinstance(jump.status.fault, IllegalInstruction)
+    with pytest.raises(ValueError, match="Invalid number"):  # not a fault of the program
+        execute(_source("sort"), "12\nabc\n", "words")
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from machine import translator
+from machine.assembly_cache import AssemblyCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _source(name):
+    with open(os.path.join(ROOT, "algorithms", f"{name}.asm")) as f:
+        return f.read()
+
+
+def test_hits_skip_assembly(tmp_path, monkeypatch):
+    cache = AssemblyCache(str(tmp_path))
+    image = cache.assemble(_source("sort"))
+
+    def fail(source):
+        raise AssertionError("assembled again")
+
+    monkeypatch.setattr(translator, "assemble", fail)
+    cached = AssemblyCache(str(tmp_path)).assemble(_source("sort"))
+    assert cached == image
+    with pytest.raises(AssertionError):
+        cache.assemble(_source("sort") + "\n# changed\n")
+
+
+def test_key_depends_on_the_toolchain(tmp_path):
+    cache = AssemblyCache(str(tmp_path))
+    key = cache.key("halt")
+    cache.version = "other ISA"
+    assert cache.key("halt") != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AssemblyCache(str(tmp_path))
+    sources = [_source(name) for name in ("hello_world", "sort", "cat")]
+    for i, source in enumerate(sources):
+        cache.assemble(source)
+        os.utime(cache.path(cache.key(source)), (i, i))  # make the order explicit
+    sizes = [os.path.getsize(cache.path(cache.key(source))) for source in sources]
+
+    assert cache.get(sources[0]) is not None  # now the most recently used
+    cache.max_bytes = sizes[0] + sizes[2]
+    cache.evict()
+
+    assert cache.get(sources[0]) is not None
+    assert cache.get(sources[1]) is None
+    assert cache.get(sources[2]) is not None
+
+
+def test_temporary_files_of_killed_writers_are_removed(tmp_path):
+    cache = AssemblyCache(str(tmp_path))
+    abandoned, in_progress = tmp_path / "abandoned.tmp", tmp_path / "in_progress.tmp"
+    abandoned.write_text("{")
+    in_progress.write_text("{")
+    os.utime(abandoned, (0, 0))
+
+    cache.assemble(_source("hello_world"))  # evicts after storing
+    assert not abandoned.exists()
+    assert in_progress.exists()
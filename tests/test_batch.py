@@ -0,0 +1,54 @@
+import json
+import os
+
+from run_batch import load_manifest, run_batch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPECTED = os.path.join(ROOT, "tests", "expected")
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def test_batch_runs_jobs_in_isolated_directories(tmp_path):
+    algorithms = os.path.join(ROOT, "algorithms")
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            {
+                "jobs": [
+                    {
+                        "asm": os.path.join(algorithms, "sort.asm"),
+                        "input": os.path.join(algorithms, "sort_input.txt"),
+                        "input_mode": "words",
+                    },
+                    {
+                        "asm": os.path.join(algorithms, "cat.asm"),
+                        "input": os.path.join(algorithms, "cat_input.txt"),
+                    },
+                    {"name": "hello_world", "asm": os.path.join(algorithms, "hello_world.asm")},
+                    {"name": "broken", "asm": "missing.asm"},
+                ]
+            }
+        )
+    )
+
+    out_dir = str(tmp_path / "batch")
+    results = run_batch(load_manifest(str(manifest)), out_dir, workers=2)
+
+    assert [r.name for r in results] == ["sort", "cat", "hello_world", "broken"]
+    assert [r.status for r in results] == ["halted", "halted", "halted", "error"]
+    for result in results[:3]:
+        for artifact, path in [
+            ("trace.log", os.path.join("log_output", "trace.log")),
+            ("final_snapshot.txt", "final_snapshot.txt"),
+            ("out.text.log", "out.text.log"),
+        ]:
+            expected = _read(os.path.join(EXPECTED, result.name, artifact))
+            assert _read(os.path.join(result.job_dir, path)) == expected
+        assert result.ticks > 0
+
+    with open(os.path.join(out_dir, "results.json")) as f:
+        assert [r["status"] for r in json.load(f)] == ["halted", "halted", "halted", "error"]
@@ -0,0 +1,43 @@
+import dataclasses
+
+import pytest
+
+from benchmarks import alu_throughput, assembler_throughput, macro_expansion
+from benchmarks.suite import compare, main, report, run_suite
+
+
+def test_suite_runs_programs_to_halt():
+    results = run_suite(["very_little", "euler_problem"], ("fast",), scale=0.01, repeat=1)
+    assert [r.name for r in results] == ["euler_problem/fast/off", "very_little/fast/off"]
+    assert all(r.halted and r.ticks > 0 and r.ticks_per_second > 0 for r in results)
+    assert results[0].size == 100
+
+
+def test_compare_flags_slower_runs_and_changed_ticks():
+    result = run_suite(["very_little"], ("fast",), repeat=1)[0]
+    baseline = report([result])
+    assert compare([result], baseline) == []
+
+    slower = dataclasses.replace(result, ticks_per_second=result.ticks_per_second * 0.8)
+    assert len(compare([slower], baseline)) == 1
+    assert compare([slower], baseline, threshold=0.25) == []
+    changed = dataclasses.replace(result, ticks=result.ticks + 1)
+    assert "ticks, was" in compare([changed], baseline)[0]
+
+
+@pytest.mark.parametrize(
+    ("main", "size"),
+    [
+        (alu_throughput.main, 10),
+        (assembler_throughput.main, 3),
+        (macro_expansion.main, 3),
+    ],
+)
+def test_component_benchmarks_run(main, size, capsys):
+    main(size, repeat=1)
+    assert "x)" in capsys.readouterr().out  # the speedup line
+
+
+def test_suite_runs_from_the_command_line(capsys):
+    assert main(["--programs=very_little", "--engines=fast", "--repeat=1"]) == 0
+    assert "very_little/fast/off" in capsys.readouterr().out
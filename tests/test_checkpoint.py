@@ -0,0 +1,140 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from machine.api import FAULT, Budget, load, run_engine, run_until
+from machine.checkpoint import (
+    CheckpointError,
+    capture,
+    read_checkpoint,
+    restore,
+    run_with_checkpoints,
+    write_checkpoint,
+)
+from machine.translator import assemble
+from run_machine import run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _state(cpu):
+    return {
+        "registers": (cpu.pc, cpu.ir, cpu.mpc, cpu.alu_out, dict(cpu.flags), list(cpu.registers)),
+        "data_mem": bytes(cpu.data_mem),
+        "input": cpu.input_device.position,
+        "output": (list(cpu.output_buffer), cpu.output_device.count),
+        "ticks": (cpu.ticks, cpu.running),
+        "perf": (dict(cpu.perf.executed), dict(cpu.perf.taken), cpu.address_map.device_loads),
+    }
+
+
+def _numbers(tmp_path, count=60):
+    rng = random.Random(count)
+    numbers = [rng.randint(1, 999) for _ in range(count)]
+    path = tmp_path / "numbers.txt"
+    path.write_text("".join(f"{number}\n" for number in numbers))
+    return str(path), numbers
+
+
+@pytest.mark.parametrize("engine", ["microcode", "fast", "jit"])
+def test_restored_run_ends_like_an_uninterrupted_one(build, engine):
+    make_cpu = build("algorithms/sort.asm", "algorithms/sort_input.txt", "words")
+    reference = make_cpu(trace_level="off")
+    run_engine(reference, "microcode")
+
+    cpu = make_cpu(trace_level="off")
+    run_engine(cpu, "microcode", 12_345)  # stops inside an instruction, mid-input
+    assert cpu.mpc != 0 and cpu.input_device.position > 0
+    checkpoint = capture(cpu)
+
+    resumed = make_cpu(trace_level="off")
+    restore(resumed, checkpoint)
+    assert _state(resumed) == _state(cpu)
+    run_engine(resumed, engine)
+    assert _state(resumed) == _state(reference)
+
+
+def test_periodic_checkpoints_resume_on_any_engine(build, tmp_path):
+    make_cpu = build("algorithms/hello_user_name.asm", "algorithms/hello_user_name_input.txt")
+    reference = make_cpu(trace_level="off")
+    run_engine(reference, "fast")
+
+    path = str(tmp_path / "checkpoint.bin")
+    cpu = make_cpu(trace_level="off")
+    run_with_checkpoints(cpu, "microcode", 100_000, 100, lambda cpu: write_checkpoint(cpu, path))
+    resumed = make_cpu(trace_level="off")
+    read_checkpoint(resumed, path)
+    assert resumed.mpc == 0 and 0 < resumed.ticks < reference.ticks
+    run_engine(resumed, "jit")
+    assert _state(resumed) == _state(reference) == _state(cpu)
+
+
+def test_a_jump_to_a_negative_address_can_be_saved(tmp_path):
+    image = assemble(".text\n.org 0x100\nmain:\n    addi t0, r0, -8\n    jalr r0, 0(t0)\n")
+    cpu = load(image, trace_level="off", log_dir=str(tmp_path))
+    assert run_until(cpu, "fast").reason == FAULT  # fetching from -8
+    assert cpu.pc < 0
+
+    restored = load(image, trace_level="off", log_dir=str(tmp_path))
+    restore(restored, capture(cpu))
+    assert _state(restored) == _state(cpu)
+
+
+def test_restoring_into_a_used_cpu_resets_the_pages_written_since(build):
+    make_cpu = build("algorithms/sort.asm", "algorithms/sort_input.txt", "words")
+    cpu = make_cpu(trace_level="off")
+    checkpoint = capture(cpu)  # nothing written yet: no pages saved
+    assert len(checkpoint) < 512
+    run_engine(cpu, "fast")
+    assert cpu.memory.dirty_pages() == [3]
+
+    restore(cpu, checkpoint)
+    assert cpu.memory.dirty_pages() == []
+    assert bytes(cpu.data_mem) == bytes(make_cpu(trace_level="off").data_mem)
+
+
+def test_checkpoints_of_other_programs_are_rejected(build):
+    checkpoint = capture(build("algorithms/hello_world.asm")(trace_level="off"))
+    cpu = build("algorithms/cat.asm")(trace_level="off")
+    with pytest.raises(CheckpointError, match="another program"):
+        restore(cpu, checkpoint)
+    with pytest.raises(CheckpointError, match="Not a RISCroll checkpoint"):
+        restore(cpu, b"garbage")
+    with pytest.raises(CheckpointError, match="Corrupt checkpoint"):
+        restore(build("algorithms/hello_world.asm")(trace_level="off"), checkpoint[:-8])
+
+
+def test_run_out_of_ticks_resumes_from_its_checkpoint(build, tmp_path, capsys):
+    input_path, numbers = _numbers(tmp_path)
+    build("algorithms/sort.asm")  # translates to tmp_path/out.*
+    paths = (str(tmp_path / "out.text.bin"), str(tmp_path / "out.data.bin"), input_path, "words")
+    options = {"engine": "fast", "trace_level": "off", "out_dir": str(tmp_path / "results")}
+
+    cpu, _ = run(*paths, **options)
+    assert cpu.running
+    out = capsys.readouterr().out
+    assert "Execution stopped: ticks budget exhausted" in out and "Checkpoint written to" in out
+    cpu, _ = run(*paths, resume=str(tmp_path / "results" / "checkpoint.bin"), **options)
+    assert not cpu.running
+    assert list(cpu.output_buffer) == sorted(numbers)
+    assert run(*paths, budget=Budget(ticks=None), **options)[0].ticks == cpu.ticks
+
+
+def test_a_budget_stop_is_reported_by_the_exit_status(build, tmp_path):
+    input_path, _ = _numbers(tmp_path)
+    build("algorithms/sort.asm")  # translates to tmp_path/out.*
+    command = [sys.executable, os.path.join(ROOT, "run_machine.py"), "out.text.bin"]
+    command += ["out.data.bin", input_path, "--input-mode=words", "--trace=off"]
+
+    stopped = subprocess.run([*command, "--max-ticks=500"], capture_output=True, text=True)
+    assert stopped.returncode == 2
+    assert "Execution stopped: ticks budget exhausted" in stopped.stdout
+    assert "==== MACHINE STOPPED ====" in stopped.stdout
+    assert "HALTED" not in stopped.stdout
+
+    halted = subprocess.run([*command, "--max-ticks=0"], capture_output=True, text=True)
+    assert halted.returncode == 0
+    assert "==== MACHINE HALTED ====" in halted.stdout
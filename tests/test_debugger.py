@@ -0,0 +1,158 @@
+import io
+
+import pytest
+
+from machine.api import run_engine
+from machine.debugger import Debugger
+from machine.fast_engine import FastEngine
+from run_machine import load_debug_info
+
+
+def _state(cpu):
+    return (
+        (cpu.pc, cpu.ir, cpu.mpc, cpu.alu_out, dict(cpu.flags), list(cpu.registers)),
+        bytes(cpu.data_mem),
+        (list(cpu.output_buffer), cpu.output_device.count),
+        (cpu.ticks, cpu.running),
+        (dict(cpu.perf.executed), dict(cpu.perf.taken)),
+    )
+
+
+@pytest.fixture
+def sort(build, tmp_path):
+    """(factory of sort.asm CPUs, listing, symbols)"""
+    make_cpu = build("algorithms/sort.asm", "algorithms/sort_input.txt", "words")
+    listing, symbols = load_debug_info(str(tmp_path / "out.text.bin"))
+    return lambda: make_cpu(trace_level="off"), listing, symbols
+
+
+def _boundaries(make_cpu):
+    """The state at every instruction boundary of a whole run, by tick."""
+    cpu = make_cpu()
+    engine = FastEngine(cpu)
+    states = {0: _state(cpu)}
+    while cpu.running:
+        engine.step()
+        states[cpu.ticks] = _state(cpu)
+    return states
+
+
+def test_run_without_breakpoints_ends_like_the_jit(sort):
+    make_cpu, listing, symbols = sort
+    reference = make_cpu()
+    run_engine(reference, "jit")
+    debugger = Debugger(make_cpu(), listing, symbols, checkpoint_every=1_000)
+    assert debugger.run().reason == "halted"
+    assert _state(debugger.cpu) == _state(reference)
+    assert len(debugger.recorder.recording.checkpoints) > 5
+
+
+def test_breakpoints_stop_before_every_execution_of_their_instruction(sort):
+    make_cpu, listing, symbols = sort
+    states = _boundaries(make_cpu)
+    do_swap = symbols["do_swap"][1]
+    hits = [tick for tick, state in states.items() if state[0][0] == do_swap and state[3][1]]
+    assert len(hits) > 2
+
+    debugger = Debugger(make_cpu(), listing, symbols)
+    assert debugger.add_breakpoint("do_swap") == do_swap
+    for tick in hits:
+        assert debugger.run().reason == "breakpoint"
+        assert _state(debugger.cpu) == states[tick]
+    debugger.remove_breakpoint("do_swap")
+    assert debugger.run().reason == "halted"
+    assert debugger.where().endswith("(halted)")
+
+
+def test_watchpoints_stop_right_after_a_store_to_the_word(sort):
+    make_cpu, listing, symbols = sort
+    debugger = Debugger(make_cpu(), listing, symbols)
+    debugger.add_watchpoint("0x304")
+    stop = debugger.run()
+    assert stop.reason == "watchpoint"
+    cpu = debugger.cpu
+    assert listing[cpu.pc - 4].startswith("sw") and cpu.alu_out == 0x304
+    assert stop.detail == f"0x304: 0 -> {cpu.memory.load_word(0x304)}"
+
+
+def test_watchpoints_compare_with_memory_after_going_back(sort):
+    make_cpu, listing, symbols = sort
+    debugger = Debugger(make_cpu(), listing, symbols)
+    debugger.add_watchpoint("0x304")
+    first = debugger.run()
+    debugger.step(50)
+    second = debugger.run()
+    assert second.detail != first.detail
+
+    debugger.reverse_step()  # back in front of the store from the undo log
+    assert debugger.run().detail == second.detail
+    debugger.travel(10)  # before the first store, from a checkpoint
+    assert debugger.run().detail == first.detail
+
+
+def test_reverse_steps_undo_instruction_steps(sort):
+    make_cpu, listing, symbols = sort
+    states = _boundaries(make_cpu)
+    debugger = Debugger(make_cpu(), listing, symbols)
+    seen = [_state(debugger.cpu)]
+    for _ in range(200):
+        debugger.step()
+        seen.append(_state(debugger.cpu))
+    assert seen[-1] == states[debugger.cpu.ticks]
+    assert debugger.undo  # sort.asm reads its input early: the log restarts after it
+    while debugger.undo:
+        debugger.reverse_step()
+        assert _state(debugger.cpu) == states[debugger.cpu.ticks]
+    assert debugger.reverse_step(10_000).reason == "start"
+    assert _state(debugger.cpu) == seen[0]
+
+
+def test_reverse_steps_without_an_undo_log_replay_from_checkpoints(sort):
+    make_cpu, listing, symbols = sort
+    states = _boundaries(make_cpu)
+    ticks = sorted(states)
+    debugger = Debugger(make_cpu(), listing, symbols, checkpoint_every=700)
+    debugger.run()
+    for i in range(1, 6):
+        debugger.reverse_step()
+        assert _state(debugger.cpu) == states[ticks[-1 - i]]
+
+    debugger.reverse_micro_step(3)  # inside the previous instruction
+    assert debugger.cpu.mpc != 0 and debugger.cpu.ticks == ticks[-6] - 3
+    debugger.reverse_step()
+    assert _state(debugger.cpu) == states[ticks[-7]]
+    debugger.travel(1_234)
+    assert debugger.run().reason == "halted"
+    assert _state(debugger.cpu) == states[ticks[-1]]
+
+
+def test_micro_steps_match_the_microcode_engine(sort):
+    make_cpu, listing, symbols = sort
+    reference = make_cpu()
+    run_engine(reference, "microcode", 1_000)
+    debugger = Debugger(make_cpu(), listing, symbols)
+    debugger.step(100)
+    debugger.micro_step(reference.ticks - debugger.cpu.ticks)
+    assert _state(debugger.cpu) == _state(reference)
+
+
+def test_commands(sort):
+    make_cpu, listing, symbols = sort
+    debugger = Debugger(make_cpu(), listing, symbols)
+    commands = io.StringIO(
+        "b do_swap\ni\nc\nrs\ns 2\nx 0x300 2\nd do_swap\nbogus 1\nb nowhere\nc\nq\nc\n"
+    )
+    out = io.StringIO()
+    debugger.repl(commands, out)
+    lines = out.getvalue().replace("(rdb) ", "").splitlines()
+    assert lines[0] == "tick 0  pc 0x0100  lui a0, high(inp_addr)"
+    assert lines[1] == f"Breakpoint at {symbols['do_swap'][1]:#06x} do_swap"
+    assert lines[2] == f"breakpoint {symbols['do_swap'][1]:#06x} do_swap"
+    assert lines[3].startswith("Breakpoint at tick") and lines[3].endswith("do_swap  sw s5, 0(t4)")
+    assert lines[4].endswith("bgt s4, s5, do_swap")
+    assert lines[5] == lines[3]  # steps stop at breakpoints too
+    assert lines[6] == "00000300: 00000017"
+    assert "break LOC" in out.getvalue()  # unknown commands print the help
+    assert "Error: Unknown label or address `nowhere`" in out.getvalue()
+    assert lines[-1].endswith("(halted)")
+    assert not debugger.cpu.running
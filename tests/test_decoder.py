@@ -0,0 +1,35 @@
+from machine.decoder import DecodeCache
+from machine.microcode import MicrocodeROM
+
+# addi x1, x0, 5 ; halt
+ADDI = 0x00500093
+HALT = 0x0000007F
+
+
+def _words(*words):
+    return b"".join(w.to_bytes(4, "little") for w in words)
+
+
+def test_fetch_reads_the_image_at_its_base():
+    image = bytearray(_words(ADDI, HALT))
+    cache = DecodeCache(memoryview(image), MicrocodeROM(), base=0x40)
+
+    assert cache.fetch(0x40).word == ADDI
+    assert cache.fetch(0x44).word == HALT
+    # outside of the image memory reads as zero
+    assert cache.fetch(0x3C).word == 0
+    assert cache.fetch(0x48).word == 0
+
+
+def test_fetch_handles_unaligned_and_partial_words():
+    image = _words(ADDI) + b"\x7f\x00"
+    cache = DecodeCache(image, MicrocodeROM(), base=0)
+
+    assert cache.fetch(2).word == int.from_bytes(image[2:6], "little")
+    assert cache.fetch(4).word == 0x7F
+
+
+def test_loaded_text_is_not_copied(build):
+    cpu = build("algorithms/hello_world.asm")()
+    assert isinstance(cpu.instr_mem, memoryview)
+    assert cpu.decode_cache.base == cpu.pc
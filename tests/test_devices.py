@@ -0,0 +1,77 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from machine.devices import InputDevice, OutputDevice, open_input
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize(
+    ("data", "expected"),
+    [(b"ab", [97, 98, 0]), (b"ab\x00", [97, 98, 0]), (b"", [0])],
+)
+def test_bytes_input_ends_with_a_single_zero(tmp_path, data, expected):
+    path = tmp_path / "input.bin"
+    path.write_bytes(data)
+    assert list(open_input(str(path))) == expected
+
+
+def test_words_input_skips_blank_lines(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("3\n\n-7\r\n 4294967295 \n")
+    device = InputDevice(open_input(str(path), as_words=True))
+    assert [device.load(1, 4) for _ in range(4)] == [3, -7, -1, 0]
+    assert device.consumed == 3
+
+
+def test_input_is_read_lazily(tmp_path):
+    path = tmp_path / "input.bin"
+    path.write_bytes(b"x" * (1 << 20))
+    device = InputDevice(open_input(str(path)))
+    device.load(1, 1)
+    device.push_back([1, 2])
+    assert [device.load(1, 1) for _ in range(3)] == [1, 2, ord("x")]
+    assert device.consumed == 4
+
+
+def test_cat_streams_stdin(build, tmp_path):
+    build("algorithms/cat.asm")  # translates to tmp_path/out.*.bin
+    (tmp_path / "out").mkdir()  # for the snapshot
+    data = bytes(range(1, 128)) * 20
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "run_machine.py"), "out.text.bin", "out.data.bin", "-"]
+        + ["--engine=jit", "--trace=off"],
+        input=data,
+        capture_output=True,
+        check=True,
+    )
+    assert data.decode() in result.stdout.decode()
+
+
+def test_output_streams_and_keeps_a_bounded_tail():
+    stream = io.StringIO()
+    device = OutputDevice(stream, tail_size=3)
+    for value in (1, 22, 333, 4444):
+        device.store(2, 4, value)
+    assert stream.getvalue() == "1\n22\n333\n4444\n"
+    assert device.render() == "22\n333\n4444"
+    assert device.count == 4
+
+    for char in b"Hi!":
+        device.store(2, 1, char)
+    assert stream.getvalue().endswith("4444\nHi!")
+    assert list(device.tail) == ["H", "i", "!"]
+    assert device.render() == "Hi!"
+
+
+def test_output_renders_like_the_old_buffer():
+    device = OutputDevice()
+    for value in (7, 0x141, -1):
+        device.store(2, 1 if value == 0x141 else 4, value)
+    assert list(device.tail) == [7, "A", -1]
+    assert device.render() == "7A-1"
+    assert OutputDevice().render() == ""
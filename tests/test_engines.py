@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from machine.fast_engine import FastEngine
+from machine.jit import JitEngine
+
+MAX_TICKS = 100_000
+
+PROGRAMS = [
+    ("algorithms/hello_world.asm", None, "bytes"),
+    ("algorithms/sort.asm", "algorithms/sort_input.txt", "words"),
+    ("algorithms/hello_user_name.asm", "algorithms/hello_user_name_input.txt", "bytes"),
+    ("algorithms/cat.asm", "algorithms/cat_input.txt", "bytes"),
+    ("algorithms/euler_problem.asm", "algorithms/euler_problem_input.txt", "words"),
+    ("algorithms/macro_showcase.asm", None, "bytes"),
+    ("non_algos/test.asm", None, "bytes"),
+    ("non_algos/test_branching.asm", None, "bytes"),
+]
+
+
+def _state(cpu):
+    return {
+        "pc": cpu.pc,
+        "ir": cpu.ir,
+        "mpc": cpu.mpc,
+        "alu_out": cpu.alu_out,
+        "flags": dict(cpu.flags),
+        "registers": list(cpu.registers),
+        "data_mem": bytes(cpu.data_mem),
+        "output": list(cpu.output_buffer),
+        "ticks": cpu.ticks,
+        "running": cpu.running,
+        "executed": dict(cpu.perf.executed),
+        "taken": dict(cpu.perf.taken),
+        "mmio": (cpu.address_map.device_loads, cpu.address_map.device_stores),
+    }
+
+
+@pytest.mark.parametrize("engine", [FastEngine, JitEngine], ids=["fast", "jit"])
+@pytest.mark.parametrize("program", PROGRAMS, ids=lambda p: os.path.basename(p[0]))
+def test_engine_matches_microcode(build, program, engine):
+    make_cpu = build(*program)
+
+    reference = make_cpu()
+    while reference.running and reference.ticks <= MAX_TICKS:
+        reference.step()
+    reference.logger.finish()
+
+    cpu = make_cpu()
+    engine(cpu).run(MAX_TICKS)
+    cpu.logger.finish()
+
+    assert _state(cpu) == _state(reference)
+
+
+@pytest.mark.parametrize("max_ticks", [0, 37, 1_000, 5_555])
+def test_jit_stops_on_budget_like_fast_engine(build, max_ticks):
+    make_cpu = build("algorithms/sort.asm", "algorithms/sort_input.txt", "words")
+
+    fast = make_cpu()
+    FastEngine(fast).run(max_ticks)
+    jit = make_cpu()
+    JitEngine(jit).run(max_ticks)
+
+    assert fast.running and jit.running
+    assert _state(jit) == _state(fast)
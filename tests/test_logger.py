@@ -0,0 +1,64 @@
+import os
+
+from machine import binary_trace
+
+SORT = ("algorithms/sort.asm", "algorithms/sort_input.txt", "words")
+
+
+def _run(cpu):
+    while cpu.running:
+        cpu.step()
+    cpu.logger.finish()
+
+
+def _trace():
+    with open(os.path.join("log_output", "trace.log")) as f:
+        return f.read().splitlines()
+
+
+def test_ring_buffer_keeps_the_last_lines(build):
+    make_cpu = build(*SORT)
+    _run(make_cpu())
+    full = _trace()
+
+    _run(make_cpu(trace_ring=50))
+    assert _trace() == full[-50:]
+
+
+def test_small_flush_chunks_write_the_same_trace(build):
+    make_cpu = build(*SORT)
+    _run(make_cpu())
+    full = _trace()
+
+    cpu = make_cpu()
+    cpu.logger.flush_every = 7
+    _run(cpu)
+    assert _trace() == full
+
+
+def test_microstep_level_logs_every_tick(build):
+    cpu = build(*SORT)(trace_level="microstep")
+    _run(cpu)
+    assert len(_trace()) == cpu.ticks
+
+
+def test_off_level_writes_nothing(build):
+    cpu = build(*SORT)(trace_level="off")
+    _run(cpu)
+    assert not os.path.exists(os.path.join("log_output", "trace.log"))
+    assert cpu.output_buffer
+
+
+def test_binary_trace_decodes_to_the_text_trace(build):
+    make_cpu = build(*SORT)
+    _run(make_cpu())
+    with open(os.path.join("log_output", "trace.log")) as f:
+        text = f.read()
+    os.remove(os.path.join("log_output", "trace.log"))
+
+    cpu = make_cpu(trace_format="binary")
+    cpu.logger.flush_every = 7
+    _run(cpu)
+    assert not os.path.exists(os.path.join("log_output", "trace.log"))
+    with open(os.path.join("log_output", "trace.bin"), "rb") as f:
+        assert binary_trace.decode(f.read()) == text
@@ -0,0 +1,170 @@
+import pytest
+
+from machine.devices import Device, InputDevice, OutputDevice
+from machine.fast_engine import FastEngine
+from machine.jit import JitEngine
+from machine.memory import AddressMap, Memory, MemoryFault
+
+# stores to the last word of data memory, then one word past it
+OUT_OF_RANGE = """
+.text
+.org 0x100
+    addi t0, r0, 256
+    mul t0, t0, t0
+    addi t1, r0, 7
+    sw t1, -4(t0)
+    sw t1, 0(t0)
+    halt
+"""
+
+
+class Counter(Device):
+    def __init__(self):
+        self.count = 0
+
+    def load(self, address, width):
+        self.count += 1
+        return self.count
+
+
+def test_aligned_and_unaligned_words_agree():
+    memory = Memory(64, bytes(range(16)))
+    assert memory.load_word(4) == 0x07060504
+    assert memory.load_word(2) == 0x05040302
+
+    memory.store_word(8, -2)
+    assert memory.data[8:12] == b"\xfe\xff\xff\xff"
+    memory.store_word(13, 0x11223344)
+    assert memory.load_word(13) == 0x11223344
+    assert memory.load_word(12) == 0x2233440C
+    assert memory.load_byte(11) == 0xFF
+
+
+@pytest.mark.parametrize("address", [-4, -1, 61, 64, 1 << 20])
+def test_out_of_range_words_fault(address):
+    memory = Memory(64)
+    with pytest.raises(MemoryFault):
+        memory.load_word(address)
+    with pytest.raises(MemoryFault):
+        memory.store_word(address, 1)
+    assert len(memory.data) == 64
+
+
+def test_image_larger_than_memory_is_rejected():
+    with pytest.raises(ValueError, match="overflow"):
+        Memory(8, bytes(12))
+
+
+def test_stores_mark_their_pages_dirty():
+    memory = Memory(1024, bytes(range(1, 9)))
+    assert memory.dirty_pages() == []
+    memory.store_byte(0x3FF, 1)
+    memory.store_word(0x1FE, -1)  # unaligned, across two pages
+    memory.store_word(0x100, memory.load_word(0x100))  # same value, still written
+    assert memory.dirty_pages() == [1, 2, 3]
+
+    other = Memory(1024, bytes(range(1, 9)))
+    other.store_byte(0, 1)  # the value the image already has there
+    assert memory.diff_pages(other) == [1, 2, 3]
+    assert memory.initial_page(0)[:9] == bytes([1, 2, 3, 4, 5, 6, 7, 8, 0])
+
+
+def test_image_is_not_copied():
+    image = bytes(range(1, 9))
+    memory = Memory(1024, image)
+    assert memory.image is image
+    memory.store_word(0, 0)
+    assert memory.initial_page(0)[:4] == bytes([1, 2, 3, 4])
+
+
+@pytest.mark.parametrize("engine", [None, FastEngine, JitEngine], ids=["microcode", "fast", "jit"])
+def test_engines_track_the_same_dirty_pages(build, engine):
+    cpu = build("algorithms/sort.asm", "algorithms/sort_input.txt", "words")(trace_level="off")
+    if engine is None:
+        while cpu.running:
+            cpu.step()
+    else:
+        engine(cpu).run(100_000)
+    assert cpu.memory.dirty_pages() == [3]  # the array at 0x300
+
+
+@pytest.mark.parametrize("engine", [None, FastEngine, JitEngine], ids=["microcode", "fast", "jit"])
+def test_engines_fault_on_the_same_store(build, tmp_path, engine):
+    source = tmp_path / "out_of_range.asm"
+    source.write_text(OUT_OF_RANGE)
+    cpu = build(str(source))()
+
+    with pytest.raises(MemoryFault) as fault:
+        if engine is None:
+            while cpu.running:
+                cpu.step()
+        else:
+            engine(cpu).run(1_000)
+    cpu.logger.finish()
+
+    assert fault.value.address == 0x10000
+    assert cpu.memory.load_word(0xFFFC) == 7
+    assert cpu.pc == 0x114  # just past the faulting sw at 0x110
+
+
+def test_address_map_routes_by_range_and_direction():
+    address_map = AddressMap(Memory(1024))
+    source, sink = InputDevice([-5, 300]), OutputDevice()
+    address_map.map_device(1, 2, source, stores=False)
+    address_map.map_device(2, 3, sink, loads=False)
+    address_map.map_device(0x200, 0x300, Counter())
+
+    assert address_map.load_word(1) == -5
+    assert address_map.load_byte(1) == 300  # device values are not truncated
+    assert address_map.load_word(1) == 0  # exhausted
+    address_map.store_byte(2, 0x141)
+    address_map.store_word(2, -1)
+    assert list(sink.tail) == ["A", -1]
+
+    # the other direction and the rest of the mixed page are RAM
+    address_map.store_word(0, 0x7F80FF01)
+    assert address_map.load_byte(2) == -128
+    assert address_map.load_word(4) == 0
+
+    assert [address_map.load_word(a) for a in (0x200, 0x2FC)] == [1, 2]
+    with pytest.raises(MemoryFault):
+        address_map.store_word(0x200, 1)  # Counter does not take stores
+
+
+def test_overlapping_devices_are_rejected():
+    address_map = AddressMap(Memory(1024))
+    address_map.map_device(0x10, 0x20, Device())
+    address_map.map_device(0x18, 0x20, Device(), loads=False, stores=False)
+    with pytest.raises(ValueError, match="overlaps"):
+        address_map.map_device(0x18, 0x120, Device())
+
+
+def test_data_memory_size_is_configurable(build, tmp_path):
+    source = tmp_path / "out_of_range.asm"
+    source.write_text(OUT_OF_RANGE)
+    cpu = build(str(source))(data_size=128 * 1024)
+    while cpu.running:
+        cpu.step()
+    cpu.logger.finish()
+
+    assert cpu.memory.load_word(0x10000) == 7
+
+
+@pytest.mark.parametrize("engine", [None, FastEngine, JitEngine], ids=["microcode", "fast", "jit"])
+def test_engines_route_aligned_accesses_to_devices(build, tmp_path, engine):
+    source = tmp_path / "out_of_range.asm"
+    source.write_text(OUT_OF_RANGE)
+    cpu = build(str(source))(data_size=128 * 1024)  # the device sits inside RAM
+    sink = OutputDevice()
+    cpu.address_map.map_device(0x10000, 0x10004, sink, loads=False)
+
+    if engine is None:
+        while cpu.running:
+            cpu.step()
+    else:
+        engine(cpu).run(1_000)
+    cpu.logger.finish()
+
+    assert list(sink.tail) == [7]
+    assert cpu.memory.load_word(0x10000) == 0
+    assert not cpu.running
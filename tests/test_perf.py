@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from machine.api import run_engine
+from machine.perf import instruction_class
+from run_machine import run
+
+
+@pytest.mark.parametrize("engine", ["microcode", "fast", "jit"])
+def test_report_accounts_for_every_tick(build, engine):
+    cpu = build("algorithms/sort.asm", "algorithms/sort_input.txt", "words")(trace_level="off")
+    run_engine(cpu, engine)
+    report = cpu.perf.report(cpu)
+
+    assert report["halted"]
+    assert report["ticks"] == cpu.ticks
+    assert sum(c["ticks"] for c in report["classes"].values()) == cpu.ticks
+    assert sum(report["mnemonics"].values()) == report["instructions"] == cpu.perf.instructions
+    assert report["classes"]["branch"]["instructions"] == sum(
+        b["taken"] + b["not_taken"] for b in report["branches"].values()
+    )
+    memory = report["memory"]
+    assert memory["loads"] == report["mnemonics"]["lw"]
+    assert memory["mmio_loads"] == 20  # the numbers up to the terminating 0
+    assert memory["mmio_stores"] == cpu.output_device.count
+
+
+def test_loop_branches_are_counted_per_pc(build):
+    cpu = build("non_algos/test_branching.asm")(trace_level="off")
+    run_engine(cpu, "jit")
+    assert cpu.perf.taken
+    for pc, taken in cpu.perf.taken.items():
+        assert 0 < taken <= cpu.perf.executed[pc]
+        name, _ = cpu.perf.instruction_at(cpu, pc)
+        assert instruction_class(name) == "branch"
+
+
+def test_run_writes_report_at_halt(build, tmp_path):
+    build("algorithms/hello_world.asm")  # translates to tmp_path/out.*
+    cpu, _ = run(
+        str(tmp_path / "out.text.bin"),
+        str(tmp_path / "out.data.bin"),
+        engine="jit",
+        trace_level="off",
+        out_dir=str(tmp_path / "results"),
+    )
+    with open(tmp_path / "results" / "perf.json") as f:
+        report = json.load(f)
+    assert report == json.loads(json.dumps(cpu.perf.report(cpu)))
+    assert report["memory"]["mmio_stores"] == len("hello world!\0")
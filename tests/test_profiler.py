@@ -0,0 +1,62 @@
+import pytest
+
+from machine.api import run_engine
+from machine.image import read_listing, read_symbols
+from machine.profiler import Profiler
+from run_machine import run
+
+
+def _profiler(cpu, tmp_path):
+    return Profiler(
+        cpu, read_listing(str(tmp_path / "out.text.log")), read_symbols(str(tmp_path / "out.sym"))
+    )
+
+
+@pytest.mark.parametrize("engine", ["microcode", "fast", "jit"])
+def test_stacks_follow_calls_and_account_for_every_tick(build, tmp_path, engine):
+    make_cpu = build("algorithms/hello_user_name.asm", "algorithms/hello_user_name_input.txt")
+    cpu = make_cpu(trace_level="off")
+    profiler = _profiler(cpu, tmp_path)
+    profiler.run(engine, 100_000)
+
+    reference = make_cpu(trace_level="off")
+    run_engine(reference, "microcode")
+    assert not cpu.running
+    assert cpu.ticks == reference.ticks
+    assert sum(profiler.stacks.values()) == cpu.ticks
+    # the entry has no label; print_cstr is called twice and always returns
+    assert set(profiler.stacks) == {"0x0100", "0x0100;print_cstr"}
+    assert len(profiler.frames) == 1
+
+
+def test_hot_spots_are_joined_with_the_listing(build, tmp_path):
+    cpu = build("algorithms/hello_user_name.asm", "algorithms/hello_user_name_input.txt")(
+        trace_level="off"
+    )
+    profiler = _profiler(cpu, tmp_path)
+    profiler.run("fast", 100_000)
+
+    spots = profiler.hot_spots()
+    assert sum(spot.ticks for spot in spots) == cpu.ticks
+    assert [spot.ticks for spot in spots] == sorted((spot.ticks for spot in spots), reverse=True)
+    hottest = spots[0]
+    assert (hottest.location, hottest.source) == ("print_loop+0x4", "beq t1, r0, print_ret")
+    assert profiler.location(0x100) == "0x0100"
+
+
+def test_run_prints_table_and_writes_folded_stacks(build, tmp_path, capsys):
+    build("algorithms/hello_user_name.asm")  # translates to tmp_path/out.*
+    cpu, _ = run(
+        str(tmp_path / "out.text.bin"),
+        str(tmp_path / "out.data.bin"),
+        engine="jit",
+        trace_level="off",
+        out_dir=str(tmp_path / "results"),
+        profile=5,
+    )
+    table = capsys.readouterr().out.split("==== PROFILE ====\n", 1)[1]
+    assert len(table.splitlines()) == 1 + 5
+    with open(tmp_path / "results" / "profile.folded") as f:
+        folded = [line.rsplit(" ", 1) for line in f.read().splitlines()]
+    assert [stack for stack, _ in folded] == ["0x0100", "0x0100;print_cstr"]
+    assert sum(int(ticks) for _, ticks in folded) == cpu.ticks
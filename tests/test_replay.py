@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from machine.api import run_engine
+from machine.checkpoint import run_with_checkpoints
+from machine.replay import Recorder, Recording, ReplayError, goto_tick, replay
+from run_machine import load_cpu, run
+
+
+def _state(cpu):
+    return (
+        (cpu.pc, cpu.ir, cpu.mpc, cpu.alu_out, dict(cpu.flags), list(cpu.registers)),
+        bytes(cpu.data_mem),
+        (list(cpu.output_buffer), cpu.output_device.count),
+        (cpu.ticks, cpu.running),
+        (dict(cpu.perf.executed), dict(cpu.perf.taken)),
+    )
+
+
+def _record(build, tmp_path, engine, every=2_000):
+    """Records sort.asm on `engine`: (recording, recorded CPU, factory of CPUs without input)."""
+    make_cpu = build("algorithms/sort.asm", "algorithms/sort_input.txt", "words")
+    cpu = make_cpu(trace_level="off")
+    recorder = Recorder(cpu)
+    run_with_checkpoints(cpu, engine, 10**9, every, recorder.checkpoint)
+    assert not cpu.running
+    target = str(tmp_path / "out")
+    return (
+        recorder.recording,
+        cpu,
+        lambda: load_cpu(f"{target}.text.bin", f"{target}.data.bin", None, trace_level="off"),
+    )
+
+
+def test_recordings_are_the_same_on_every_engine(build, tmp_path):
+    recordings = [_record(build, tmp_path, engine)[0] for engine in ("microcode", "fast", "jit")]
+    assert recordings[0].inputs
+    assert recordings[0].encode() == recordings[1].encode() == recordings[2].encode()
+
+
+@pytest.mark.parametrize("engine", ["microcode", "fast", "jit"])
+def test_replay_without_input_ends_like_the_recorded_run(build, tmp_path, engine):
+    recording, recorded, make_cpu = _record(build, tmp_path, "jit")
+    path = str(tmp_path / "run.replay")
+    recording.write(path)
+
+    cpu = make_cpu()
+    replay(cpu, Recording.read(path))
+    run_engine(cpu, engine)
+    assert _state(cpu) == _state(recorded)
+
+
+@pytest.mark.parametrize("tick", [0, 1_999, 2_003, 7_777, 10**9])
+def test_goto_tick_reaches_the_state_of_a_run_to_it(build, tmp_path, tick):
+    recording, recorded, make_cpu = _record(build, tmp_path, "fast")
+    assert len(recording.checkpoints) > 2
+
+    reference = make_cpu()
+    replay(reference, recording)
+    while reference.running and reference.ticks < tick:
+        reference.step()
+
+    cpu = make_cpu()
+    start = goto_tick(cpu, recording, tick)
+    assert start <= cpu.ticks
+    assert _state(cpu) == _state(reference)
+    if tick > recorded.ticks:
+        assert _state(cpu) == _state(recorded)
+
+
+def test_a_diverging_replay_is_reported(build, tmp_path):
+    recording, _, make_cpu = _record(build, tmp_path, "fast")
+    tick, value = recording.inputs[3]
+    recording.inputs[3] = (tick + 1, value)
+    cpu = make_cpu()
+    replay(cpu, recording)
+    with pytest.raises(ReplayError, match=f"Replay diverged: input read at tick {tick}"):
+        run_engine(cpu, "fast")
+
+
+def test_recordings_of_other_programs_are_rejected(build, tmp_path):
+    recording, _, _ = _record(build, tmp_path, "fast")
+    with pytest.raises(ReplayError, match="another program"):
+        replay(build("algorithms/cat.asm")(trace_level="off"), recording)
+    with pytest.raises(ReplayError, match="Not a RISCroll recording"):
+        Recording.decode(b"garbage")
+    with pytest.raises(ReplayError, match="Corrupt recording"):
+        Recording.decode(recording.encode()[:-8])
+
+
+def test_record_then_replay_from_the_command_line(build, tmp_path, capsys):
+    rng = random.Random(30)
+    numbers = [rng.randint(1, 999) for _ in range(30)]
+    input_path = tmp_path / "numbers.txt"
+    input_path.write_text("".join(f"{number}\n" for number in numbers))
+    build("algorithms/sort.asm")
+    paths = (str(tmp_path / "out.text.bin"), str(tmp_path / "out.data.bin"))
+    path = str(tmp_path / "sort.replay")
+    options = {"trace_level": "off", "out_dir": str(tmp_path / "results")}
+
+    recorded, _ = run(*paths, str(input_path), "words", engine="jit", record=path, **options)
+    assert "Recording written to" in capsys.readouterr().out
+    cpu, _ = run(*paths, replay_path=path, goto=20_000, **options)
+    assert "Replayed to tick 20000" in capsys.readouterr().out
+    assert list(cpu.output_buffer) == sorted(numbers)
+    assert _state(cpu) == _state(recorded)
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize(
+    ("option", "error"),
+    [
+        ("--trace-ring=abc", "Error: --trace-ring must be a positive number"),
+        ("--trace-ring=0", "Error: --trace-ring must be a positive number"),
+        ("--output-tail=-3", "Error: --output-tail must be a non-negative number"),
+        ("--goto-tick=later", "Error: --goto-tick must be a non-negative tick number"),
+        ("--max-ticks=abc", "Error: --max-ticks must be a non-negative number"),
+        ("--max-instructions=-1", "Error: --max-instructions must be a non-negative number"),
+        ("--timeout=nan", "Error: --timeout must be a non-negative number"),
+    ],
+)
+def test_bad_option_values_are_reported(option, error):
+    command = [sys.executable, os.path.join(ROOT, "run_machine.py"), "a.text.bin", "a.data.bin"]
+    finished = subprocess.run([*command, option], capture_output=True, text=True)
+    assert finished.returncode == 1
+    assert finished.stdout.startswith(error)
+    assert "Traceback" not in finished.stderr
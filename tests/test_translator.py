@@ -0,0 +1,103 @@
+import re
+
+import pytest
+
+from machine.translator import Assembler, assemble, encode, expand_macros
+
+
+def _word(image, address):
+    offset = address - image.entry
+    return int.from_bytes(image.text[offset : offset + 4], "little")
+
+
+def test_forward_references_are_patched():
+    source = """
+.data
+ptr: .word target
+.text
+.org 0x100
+    beq zero, zero, target
+    lui t0, high(target)
+    addi t0, t0, low(target)
+    jal ra, target
+target:
+    halt
+"""
+    image = assemble(source)
+    labels = {"target": 0x110}
+
+    assert _word(image, 0x100) == encode(("beq", ["zero,", "zero,", "target"]), labels, 0x100)
+    assert _word(image, 0x104) == encode(("lui", ["t0,", "high(target)"]), labels, 0x104)
+    assert _word(image, 0x108) == encode(("addi", ["t0,", "t0,", "0x110"]), labels, 0x108)
+    assert _word(image, 0x10C) == encode(("jal", ["ra,", "target"]), labels, 0x10C)
+    assert image.data == (0x110).to_bytes(4, "little")
+    assert image.data_log == "00000000(int 0) - 00000110 - " + f"{0x110:032b} - .word target"
+
+
+def test_forward_and_backward_references_encode_alike():
+    backward = assemble(".text\n.org 0x100\nloop: addi t0, t0, 1\nbne t0, zero, loop\nhalt")
+    assembler = Assembler(3)
+    for line in [".text", ".org 0x100", "loop: addi t0, t0, 1", "bne t0, zero, loop", "halt"]:
+        assembler.feed(line)
+    assert assembler.fixups == {}
+    assert assembler.finish() == backward
+
+
+@pytest.mark.parametrize(
+    "line", ["beq zero, zero, nowhere", "addi t0, t0, low(nowhere)", "lui t0, high(nowhere)"]
+)
+def test_undefined_label_is_an_error(line):
+    with pytest.raises(ValueError, match=re.escape(f"Undefined label `nowhere` in: {line}")):
+        assemble(f".text\n{line}\nhalt")
+
+
+def test_undefined_label_in_data_is_an_error():
+    with pytest.raises(ValueError, match="Undefined label `nowhere`"):
+        assemble(".data\n.word nowhere\n.text\nhalt")
+
+
+def test_duplicate_label_is_an_error():
+    with pytest.raises(ValueError, match="Duplicate label `loop`"):
+        assemble(".text\nloop: halt\nloop: halt")
+
+
+def test_nested_macros_with_local_labels():
+    source = """
+.macro count_down reg
+loop_\\@:
+    addi \\reg, \\reg, -1
+    bne \\reg, zero, loop_\\@
+.endmacro
+.macro twice reg, n
+    addi \\reg, zero, \\n
+    count_down \\reg
+    count_down \\reg  # labels differ per expansion
+.endmacro
+.text
+    twice t0, 3
+    halt
+"""
+    assert expand_macros(source.splitlines())[-8:] == [
+        "    addi t0, zero, 3",
+        "loop_2:",
+        "    addi t0, t0, -1",
+        "    bne t0, zero, loop_2",
+        "loop_3:",
+        "    addi t0, t0, -1",
+        "    bne t0, zero, loop_3",
+        "    halt",
+    ]
+    assemble(source)
+
+
+def test_recursive_macro_hits_the_depth_limit():
+    source = [".macro forever", "    forever", ".endmacro", "forever"]
+    with pytest.raises(ValueError, match="`forever` nested more than 8 levels"):
+        expand_macros(source, max_depth=8)
+
+
+def test_macro_argument_errors():
+    with pytest.raises(ValueError, match="Unknown macro argument `\\\\x`"):
+        expand_macros([".macro m a", "    addi \\x, zero, 1", ".endmacro"])
+    with pytest.raises(ValueError, match="Macro `m` expects 1 args, got 2"):
+        expand_macros([".macro m a", "    addi \\a, zero, 1", ".endmacro", "m t0, t1"])